@@ -0,0 +1,287 @@
+from tqdm import tqdm
+import network
+import utils
+import os
+import sys
+import json
+import time
+import argparse
+import numpy as np
+
+from torch.utils import data
+from datasets import VOCSegmentation, Cityscapes
+from torchvision import transforms as T
+
+import torch
+import torch.nn as nn
+
+from PIL import Image
+
+IMAGE_EXTS = ('.png', '.jpeg', '.jpg', '.JPEG')
+
+# mask sizes (h, w) the loaders read for each dataset
+DEFAULT_SIZES = {
+    'taco': ['32x96', '28x28'],
+    'oats': ['32x96', '28x28'],
+    'nuscenes': ['32x96', '28x28'],
+    'road': ['32x96'],
+}
+
+
+def get_argparser():
+    parser = argparse.ArgumentParser()
+
+    # Datset Options
+    parser.add_argument("--data", type=str, default='oats', choices=list(DEFAULT_SIZES.keys()),
+                        help="layout of --input")
+    parser.add_argument("--input", type=str, default='/media/hankung/ssd/oats/oats_data/images',
+                        help="taco: data_collection, oats: images folder, nuscenes: folder holding CAM_FRONT, road: rgb-images")
+    parser.add_argument("--output", "--save_val_results_to", dest='output', type=str, default=None,
+                        help="root of the mask folders (default: same as --input)")
+    parser.add_argument("--sizes", type=str, nargs='+', default=None,
+                        help="mask sizes HxW written in the same pass (default: what the loaders of --data read)")
+    parser.add_argument("--label_dir", type=str, default='../datasets',
+                        help="nuscenes: folder of nuscenes_*_labels.txt, only labelled windows are segmented")
+    parser.add_argument("--dataset", type=str, default='cityscapes',
+                        choices=['voc', 'cityscapes'], help='Name of training set')
+
+    # Deeplab Options
+    available_models = sorted(name for name in network.modeling.__dict__ if name.islower() and \
+                              not (name.startswith("__") or name.startswith('_')) and callable(
+                              network.modeling.__dict__[name])
+                              )
+
+    parser.add_argument("--model", type=str, default='deeplabv3plus_resnet101',
+                        choices=available_models, help='model name')
+    parser.add_argument("--separable_conv", action='store_true', default=False,
+                        help="apply separable conv to decoder and aspp")
+    parser.add_argument("--output_stride", type=int, default=16, choices=[8, 16])
+
+    # Predict Options
+    parser.add_argument("--batch_size", type=int, default=4)
+    parser.add_argument("--num_workers", type=int, default=4, help='decoding workers')
+    parser.add_argument("--device", type=str, default=None, choices=['cpu', 'cuda'],
+                        help='default: cuda when available')
+    parser.add_argument("--threads", type=int, default=None, help='torch threads on cpu')
+    parser.add_argument("--limit", type=int, default=None, help='stop after this many frames (fps measurement)')
+    parser.add_argument("--manifest", type=str, default=None,
+                        help='frames already segmented (default: {output}/segmentation_{data}.jsonl)')
+    parser.add_argument("--overwrite", action='store_true', default=False, help='ignore the manifest')
+
+    parser.add_argument("--ckpt", default='/media/hankung/ssd/best_deeplabv3plus_resnet101_cityscapes_os16.pth.tar', type=str,
+                        help="resume from checkpoint")
+    parser.add_argument("--gpu_id", type=str, default='0',
+                        help="GPU ID")
+    return parser
+
+
+def parse_size(size):
+    h, w = size.lower().split('x')
+    return int(h), int(w)
+
+
+def list_images(folder):
+    out = []
+    for dirpath, _, files in os.walk(folder):
+        out.extend(os.path.join(dirpath, f) for f in files if f.endswith(IMAGE_EXTS))
+    return sorted(out)
+
+
+def taco_frames(opts, sizes):
+    """
+        {variant}/rgb/front/* -> {variant}/segmentation_{h}x{w}/*.png
+    """
+    out = []
+    for dirpath, subdirs, _ in os.walk(opts.input):
+        if os.path.basename(dirpath) != 'rgb':
+            continue
+        subdirs[:] = []
+        if 'front' not in os.listdir(dirpath):
+            continue
+        variant = os.path.dirname(dirpath)
+        save_root = os.path.join(opts.output, os.path.relpath(variant, opts.input))
+        save_dirs = [os.path.join(save_root, 'segmentation_%dx%d' % s) for s in sizes]
+        out.extend((f, save_dirs) for f in list_images(os.path.join(dirpath, 'front')))
+    return out
+
+
+def oats_frames(opts, sizes):
+    """
+        images/{scenario}/* -> images/{scenario}_segmentation_{h}x{w}/*.png
+    """
+    out = []
+    for scenario in sorted(os.listdir(opts.input)):
+        if 'segmentation' in scenario or not os.path.isdir(os.path.join(opts.input, scenario)):
+            continue
+        save_dirs = [os.path.join(opts.output, scenario + '_segmentation_%dx%d' % s) for s in sizes]
+        out.extend((f, save_dirs) for f in list_images(os.path.join(opts.input, scenario)))
+    return out
+
+
+def nuscenes_frames(opts, sizes):
+    """
+        CAM_FRONT/* of the labelled windows -> segmentation_{h}x{w}/*.png
+    """
+    all_imgs = sorted(os.listdir(os.path.join(opts.input, 'CAM_FRONT')))
+    frame_pos = {img: i for i, img in enumerate(all_imgs)}
+    selected = set()
+    for label_file in ['nuscenes_boston_labels', 'nuscenes_singapore_labels']:
+        with open(os.path.join(opts.label_dir, label_file + '.txt')) as f:
+            for line in f:
+                start_frame_idx = frame_pos[line.replace('\n', '').split(',')[0]]
+                selected.update(all_imgs[start_frame_idx-1:start_frame_idx-1+16])
+    save_dirs = [os.path.join(opts.output, 'segmentation_%dx%d' % s) for s in sizes]
+    return [(os.path.join(opts.input, 'CAM_FRONT', img), save_dirs) for img in sorted(selected)]
+
+
+def road_frames(opts, sizes):
+    """
+        {video}/* -> {video}_segmentation/*.png (32x96), {video}_segmentation_{h}x{w} otherwise
+    """
+    out = []
+    for v in ['2','3','4', '5', '6','8','10','11','12','14','15','16', '17', '18']:
+        save_dirs = [os.path.join(opts.output, v + ('_segmentation' if s == (32, 96) else '_segmentation_%dx%d' % s))
+                     for s in sizes]
+        out.extend((f, save_dirs) for f in list_images(os.path.join(opts.input, v)))
+    return out
+
+
+FRAME_LISTS = {'taco': taco_frames, 'oats': oats_frames, 'nuscenes': nuscenes_frames, 'road': road_frames}
+
+
+class FrameDataset(data.Dataset):
+    """
+        decode + normalise in the DataLoader workers
+    """
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.transform = T.Compose([
+                T.ToTensor(),
+                T.Normalize(mean=[0.485, 0.456, 0.406],
+                                std=[0.229, 0.224, 0.225]),
+            ])
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, index):
+        img = Image.open(self.frames[index][0]).convert('RGB')
+        return self.transform(img), index
+
+
+def collate(batch):
+    # frames of different sizes cannot be stacked, they are run in groups of one size
+    return [img for img, _ in batch], [index for _, index in batch]
+
+
+def save_masks(pred, img_path, save_dirs, sizes, decode_fn):
+    """
+        pred: uint8 [H, W] train ids; nearest-resize the ids, then colourise:
+        the same pixels as resizing the colour image with Image.NEAREST
+    """
+    ext = os.path.basename(img_path).split('.')[-1]
+    img_name = os.path.basename(img_path)[:-len(ext)-1]
+    pred = Image.fromarray(pred)
+    for save_dir, (h, w) in zip(save_dirs, sizes):
+        small = np.array(pred.resize((w, h), Image.NEAREST))
+        colorized_preds = Image.fromarray(decode_fn(small).astype('uint8'))
+        out_path = os.path.join(save_dir, img_name+'.png')
+        colorized_preds.save(out_path + '.tmp.png')
+        os.replace(out_path + '.tmp.png', out_path)
+
+
+def main():
+    opts = get_argparser().parse_args()
+    if opts.dataset.lower() == 'voc':
+        opts.num_classes = 21
+        decode_fn = VOCSegmentation.decode_target
+    elif opts.dataset.lower() == 'cityscapes':
+        opts.num_classes = 19
+        decode_fn = Cityscapes.decode_target
+
+    os.environ['CUDA_VISIBLE_DEVICES'] = opts.gpu_id
+    if opts.device is None:
+        opts.device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    device = torch.device(opts.device)
+    if opts.device == 'cpu' and opts.threads:
+        torch.set_num_threads(opts.threads)
+    print("Device: %s" % device)
+
+    opts.output = opts.output or opts.input
+    sizes = [parse_size(s) for s in (opts.sizes or DEFAULT_SIZES[opts.data])]
+    frames = FRAME_LISTS[opts.data](opts, sizes)
+
+    # frames already segmented at these sizes, one json line per frame
+    manifest_path = opts.manifest or os.path.join(opts.output, 'segmentation_%s.jsonl' % opts.data)
+    sizes_key = 'x'.join('%dx%d' % s for s in sizes)
+    done = set()
+    if not opts.overwrite and os.path.isfile(manifest_path):
+        with open(manifest_path) as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue
+                if entry['sizes'] == sizes_key:
+                    done.add(entry['frame'])
+    todo = [(f, d) for f, d in frames if os.path.relpath(f, opts.input) not in done]
+    if opts.limit is not None:
+        todo = todo[:opts.limit]
+    print('%d frames, %d already done, %d to segment' % (len(frames), len(frames)-len(todo), len(todo)))
+    for save_dir in set(d for _, dirs in todo for d in dirs):
+        os.makedirs(save_dir, exist_ok=True)
+
+    # Set up model (all models are 'constructed at network.modeling), once
+    model = network.modeling.__dict__[opts.model](num_classes=opts.num_classes, output_stride=opts.output_stride)
+    if opts.separable_conv and 'plus' in opts.model:
+        network.convert_to_separable_conv(model.classifier)
+    utils.set_bn_momentum(model.backbone, momentum=0.01)
+
+    if opts.ckpt is not None and os.path.isfile(opts.ckpt):
+        # https://github.com/VainF/DeepLabV3Plus-Pytorch/issues/8#issuecomment-605601402, @PytaichukBohdan
+        checkpoint = torch.load(opts.ckpt, map_location=torch.device('cpu'))
+        model.load_state_dict(checkpoint["model_state"])
+        print("Resume model from %s" % opts.ckpt)
+        del checkpoint
+    else:
+        print("[!] Retrain")
+    if opts.device == 'cuda':
+        model = nn.DataParallel(model)
+    model.to(device)
+    model = model.eval()
+
+    loader = data.DataLoader(FrameDataset(todo), batch_size=opts.batch_size, shuffle=False,
+                             num_workers=opts.num_workers, pin_memory=opts.device == 'cuda', collate_fn=collate)
+    manifest = open(manifest_path, 'a')
+    num_frames = 0
+    infer_time = 0.0
+    start = time.time()
+    with torch.no_grad():
+        for imgs, indices in tqdm(loader):
+            t0 = time.time()
+            preds = [None] * len(imgs)
+            shapes = {}
+            for i, img in enumerate(imgs):
+                shapes.setdefault(tuple(img.shape), []).append(i)
+            for group in shapes.values():
+                batch = torch.stack([imgs[i] for i in group], 0).to(device, non_blocking=True)
+                out = model(batch).max(1)[1].to(torch.uint8).cpu().numpy() # NHW
+                for i, pred in zip(group, out):
+                    preds[i] = pred
+            infer_time += time.time() - t0
+            for pred, index in zip(preds, indices):
+                img_path, save_dirs = todo[index]
+                save_masks(pred, img_path, save_dirs, sizes, decode_fn)
+                manifest.write(json.dumps({'frame': os.path.relpath(img_path, opts.input), 'sizes': sizes_key}) + '\n')
+            manifest.flush()
+            num_frames += len(imgs)
+    manifest.close()
+
+    elapsed = time.time() - start
+    print('%d frames in %.1fs: %.2f frames/s end to end, %.2f frames/s model only (%s, batch %d)' % (
+        num_frames, elapsed, num_frames/max(elapsed, 1e-6), num_frames/max(infer_time, 1e-6), opts.device, opts.batch_size))
+    sys.stdout.flush()
+
+if __name__ == '__main__':
+    main()
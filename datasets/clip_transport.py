@@ -0,0 +1,63 @@
+import numpy as np
+import torch
+from torch.utils.data.dataloader import default_collate
+
+KINETICS_MEAN = [0.45, 0.45, 0.45]
+KINETICS_STD = [0.225, 0.225, 0.225]
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+
+
+def clip_stats(backbone, imagenet_backbones=('inception',)):
+    """
+        mean/std the dataset's to_np() would use for this backbone
+        (TACO/nuScenes: inception only, OATS: inception and r50)
+    """
+    if backbone in imagenet_backbones:
+        return IMAGENET_MEAN, IMAGENET_STD
+    return KINETICS_MEAN, KINETICS_STD
+
+
+def to_uint8_clip(frames):
+    """
+        frames: T PIL images or uint8 [H, W, 3] arrays
+        return: uint8 tensor [3, T, H, W]
+    """
+    clip = np.stack([np.asarray(f, dtype=np.uint8) for f in frames], 0)
+    return torch.from_numpy(clip).permute(3, 0, 1, 2).contiguous()
+
+
+# variable-length fields, concatenated along dim 0 instead of stacked
+VARLEN_KEYS = ('obj_mask_bits',)
+
+
+def clip_collate(batch):
+    """
+        Collate that keeps uint8 clips as one [B, 3, T, H, W] tensor. With
+        pin_memory=True the DataLoader pins it, so Engine.step moves the whole
+        batch to the device in a single copy.
+        VARLEN_KEYS are concatenated; their per-frame counts are collated as usual.
+        Samples without 'videos' (cached backbone features) are collated as usual.
+    """
+    videos = [sample.pop('videos') for sample in batch] if 'videos' in batch[0] else None
+    varlen = {k: [sample.pop(k) for sample in batch] for k in VARLEN_KEYS if k in batch[0]}
+    out = default_collate(batch)
+    if videos is not None:
+        out['videos'] = default_collate(videos)
+    for k, v in varlen.items():
+        out[k] = torch.cat(v, 0)
+    return out
+
+
+def normalize_clip(x, mean, std, device=None):
+    """
+        x: uint8 [B, 3, T, H, W] (or the legacy list of normalised frames, returned as is)
+        return: float32 clip normalised on the device, same values as ToTensor + Normalize
+    """
+    if not isinstance(x, torch.Tensor) or x.dtype != torch.uint8:
+        return x
+    if device is not None:
+        x = x.to(device, non_blocking=True)
+    mean = torch.tensor(mean, dtype=torch.float32, device=x.device).view(1, 3, 1, 1, 1)
+    std = torch.tensor(std, dtype=torch.float32, device=x.device).view(1, 3, 1, 1, 1)
+    return x.float().div_(255).sub_(mean).div_(std)
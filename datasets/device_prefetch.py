@@ -0,0 +1,150 @@
+import time
+import queue
+import threading
+import torch
+
+
+def to_device(x, device, non_blocking=False, pin=False):
+    """
+        every tensor of a (nested) dict / list / tuple batch on the device,
+        anything else (strings, names) as is
+    """
+    if isinstance(x, torch.Tensor):
+        if pin and not x.is_pinned():
+            x = x.pin_memory()
+        return x.to(device, non_blocking=non_blocking)
+    if isinstance(x, dict):
+        return {k: to_device(v, device, non_blocking, pin) for k, v in x.items()}
+    if isinstance(x, list):
+        return [to_device(v, device, non_blocking, pin) for v in x]
+    if isinstance(x, tuple):
+        return tuple(to_device(v, device, non_blocking, pin) for v in x)
+    return x
+
+
+def _record_stream(x, stream):
+    # the caching allocator must not reuse the staged memory before the compute stream is done with it
+    if isinstance(x, torch.Tensor):
+        if x.is_cuda:
+            x.record_stream(stream)
+    elif isinstance(x, dict):
+        for v in x.values():
+            _record_stream(v, stream)
+    elif isinstance(x, (list, tuple)):
+        for v in x:
+            _record_stream(v, stream)
+
+
+class DevicePrefetcher(object):
+    """
+        Wraps a DataLoader: iterating yields the batches with every tensor already
+        on the device, batch N+1 being copied while batch N computes.
+            cuda: copies issued on a side stream from pinned memory, the compute
+                  stream waits for them only when it takes the batch
+            else: a background thread fetches and moves up to `depth` batches ahead
+
+        wait_time is the time the loop spent blocked on the DataLoader (or the
+        thread), i.e. not hidden behind compute; report() prints it per epoch.
+    """
+
+    def __init__(self, loader, device, depth=2):
+        self.loader = loader
+        self.device = torch.device(device)
+        self.depth = depth
+        self.cuda = self.device.type == 'cuda' and torch.cuda.is_available()
+        self.wait_time = 0.0
+        self.num_batches = 0
+        self.start_time = None
+
+    def __len__(self):
+        return len(self.loader)
+
+    @property
+    def dataset(self):
+        return self.loader.dataset
+
+    def __iter__(self):
+        self.wait_time = 0.0
+        self.num_batches = 0
+        self.start_time = time.time()
+        if self.cuda:
+            return self._cuda_iter()
+        return self._thread_iter()
+
+    def _next(self, it):
+        t0 = time.time()
+        try:
+            batch = next(it)
+        except StopIteration:
+            batch = None
+        self.wait_time += time.time() - t0
+        return batch
+
+    def _cuda_iter(self):
+        stream = torch.cuda.Stream(self.device)
+        it = iter(self.loader)
+
+        def stage():
+            batch = self._next(it)
+            if batch is not None:
+                with torch.cuda.stream(stream):
+                    batch = to_device(batch, self.device, non_blocking=True, pin=True)
+            return batch
+
+        batch = stage()
+        while batch is not None:
+            current = torch.cuda.current_stream(self.device)
+            current.wait_stream(stream)
+            _record_stream(batch, current)
+            next_batch = stage()
+            self.num_batches += 1
+            yield batch
+            batch = next_batch
+
+    def _thread_iter(self):
+        out = queue.Queue(maxsize=self.depth)
+        stop = threading.Event()
+        done = object()
+
+        def put(item):
+            # gives up once the consumer has left the loop
+            while not stop.is_set():
+                try:
+                    out.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def worker():
+            try:
+                for batch in self.loader:
+                    if not put(to_device(batch, self.device)):
+                        return
+            except Exception as e:
+                put(e)
+                return
+            put(done)
+
+        thread = threading.Thread(target=worker, daemon=True)
+        thread.start()
+        try:
+            while True:
+                t0 = time.time()
+                batch = out.get()
+                self.wait_time += time.time() - t0
+                if batch is done:
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+                self.num_batches += 1
+                yield batch
+        finally:
+            stop.set()
+            thread.join()
+
+    def report(self):
+        elapsed = time.time() - self.start_time if self.start_time is not None else 0.0
+        return '%d batches, waited %.1fs for data (%.1f%% of %.1fs, %.1f ms/batch)' % (
+            self.num_batches, self.wait_time, 100.0*self.wait_time/max(elapsed, 1e-6), elapsed,
+            1e3*self.wait_time/max(self.num_batches, 1))
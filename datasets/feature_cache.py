@@ -0,0 +1,171 @@
+import os
+import sys
+import glob
+import json
+import hashlib
+import numpy as np
+import torch
+from tqdm import tqdm
+from torch.utils.data import DataLoader
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from scenario_index import get_video_folder
+from clip_transport import clip_collate, clip_stats, normalize_clip
+
+CACHE_VERSION = 1
+# backbones whose model.resnet is a plain sequence of blocks on one [b, C, T, h, w] clip
+SEQUENTIAL_BACKBONES = ('x3d', 'i3d')
+
+
+def frozen_blocks(model):
+    """
+        number of leading model.resnet blocks without a trainable parameter,
+        i.e. the split generate_model() made between frozen prefix and tuned tail
+    """
+    n = 0
+    for block in model.resnet:
+        if any(p.requires_grad for p in block.parameters()):
+            break
+        n += 1
+    return n
+
+
+def _fingerprint(model, num_blocks):
+    # the checkpoint loaded after generate_model() may overwrite the prefix weights
+    h = hashlib.sha1()
+    for i in range(num_blocks):
+        for name, t in model.resnet[i].state_dict().items():
+            h.update(name.encode('utf-8'))
+            h.update(t.detach().cpu().contiguous().numpy().tobytes())
+    return h.hexdigest()[:16]
+
+
+class FeatureCache(object):
+    """
+        Activations of the frozen backbone prefix (model.resnet[:num_blocks]) for
+        every (scenario, window) of a split, one fp16 [N, c, t, h, w] memmap.
+        Row of a window: SampleIndex.scenario_offsets[index] + sample_idx.
+
+        The manifest next to it holds the key it was built for (backbone,
+        model, seq_len, frozen blocks, frames, a hash of the prefix weights);
+        any change gives another key and load() misses, so the cache is rebuilt
+        instead of feeding stale activations.
+    """
+
+    def __init__(self, index_dir, split, key):
+        self.key = key
+        digest = hashlib.sha1(json.dumps(key, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        self.split = split
+        self.index_dir = index_dir
+        self.data_path = os.path.join(index_dir, 'features_%s_%s.npy' % (split, digest))
+        self.manifest_path = os.path.join(index_dir, 'features_%s_%s.json' % (split, digest))
+        self.num_blocks = key['frozen_blocks']
+        self.offsets = None
+        self.data = None
+
+    def load(self, offsets):
+        if not os.path.isfile(self.manifest_path) or not os.path.isfile(self.data_path):
+            return False
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if manifest.get('key') != self.key or manifest.get('num_windows') != int(offsets[-1]):
+            return False
+        self.offsets = offsets
+        return True
+
+    def build(self, model, dataset, args, batch_size=None):
+        """
+            runs the frozen prefix in eval mode (BatchNorm on its running stats, so
+            every epoch would have produced the same activations) over all windows
+        """
+        offsets = dataset.samples.scenario_offsets
+        items = [(index, sample_idx) for index in range(len(dataset.samples))
+                 for sample_idx in range(dataset.samples.num_windows(index))]
+        loader = DataLoader(dataset, batch_size=batch_size or args.batch_size, sampler=items,
+                            num_workers=args.num_workers, pin_memory=True, collate_fn=clip_collate)
+        stats = clip_stats(args.backbone)
+        if not os.path.isdir(self.index_dir):
+            os.makedirs(self.index_dir)
+        tmp_path = self.data_path + '.tmp%d.npy' % os.getpid()
+        out = None
+        row = 0
+        was_training = model.training
+        model.eval()
+        with torch.no_grad():
+            for batch in tqdm(loader, desc='feature cache (%s)' % self.split):
+                x = batch['videos']
+                if isinstance(x, torch.Tensor):
+                    x = normalize_clip(x, *stats, device=args.device)
+                else:
+                    x = [f.to(args.device, dtype=torch.float32) for f in x]
+                x = model.backbone_prefix(x, self.num_blocks).half().cpu().numpy()
+                if out is None:
+                    print('feature cache: %d windows of %s fp16, %.1f GB' % (
+                        len(items), list(x.shape[1:]), len(items) * x[0].nbytes / 1e9))
+                    out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.float16,
+                                                    shape=(len(items),) + x.shape[1:])
+                out[row:row+len(x)] = x
+                row += len(x)
+        model.train(was_training)
+        out.flush()
+        del out
+
+        tmp_manifest = self.manifest_path + '.tmp%d' % os.getpid()
+        with open(tmp_manifest, 'w') as f:
+            json.dump({'key': self.key, 'num_windows': len(items)}, f)
+        os.replace(tmp_path, self.data_path)
+        os.replace(tmp_manifest, self.manifest_path)
+        # superseded caches of the split are large, drop them
+        for path in glob.glob(os.path.join(self.index_dir, 'features_%s_*' % self.split)):
+            if path not in (self.data_path, self.manifest_path):
+                os.remove(path)
+        self.offsets = offsets
+
+    def get(self, index, sample_idx):
+        """
+            return: float16 tensor [c, t, h, w]
+        """
+        if self.data is None:
+            # opened lazily, every DataLoader worker maps the file itself
+            self.data = np.load(self.data_path, mmap_mode='r')
+        return torch.from_numpy(np.array(self.data[self.offsets[index] + sample_idx]))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['data'] = None
+        return state
+
+
+def feature_cache(model, dataset, args, split='train'):
+    """
+        FeatureCache of the split for this model, built if missing or stale;
+        attach it as dataset.features so __getitem__ ships it instead of the frames
+    """
+    if args.model_name != 'action_slot' or args.backbone not in SEQUENTIAL_BACKBONES:
+        raise ValueError('--feature_cache needs action_slot on a %s backbone' % '/'.join(SEQUENTIAL_BACKBONES))
+    if args.box:
+        raise ValueError('--feature_cache does not support --box')
+    num_blocks = frozen_blocks(model)
+    if num_blocks == 0:
+        raise ValueError('--feature_cache: the first backbone block is trainable, nothing to cache')
+    key = {'version': CACHE_VERSION,
+           'dataset': args.dataset,
+           'root': os.path.abspath(args.root),
+           'split': split,
+           'model_name': args.model_name,
+           'backbone': args.backbone,
+           'seq_len': args.seq_len,
+           'frozen_blocks': num_blocks,
+           'backbone_blocks': len(model.resnet),
+           'video_folder': get_video_folder(args.model_name),
+           'weights': _fingerprint(model, num_blocks)}
+    cache = FeatureCache(args.index_dir, split, key)
+    dataset.features = None
+    if cache.load(dataset.samples.scenario_offsets) and not args.rebuild_index:
+        print('feature cache: %s (%d frozen blocks)' % (cache.data_path, num_blocks))
+    else:
+        cache.build(model, dataset, args)
+    dataset.features = cache
+    return cache
@@ -0,0 +1,193 @@
+import atexit
+import hashlib
+import multiprocessing as mp
+from multiprocessing import shared_memory, resource_tracker
+from collections import OrderedDict
+import numpy as np
+from PIL import Image
+
+# 768x256 RGB, the largest frame any loader keeps after resizing
+DEFAULT_SLOT_SHAPE = (256, 768, 3)
+
+
+def _decode(path, transform):
+    x = Image.open(path)
+    if transform is not None:
+        # still unloaded: the transform may draft the JPEG decode (see jpeg_draft.py)
+        x = transform(x)
+    if x.mode != 'RGB':
+        x = x.convert('RGB')
+    return x
+
+
+class FrameCache(object):
+    """
+        Decoded RGB frames of one worker, LRU over the last max_frames keys
+        (0: frames are decoded and returned, nothing is kept).
+        Every worker holds its own copy of the dataset, hence its own cache.
+    """
+
+    def __init__(self, max_frames=256):
+        self.max_frames = max_frames
+        self.frames = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def open(self, path, transform=None, tag=''):
+        """
+            transform: applied to the decoded PIL image before caching (e.g. a resize),
+            tag: names the transform in the key (e.g. '768x256')
+        """
+        if self.max_frames <= 0:
+            self.misses += 1
+            return _decode(path, transform)
+        key = path + tag
+        x = self.frames.get(key)
+        if x is not None:
+            self.frames.move_to_end(key)
+            self.hits += 1
+            return x
+        self.misses += 1
+        x = _decode(path, transform)
+        self.frames[key] = x
+        if len(self.frames) > self.max_frames:
+            self.frames.popitem(last=False)
+        return x
+
+    def report(self):
+        return '%d hits, %d misses (this process)' % (self.hits, self.misses)
+
+
+def _key(path, tag):
+    key = hashlib.blake2b((path + tag).encode('utf-8'), digest_size=8).digest()
+    # 0 marks an empty slot
+    return int.from_bytes(key, 'little', signed=True) or 1
+
+
+def frame_keys(paths, tag=''):
+    """
+        int64 key of every frame of a window, the per-frame feature cache
+        (models/frame_features.py) looks frames up by it
+    """
+    return np.array([_key(path, tag) for path in paths], dtype=np.int64)
+
+
+class SharedFrameCache(object):
+    """
+        Decoded frames shared by the main process and every DataLoader worker.
+
+        multiprocessing.shared_memory holds num_slots fixed-size slots
+        (budget // slot bytes) plus a small table of key, last use and shape per
+        slot. Keys hash (frame path, resize tag), i.e. (scenario, frame, resolution).
+        Lookups, inserts and LRU eviction run under one lock. Decoding runs
+        outside it. Frames larger than a slot are decoded but not cached.
+
+        Build it in the main process before the DataLoader starts its workers:
+        forked workers inherit the mapping, spawned ones attach by name.
+    """
+
+    def __init__(self, budget_mb, slot_shape=DEFAULT_SLOT_SHAPE):
+        self.slot_bytes = int(np.prod(slot_shape))
+        self.num_slots = max(1, int(budget_mb * 2**20) // self.slot_bytes)
+        self.data_shm = shared_memory.SharedMemory(create=True, size=self.num_slots*self.slot_bytes)
+        self.meta_shm = shared_memory.SharedMemory(create=True, size=(5*self.num_slots+3)*8)
+        self.lock = mp.Lock()
+        self.owner = True
+        self._map()
+        self.meta[:] = 0
+        atexit.register(self.close)
+
+    def _map(self):
+        n = self.num_slots
+        self.data = np.ndarray((n, self.slot_bytes), dtype=np.uint8, buffer=self.data_shm.buf)
+        self.meta = np.ndarray((5*n+3,), dtype=np.int64, buffer=self.meta_shm.buf)
+        self.keys = self.meta[:n]
+        self.ticks = self.meta[n:2*n]
+        self.shapes = self.meta[2*n:5*n].reshape(n, 3)
+        # clock, hits, misses
+        self.counters = self.meta[5*n:]
+
+    def __getstate__(self):
+        return {'slot_bytes': self.slot_bytes, 'num_slots': self.num_slots, 'lock': self.lock,
+                'names': (self.data_shm.name, self.meta_shm.name)}
+
+    def __setstate__(self, state):
+        self.slot_bytes = state['slot_bytes']
+        self.num_slots = state['num_slots']
+        self.lock = state['lock']
+        self.owner = False
+        self.data_shm = shared_memory.SharedMemory(name=state['names'][0])
+        self.meta_shm = shared_memory.SharedMemory(name=state['names'][1])
+        # attaching registers the segments too; only the owner may unlink them
+        for shm in (self.data_shm, self.meta_shm):
+            try:
+                resource_tracker.unregister(shm._name, 'shared_memory')
+            except Exception:
+                pass
+        self._map()
+
+    def get(self, key):
+        with self.lock:
+            slot = np.flatnonzero(self.keys == key)
+            if len(slot) == 0:
+                self.counters[2] += 1
+                return None
+            slot = slot[0]
+            self.counters[0] += 1
+            self.counters[1] += 1
+            self.ticks[slot] = self.counters[0]
+            shape = tuple(self.shapes[slot])
+            return self.data[slot, :int(np.prod(shape))].reshape(shape).copy()
+
+    def put(self, key, x):
+        if x.nbytes > self.slot_bytes:
+            return
+        with self.lock:
+            if (self.keys == key).any():
+                return
+            slot = int(np.argmin(self.ticks))
+            self.counters[0] += 1
+            self.keys[slot] = key
+            self.ticks[slot] = self.counters[0]
+            self.shapes[slot] = x.shape
+            self.data[slot, :x.nbytes] = x.reshape(-1)
+
+    def open(self, path, transform=None, tag=''):
+        """
+            same interface as FrameCache.open, returns uint8 [H, W, 3] arrays
+        """
+        key = _key(path, tag)
+        x = self.get(key)
+        if x is None:
+            x = np.asarray(_decode(path, transform), dtype=np.uint8)
+            self.put(key, x)
+        return x
+
+    def report(self):
+        hits, misses = int(self.counters[1]), int(self.counters[2])
+        used = int((self.keys != 0).sum())
+        return '%d hits, %d misses (%.1f%% hit), %d/%d slots of %d bytes used' % (
+            hits, misses, 100.0*hits/max(1, hits+misses), used, self.num_slots, self.slot_bytes)
+
+    def close(self):
+        if self.data_shm is None:
+            return
+        self.data = self.meta = self.keys = self.ticks = self.shapes = self.counters = None
+        for shm in (self.data_shm, self.meta_shm):
+            shm.close()
+            if self.owner:
+                try:
+                    shm.unlink()
+                except FileNotFoundError:
+                    pass
+        self.data_shm = self.meta_shm = None
+
+
+def make_frame_cache(args, slot_shape=DEFAULT_SLOT_SHAPE, max_frames=0):
+    """
+        SharedFrameCache with --frame_cache_mb > 0, otherwise a per-worker
+        FrameCache of max_frames frames (0: every frame is decoded, nothing is kept)
+    """
+    if args.frame_cache_mb > 0:
+        return SharedFrameCache(args.frame_cache_mb, slot_shape)
+    return FrameCache(max_frames)
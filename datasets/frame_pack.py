@@ -0,0 +1,167 @@
+import os
+import argparse
+import numpy as np
+from PIL import Image
+from pack_jobs import folder_stamp, is_fresh, run_pool
+
+FRAME_EXTS = ('.jpg',)
+
+
+def pack_path(frame_folder):
+    """
+        <frame_folder>.npy holds the uint8 [F, H, W, 3] frames,
+        <frame_folder>_frames.npy the int32 frame number of every row and
+        <frame_folder>_stamp.txt the folder_stamp() of the packed jpgs.
+        All sit next to the folder so the folder listing is left untouched.
+    """
+    frame_folder = os.path.normpath(frame_folder)
+    return frame_folder + '.npy', frame_folder + '_frames.npy', frame_folder + '_stamp.txt'
+
+
+def _stored_stamp(frame_folder):
+    data_path, frames_path, stamp_path = pack_path(frame_folder)
+    if not os.path.isfile(data_path) or not os.path.isfile(frames_path):
+        return None
+    try:
+        with open(stamp_path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+
+def is_packed(frame_folder):
+    # re-extracted frames overwrite the jpgs in place
+    return is_fresh(_stored_stamp(frame_folder), frame_folder, FRAME_EXTS)
+
+
+def pack_folder(frame_folder, overwrite=False):
+    """
+        Decode every frame of a folder once and write them into a single .npy.
+        Frames are decoded exactly like the loaders do (PIL + convert('RGB')),
+        so the packed pixels are the ones ToTensor would see.
+    """
+    if not overwrite and is_packed(frame_folder):
+        return 0
+    stamp = folder_stamp(frame_folder, FRAME_EXTS)
+    names = [n for n in os.listdir(frame_folder) if n.endswith(FRAME_EXTS) and n.split('.')[0].isdigit()]
+    if len(names) == 0:
+        return 0
+    names.sort(key=lambda n: int(n.split('.')[0]))
+    frames = np.array([int(n.split('.')[0]) for n in names], dtype=np.int32)
+
+    first = np.asarray(Image.open(os.path.join(frame_folder, names[0])).convert('RGB'))
+    data_path, frames_path, stamp_path = pack_path(frame_folder)
+    tmp_path = data_path + '.tmp%d.npy' % os.getpid()
+    out = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.uint8, shape=(len(names),) + first.shape)
+    out[0] = first
+    for i, name in enumerate(names[1:], 1):
+        img = np.asarray(Image.open(os.path.join(frame_folder, name)).convert('RGB'))
+        if img.shape != first.shape:
+            del out
+            os.remove(tmp_path)
+            raise ValueError('%s: frame %s is %s, expected %s' % (frame_folder, name, img.shape, first.shape))
+        out[i] = img
+    out.flush()
+    del out
+    np.save(frames_path, frames)
+    os.replace(tmp_path, data_path)
+    # the stamp goes last: a valid stamp implies the frames are written
+    tmp_stamp = stamp_path + '.tmp%d' % os.getpid()
+    with open(tmp_stamp, 'w') as f:
+        f.write(stamp + '\n')
+    os.replace(tmp_stamp, stamp_path)
+    return len(names)
+
+
+class FramePacks(object):
+    """
+        Window reader over the packed frames of many folders.
+
+        Packs are opened lazily as read-only np.memmap, so each DataLoader worker
+        maps them after the fork and a window is a single strided copy out of the
+        page cache instead of seq_len JPEG opens and decodes. The stamp is
+        checked against the jpgs when a pack is opened.
+    """
+
+    def __init__(self):
+        self.packs = {}
+
+    def open(self, frame_folder):
+        data_path, frames_path, stamp_path = pack_path(frame_folder)
+        stamp = _stored_stamp(frame_folder)
+        if stamp is None:
+            raise FileNotFoundError('%s is not packed, run datasets/frame_pack.py first' % frame_folder)
+        if not is_fresh(stamp, frame_folder, FRAME_EXTS):
+            raise ValueError('%s: pack is out of date, rerun datasets/frame_pack.py' % frame_folder)
+        pack = (np.load(data_path, mmap_mode='r'), np.load(frames_path))
+        self.packs[frame_folder] = pack
+        return pack
+
+    def window(self, frame_folder, frames):
+        """
+            frames: frame numbers of one window
+            return: uint8 array [T, H, W, 3]
+        """
+        pack = self.packs.get(frame_folder)
+        if pack is None:
+            pack = self.open(frame_folder)
+        data, frame_ids = pack
+        rows = np.searchsorted(frame_ids, frames)
+        rows = np.minimum(rows, len(frame_ids)-1)
+        if not np.array_equal(frame_ids[rows], frames):
+            raise ValueError('%s: pack is out of date, rerun datasets/frame_pack.py' % frame_folder)
+        return np.array(data[rows])
+
+    def __getstate__(self):
+        # never ship open maps to the workers
+        return {'packs': {}}
+
+
+def find_taco_folders(root, folders):
+    out = []
+    for dirpath, subdirs, files in os.walk(root):
+        if os.path.basename(dirpath) != 'rgb':
+            continue
+        for folder in folders:
+            if folder in subdirs:
+                out.append(os.path.join(dirpath, folder))
+        # frame folders hold no scenarios
+        subdirs[:] = []
+    return sorted(out)
+
+
+def find_oats_folders(root, folders):
+    out = []
+    for folder in folders:
+        folder_path = os.path.join(root, folder)
+        if not os.path.isdir(folder_path):
+            continue
+        for scenario in os.listdir(folder_path):
+            if os.path.isdir(os.path.join(folder_path, scenario)):
+                out.append(os.path.join(folder_path, scenario))
+    return sorted(out)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--root', type=str, help='dataset path')
+    parser.add_argument('--dataset', type=str, default='taco', choices=['taco', 'oats'])
+    parser.add_argument('--folders', type=str, nargs='+', default=None,
+                        help='frame folders to pack (taco: downsampled downsampled_224, oats: downsampled_224 downsampled_256x768)')
+    parser.add_argument('--num_workers', type=int, default=12)
+    parser.add_argument('--overwrite', help="repack up-to-date folders", action="store_true")
+    args = parser.parse_args()
+
+    if args.dataset == 'taco':
+        folders = args.folders or ['downsampled', 'downsampled_224']
+        frame_folders = find_taco_folders(args.root, folders)
+    else:
+        folders = args.folders or ['downsampled_224', 'downsampled_256x768']
+        frame_folders = find_oats_folders(args.root, folders)
+    print('%d frame folders' % len(frame_folders))
+
+    run_pool(pack_folder, frame_folders, (args.overwrite,), args.num_workers, 'frames')
+
+
+if __name__ == "__main__":
+    main()
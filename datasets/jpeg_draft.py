@@ -0,0 +1,30 @@
+from PIL import Image
+
+
+def draft_rgb(image, size, oversample=1):
+    """
+        image: PIL image straight from Image.open (not loaded yet)
+        size: (width, height) the caller resizes to
+
+        Let libjpeg decode a JPEG at the smallest DCT scale (1/2, 1/4 or 1/8)
+        whose output still covers oversample * size, so the final resize starts
+        from a smaller image. oversample=0, other formats and images already
+        loaded decode at full size. return: RGB image
+    """
+    if oversample and image.format == 'JPEG':
+        image.draft('RGB', (size[0] * oversample, size[1] * oversample))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
+
+def draft_tag(oversample):
+    # frame cache key suffix, drafted and full decodes are different frames
+    return '_draft%d' % oversample if oversample else ''
+
+
+def resize(image, size, oversample=0):
+    """
+        the LANCZOS resize of the loaders' scale() helpers, drafted when oversample > 0
+    """
+    return draft_rgb(image, size, oversample).resize(size, Image.Resampling.LANCZOS)
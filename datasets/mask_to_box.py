@@ -2,14 +2,8 @@ import os
 import argparse
 import time
 import json
-import csv
+import multiprocessing as mp
 import cv2
-from matplotlib.pyplot import acorr
-from torchvision.io import read_image
-import torch
-from torchvision.ops.boxes import masks_to_boxes
-from torchvision.io import read_image
-import zipfile
 import numpy as np
 
 def parse_trackelt(tracklet):
@@ -29,42 +23,47 @@ def parse_trackelt(tracklet):
 
     return len(obj_id_list)
 
+def id_boxes(ids, condition, threshold=0):
+    """
+        One pass over the id image, no [N, H, W] mask stack.
+        Args:
+            ids: int [H, W] actor id image
+            condition: bool [H, W] pixels that belong to objects
+        return:
+            obj_ids [N] sorted, boxes int64 [N, 4] (x1, y1, x2, y2, inclusive like masks_to_boxes),
+            area int64 [N] pixels; objects under threshold pixels are dropped
+    """
+    ys, xs = np.nonzero(condition)
+    obj_ids, inverse = np.unique(ids[ys, xs], return_inverse=True)
+    inverse = inverse.reshape(-1)
+    area = np.bincount(inverse, minlength=len(obj_ids))
+    if len(obj_ids) == 0:
+        return obj_ids, np.zeros((0, 4), dtype=np.int64), area
+    # pixels grouped by object, min/max per group
+    order = np.argsort(inverse, kind='stable')
+    ys, xs = ys[order], xs[order]
+    starts = np.concatenate([[0], np.cumsum(area)[:-1]])
+    boxes = np.stack([np.minimum.reduceat(xs, starts), np.minimum.reduceat(ys, starts),
+                      np.maximum.reduceat(xs, starts), np.maximum.reduceat(ys, starts)], 1)
+    keep = area >= threshold
+    return obj_ids[keep], boxes[keep].astype(np.int64), area[keep]
+
 def instance_to_box(mask,threshold=60):
     """
         Args:
-            mask: instance image
-            class_filter: List[int] int: CARLA Semantic segmentation tags (classes that need bounding boxes)
+            mask: instance image [3, H, W] (R: CARLA semantic tag, G + B*256: actor id)
         return:
             boxes: List[Dict], 
                 key: 
                     actor_id: carla actor id & 0xffff, 
-                    class: carla segmentation tag, 
-                    box: bounding box(x1,y1,x2,y2)
+                    value: bounding box(x1,y1,x2,y2)
+            num_box
     """
-    h,w = mask.shape[1:]
-    mask_2 = torch.zeros(2,h,w)
-    mask_2[0] = mask[0]
-    mask_2[1] = mask[1]+mask[2]*256
+    mask = np.asarray(mask)
+    ids = mask[1].astype(np.int64) + mask[2].astype(np.int64)*256
     # ped,vehicle
-    condition = mask_2[0]== 4
-    condition += mask_2[0]== 10
-    # condition = mask[0]== 4
-    # condition += mask[0]== 10
-    obj_ids = torch.unique(mask_2[1,condition])
-    filter_exist_actor = []
-    for obj_id in obj_ids:
-        obj_id = int(obj_id.numpy())
-        # if obj_id in actor_id_list[0]:
-        filter_exist_actor.append(True)
-        # else:
-        #     filter_exist_actor.append(False)
-    obj_ids = obj_ids[filter_exist_actor]
-    masks = mask_2[1] == obj_ids[:, None, None]
-    masks = masks*condition
-    area_condition = masks.long().sum((1,2))>=threshold
-    masks = masks[area_condition]
-    obj_ids = obj_ids[area_condition].type(torch.int).numpy()
-    boxes = masks_to_boxes(masks).type(torch.int16).numpy()
+    condition = (mask[0] == 4) | (mask[0] == 10)
+    obj_ids, boxes, _ = id_boxes(ids, condition, threshold)
     out_list = []
     # print(masks[0, 10:, 10:])
     # for id, box in zip(obj_ids, boxes):
@@ -148,85 +147,70 @@ def instance_to_box(mask,threshold=60):
 #         else:
 #             out[int(row[0])&0xffff] = int(row[1])
 #     return out,out_2
-def produce_boxes(root_path):
-    max_box = 0
-    scenario_key = ['interactive','non-interactive', 'ap_Town01']
-    # scenario_key =  ['ap_Town02', 'ap_Town03', 'ap_Town04',]
-    # scenario_key =  ['ap_Town05', 'ap_Town06', 'ap_Town07', 'ap_Town10HD']
-    # scenario_key = ['interactive']
-    # scenario_key = ['non-interactive','obstacle']
-    curr_path = root_path
-    path = [curr_path]
-    for scenario_type in os.listdir(curr_path):
-        print(scenario_type)
-        if scenario_type in scenario_key:
-            curr_path = path[-1]
-            curr_path = os.path.join(curr_path,scenario_type)
-            path.append(curr_path)
-            for scenario_id in os.listdir(curr_path):
-                curr_path = path[-1]
-                if 'DS' in scenario_id:
-                    continue
-                if 'screen' in scenario_id:
-                    continue
-                curr_path = os.path.join(curr_path,scenario_id,'variant_scenario')
-                path.append(curr_path)
-                for variant_name in os.listdir(curr_path):
-                    if not variant_name.isdigit():
-                        continue
-                    start_time = time.time()
-                    curr_path = path[-1]
-                    curr_path = os.path.join(curr_path,variant_name)
-                    print(scenario_id,variant_name)
-                    if not os.path.isdir(os.path.join(curr_path,'bbox')):
-                        os.mkdir(os.path.join(curr_path,'bbox'))
-                        os.mkdir(os.path.join(curr_path,'bbox','front'))
-                    # else:
-                    #     continue
-                    # with open(os.path.join(curr_path,'actor_list.csv'), newline='') as csvfile:
-                    #     rows = list(csv.reader(csvfile))[1:]
-                    # actor_id_list = generate_actor_ids(rows)
-                    # try:
-                    #     instances = sorted(os.listdir(os.path.join(curr_path,'instance_segmentation/ins_front')))
-                    #     for instance in instances:
-                    #         frame_id = instance[:-4]
-                    #         raw_instance = read_image(os.path.join(curr_path,'instance_segmentation/ins_front',instance))[:3].type(torch.int)
-                    #         data = instance_to_box(raw_instance,[4,10,20],actor_id_list)
-                    #         # raise
-                    #         # torch.save(boxes,os.path.join(curr_path,'bbox/front/%s.pt' % (frame_id)))
-                    #         with open(os.path.join(curr_path,'bbox/front/%s.json' % (frame_id)), 'w') as f:
-                    #             json.dump(data, f)
-                    #     print('time taken: {}'.format(time.time()-start_time))
-                    # except Exception as e:
-                    #     print(e)
-                    #     continue
-                    seg_path = os.path.join(curr_path,'instance_segmentation', 'ins_front')
-                    if not os.path.exists(seg_path):
-                        continue
-                    img_file_list = [f for f in os.listdir(seg_path) if os.path.isfile(os.path.join(seg_path, f))]
+def scenario_boxes(curr_path):
+    """
+        write bbox/front/{frame}.json for every instance frame of one scenario
+        return: number of distinct actor ids, None without instance frames
+    """
+    seg_path = os.path.join(curr_path,'instance_segmentation', 'ins_front')
+    if not os.path.exists(seg_path):
+        return None
+    os.makedirs(os.path.join(curr_path,'bbox','front'), exist_ok=True)
+    img_file_list = sorted([f for f in os.listdir(seg_path) if os.path.isfile(os.path.join(seg_path, f))])
+    tracklet = []
+    for img_file in img_file_list:
+        frame_id = img_file[:-4]
+        img = cv2.imread(os.path.join(seg_path, img_file), cv2.IMREAD_COLOR)
+        # BGR -> [R, G, B]
+        data, num_box = instance_to_box(img[..., ::-1].transpose(2, 0, 1))
+        tracklet.append(data)
+        with open(os.path.join(curr_path,'bbox/front/%s.json' % (frame_id)), 'w') as f:
+            json.dump(data, f)
+    return parse_trackelt(tracklet)
+
+def list_scenarios(root_path, scenario_key):
+    out = []
+    for scenario_type in sorted(os.listdir(root_path)):
+        if scenario_type not in scenario_key:
+            continue
+        for scenario_id in sorted(os.listdir(os.path.join(root_path,scenario_type))):
+            if 'DS' in scenario_id or 'screen' in scenario_id:
+                continue
+            variant_root = os.path.join(root_path,scenario_type,scenario_id,'variant_scenario')
+            if not os.path.isdir(variant_root):
+                continue
+            for variant_name in sorted(os.listdir(variant_root)):
+                if variant_name.isdigit():
+                    out.append(os.path.join(variant_root,variant_name))
+    return out
 
-                    img_file_list = sorted(img_file_list)
-                    tracklet = []
-                    for img_file in img_file_list:
-                        frame_id = img_file.split('/')[-1][:-4]
-                        img = cv2.imread(os.path.join(seg_path, img_file), cv2.IMREAD_COLOR)
+def thread(curr_path):
+    try:
+        return scenario_boxes(curr_path)
+    except Exception as e:
+        print('failed %s: %s' % (curr_path, e))
+        return None
 
-                        img = torch.flip(torch.from_numpy(img).type(torch.int).permute(2,0,1),[0])
-                        data, num_box = instance_to_box(img)
-                
-                        tracklet.append(data)
-                        if os.path.exists(os.path.join(curr_path,'bbox/front/%s.json' % (frame_id))):
-                            os.remove(os.path.join(curr_path,'bbox/front/%s.json' % (frame_id)))
-                        with open(os.path.join(curr_path,'bbox/front/%s.json' % (frame_id)), 'w') as f:
-                            json.dump(data, f)
-                    num_box = parse_trackelt(tracklet)
-                    if num_box > max_box:
-                        max_box = num_box
-                    print('time taken: {}'.format(time.time()-start_time))
-                path.pop()
-            path.pop()
+def produce_boxes(root_path, scenario_key=('interactive','non-interactive', 'ap_Town01'), num_workers=12):
+    """
+        Boxes of every scenario under root_path, one scenario per task.
+        return: {scenario path: number of distinct actor ids}
+    """
+    start_time = time.time()
+    scenarios = list_scenarios(root_path, scenario_key)
+    pool = mp.Pool(processes=num_workers)
+    results = [(s, pool.apply_async(thread, (s,))) for s in scenarios]
+    pool.close()
+    out = {}
+    for s, r in results:
+        num_box = r.get()
+        if num_box is not None:
+            out[s] = num_box
+    pool.join()
+    print('%d scenarios, time taken: %.1fs' % (len(out), time.time()-start_time))
     print('max num box:')
-    print(max_box)
+    print(max(out.values()) if len(out) else 0)
+    return out
 if __name__ == '__main__':
     argparser = argparse.ArgumentParser(
         description=__doc__)
@@ -240,9 +224,15 @@ if __name__ == '__main__':
         default="/media/hankung/ssd/carla_13/CARLA_0.9.13/PythonAPI/examples/data_collection",
         required=False,
         help='scenario path')
+    argparser.add_argument(
+        '--scenario_types',
+        nargs='+',
+        default=['interactive','non-interactive', 'ap_Town01'],
+        help='scenario types to process')
+    argparser.add_argument('--num_workers', type=int, default=12)
     args = argparser.parse_args()
     if args.mode == 'box':
-        produce_boxes(args.path)
+        produce_boxes(args.path, args.scenario_types, args.num_workers)
     # elif args.mode == 'demo':
     #     read_and_draw(args.path)
     
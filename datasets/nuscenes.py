@@ -13,6 +13,13 @@ import json
 import random
 # from tool import get_rot
 import torchvision.transforms as transforms
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from sample_index import SampleIndex, LabelMatrix
+from clip_transport import to_uint8_clip
+from stuff_mask import StuffMasks
+from nuscenes_downsample import cached_folder
+from frame_cache import make_frame_cache
+from jpeg_draft import resize, draft_tag
 # from torchvideotransforms import video_transforms, volume_transforms
 
 # from pytorchvideo.transforms import (
@@ -44,13 +51,11 @@ class NUSCENES(Dataset):
         self.scenario = []
         self.args =args
 
-        self.video_list = []
-        self.seg_list = []
-
-        self.idx = []
-        self.gt_ego = []
-        self.gt_actor = []
-        self.slot_eval_gt = []
+        self.labels = LabelMatrix()
+        self.stuff_masks = StuffMasks()
+        # --frame_cache_mb shares the resized frames across workers (see frame_cache.py)
+        self.frame_size = (224, 224) if args.pretrain == 'oats' else (768, 256)
+        self.frame_cache = make_frame_cache(args, (self.frame_size[1], self.frame_size[0], 3))
 
 
         self.step = []
@@ -115,8 +120,17 @@ class NUSCENES(Dataset):
             seg_folder = seg_folder[0]
         else:
             seg_folder = seg_folder[1]
-        all_imgs = [os.path.join(root, 'CAM_FRONT',img) for img in os.listdir(os.path.join(root, 'CAM_FRONT')) if os.path.isfile(os.path.join(root, 'CAM_FRONT',img))]
+        all_imgs = [img for img in os.listdir(os.path.join(root, 'CAM_FRONT')) if os.path.isfile(os.path.join(root, 'CAM_FRONT',img))]
         all_imgs.sort()
+        # frame name -> position in all_imgs, instead of a list.index() per label line
+        frame_pos = {img: i for i, img in enumerate(all_imgs)}
+        # one window per sample; frames index the table of CAM_FRONT frame names
+        self.samples = SampleIndex({'video': '%s.jpg', 'seg': '%s.png'},
+                                   names=[img[:-4] for img in all_imgs])
+        # frames pre-resized by nuscenes_downsample.py skip the LANCZOS resize in __getitem__
+        resized_folder = cached_folder(root, args.pretrain, [img[:-4] for img in all_imgs])
+        self.resized = resized_folder is not None
+        video_folder = resized_folder if self.resized else 'CAM_FRONT'
 
         for label_file in label_files:
             with open('../datasets/' + label_file + '.txt') as f:
@@ -138,29 +152,24 @@ class NUSCENES(Dataset):
                         label_stat, proposal_train_label, gt_ego, gt_actor = get_labels(args, label_stat, ego_gt, actor_gt, num_slots=args.num_slots)
                     else:
                         label_stat, gt_ego, gt_actor = get_labels(args, label_stat, ego_gt, actor_gt, num_slots=args.num_slots)
-                    start_frame = os.path.join(root, 'CAM_FRONT', start_frame)
-                    start_frame_idx = all_imgs.index(start_frame)
-                    video = all_imgs[start_frame_idx-1:start_frame_idx-1+16]
-
-                    seg = [os.path.join(root, seg_folder, os.path.basename(img)[:-4]+'.png') for img in video]
+                    if start_frame not in frame_pos:
+                        raise ValueError('%s is not in %s' % (start_frame, os.path.join(root, 'CAM_FRONT')))
+                    start_frame_idx = frame_pos[start_frame]
+                    video = list(range(len(all_imgs))[start_frame_idx-1:start_frame_idx-1+16])
                     # ------------statistics-------------
                     if torch.count_nonzero(gt_actor) > max_num_label_a_video:
                         max_num_label_a_video = torch.count_nonzero(gt_actor)
                     total_label += torch.count_nonzero(gt_actor)
 
                     self.city.append(label_file)
-                    self.scenario.append(os.path.basename(video[0])[:-4])
-                    self.video_list.append(video)
-                    self.seg_list.append(seg)
-                    # self.obj_seg_list.append(obj_f)
-
-                    self.gt_ego.append(gt_ego)
+                    self.scenario.append(all_imgs[video[0]][:-4])
+                    self.samples.append({'video': [video], 'seg': [video]},
+                                        {'video': os.path.join(root, video_folder), 'seg': os.path.join(root, seg_folder)})
                     
                     if ('slot' in args.model_name and not args.allocated_slot) or args.box:
-                        self.gt_actor.append(proposal_train_label)
-                        self.slot_eval_gt.append(gt_actor)
+                        self.labels.append(ego=gt_ego, actor=proposal_train_label, slot_eval_gt=gt_actor)
                     else:
-                        self.gt_actor.append(gt_actor)
+                        self.labels.append(ego=gt_ego, actor=gt_actor)
                     if self.args.val_confusion:
                         self.confusion_label_list.append(confusion_label)
 
@@ -182,6 +191,10 @@ class NUSCENES(Dataset):
         print(label_stat[6])
 
         self.label_stat = label_stat
+        self.samples.finalize()
+        self.labels.finalize()
+        self.city = np.array(self.city)
+        self.scenario = np.array(self.scenario)
         if args.box:
             self._parse_tracklet(training)
     
@@ -195,13 +208,14 @@ class NUSCENES(Dataset):
             path = osp(self.args.root,'pred','val')
         if not os.path.isdir(path):
             os.mkdir(path) 
-        for i, samples in enumerate(self.video_list):
+        for i in range(len(self.samples)):
             sample_path = osp(path,str(i))
             if not os.path.isdir(sample_path):
                 os.mkdir(sample_path) 
             f = open(osp(sample_path,'imgs.txt'), 'w')
-            for p in samples:
-                f.write(p)
+            for p in self.samples.paths('video', i, 0):
+                # the tracker runs on the full resolution frames
+                f.write(osp(self.args.root, 'CAM_FRONT', os.path.basename(p)))
                 f.write('\n')
             f.close()
 
@@ -227,7 +241,7 @@ class NUSCENES(Dataset):
             path = osp(self.args.root,'pred','val')
 
         self.box = []
-        for i, _ in enumerate(self.video_list):
+        for i in range(len(self.samples)):
             f = open(osp(path,str(i),'CAM_FRONT.txt'))
             tracklet = f.readlines()
             tracklet = parse_tracklet()
@@ -249,7 +263,8 @@ class NUSCENES(Dataset):
                     except:
                         continue
             self.box.append(out)
-        assert len(self.video_list) == len(self.box)
+        assert len(self.samples) == len(self.box)
+        self.box = np.stack(self.box, 0)
             
             # for debug
             # fourcc = cv2.VideoWriter_fourcc(*"mp4v")
@@ -264,27 +279,27 @@ class NUSCENES(Dataset):
 
     def __len__(self):
         """Returns the length of the dataset. """
-        return len(self.video_list)
+        return len(self.samples)
 
     def __getitem__(self, index):
         """Returns the item at index idx. """
         data = dict()
-        data['city'] = self.city[index]
-        data['scenario'] = self.scenario[index]
+        data['city'] = str(self.city[index])
+        data['scenario'] = str(self.scenario[index])
         data['videos'] = []
         data['bg_seg'] = []
         data['obj_masks'] = []
-        data['ego'] = self.gt_ego[index]
-        data['actor'] = self.gt_actor[index]
+        data['ego'] = self.labels.get('ego', index)
+        data['actor'] = self.labels.get('actor', index)
         data['raw'] = []
 
         if ('slot' in self.args.model_name and not self.args.allocated_slot) or self.args.box:
-            data['slot_eval_gt'] = self.slot_eval_gt[index]
+            data['slot_eval_gt'] = self.labels.get('slot_eval_gt', index)
 
 
-        seq_videos = self.video_list[index]
+        seq_videos = self.samples.paths('video', index, 0)
         if self.args.bg_mask:
-            seq_seg = self.seg_list[index]
+            seq_seg = self.samples.paths('seg', index, 0)
         # if self.args.obj_mask:
         #     obj_masks_list = self.obj_seg_list[index][sample_idx]
 
@@ -294,8 +309,12 @@ class NUSCENES(Dataset):
             data['box'] = self.box[index]
 
         for i in range(self.seq_len):
-            x = Image.open(seq_videos[i]).convert('RGB')
-            x = scale(x, self.args.model_name, self.args.pretrain)
+            if self.resized:
+                x = self.frame_cache.open(seq_videos[i])
+            else:
+                x = self.frame_cache.open(seq_videos[i],
+                                        lambda img: scale(img, self.args.model_name, self.args.pretrain, self.args.jpeg_draft),
+                                        tag='%dx%d' % self.frame_size + draft_tag(self.args.jpeg_draft))
             data['videos'].append(x)
             if self.args.plot:
                 data['raw'].append(x)
@@ -303,71 +322,18 @@ class NUSCENES(Dataset):
             if self.args.bg_mask and i %self.args.mask_every_frame == 0:
                 data['bg_seg'].append(self.get_stuff_mask(seq_seg[i]))
 
-        data['videos'] = to_np(data['videos'], self.args.model_name, self.args.backbone)
+        if self.args.uint8_clip:
+            # normalised on the device, see clip_transport.normalize_clip
+            data['videos'] = to_uint8_clip(data['videos'])
+        else:
+            data['videos'] = to_np(data['videos'], self.args.model_name, self.args.backbone)
         if self.args.plot:
             data['raw'] = to_np_no_norm(data['raw'])
         return data
 
     def get_stuff_mask(self, seg_path):
-        img = cv2.imread(os.path.join(seg_path), cv2.IMREAD_COLOR)
-        img = torch.from_numpy(img).type(torch.int).permute(2,0,1)
-        #c, h, w
-        img = torch.sum(img, dim=0)
-        # target = Image.open(os.path.join(seg_path))
-        # target = self.encode_target(target)
-        condition = img == 320
-        condition += img == 511
-        condition += img == 300
-        condition += img == 255
-        condition += img == 142
-        condition += img == 70
-        condition += img == 100
-        condition += img == 90
-        condition += img == 110
-        condition += img == 230
-        condition += img == 162
-        condition += img == 142
-
-        #     CityscapesClass('unlabeled',            0, 255, 'void', 0, False, True, (0, 0, 0)),
-        #     CityscapesClass('ego vehicle',          1, 255, 'void', 0, False, True, (0, 0, 0)),
-        #     CityscapesClass('rectification border', 2, 255, 'void', 0, False, True, (0, 0, 0)),
-        #     CityscapesClass('out of roi',           3, 255, 'void', 0, False, True, (0, 0, 0)),
-        #     CityscapesClass('static',               4, 255, 'void', 0, False, True, (0, 0, 0)),
-        #     CityscapesClass('dynamic',              5, 255, 'void', 0, False, True, (111, 74, 0)), #185
-        #     CityscapesClass('ground',               6, 255, 'void', 0, False, True, (81, 0, 81)),
-          # CityscapesClass('road',                 7, 0, 'flat', 1, False, False, (128, 64, 128)), #256+64=320
-        # # CityscapesClass('sidewalk',             8, 1, 'flat', 1, False, False, (244, 35, 232)),279+232=511
-        #     CityscapesClass('parking',              9, 255, 'flat', 1, False, True, (250, 170, 160)), #420+160=580
-        #     CityscapesClass('rail track',           10, 255, 'flat', 1, False, True, (230, 150, 140)),
-        #     CityscapesClass('building',             11, 2, 'construction', 2, False, False, (70, 70, 70)),
-        #     CityscapesClass('wall',                 12, 3, 'construction', 2, False, False, (102, 102, 156)),
-        #     CityscapesClass('fence',                13, 4, 'construction', 2, False, False, (190, 153, 153)),
-        #     CityscapesClass('guard rail',           14, 255, 'construction', 2, False, True, (180, 165, 180)),
-        #     CityscapesClass('bridge',               15, 255, 'construction', 2, False, True, (150, 100, 100)),
-        #     CityscapesClass('tunnel',               16, 255, 'construction', 2, False, True, (150, 120, 90)),
-        #     CityscapesClass('pole',                 17, 5, 'object', 3, False, False, (153, 153, 153)),
-        #     CityscapesClass('polegroup',            18, 255, 'object', 3, False, True, (153, 153, 153)),
-        #     CityscapesClass('traffic light',        19, 6, 'object', 3, False, False, (250, 170, 30)),
-        #     CityscapesClass('traffic sign',         20, 7, 'object', 3, False, False, (220, 220, 0)),
-        #     CityscapesClass('vegetation',           21, 8, 'nature', 4, False, False, (107, 142, 35)),
-        #     CityscapesClass('terrain',              22, 9, 'nature', 4, False, False, (152, 251, 152)),
-        #     CityscapesClass('sky',                  23, 10, 'sky', 5, False, False, (70, 130, 180)),
-        # # CityscapesClass('person',               24, 11, 'human', 6, True, False, (220, 20, 60)),
-        # # CityscapesClass('rider',                25, 12, 'human', 6, True, False, (255, 0, 0)),
-        # # CityscapesClass('car',                  26, 13, 'vehicle', 7, True, False, (0, 0, 142)),
-        # # CityscapesClass('truck',                27, 14, 'vehicle', 7, True, False, (0, 0, 70)),
-        # # CityscapesClass('bus',                  28, 15, 'vehicle', 7, True, False, (0, 60, 100)),
-        # # CityscapesClass('caravan',              29, 255, 'vehicle', 7, True, True, (0, 0, 90)),
-        # # CityscapesClass('trailer',              30, 255, 'vehicle', 7, True, True, (0, 0, 110)),
-        # # CityscapesClass('train',                31, 16, 'vehicle', 7, True, False, (0, 80, 100)),
-        # # CityscapesClass('motorcycle',           32, 17, 'vehicle', 7, True, False, (0, 0, 230)),
-        # # CityscapesClass('bicycle',              33, 18, 'vehicle', 7, True, False, (119, 11, 32)),
-        # # CityscapesClass('license plate',        -1, 255, 'vehicle', 7, False, True, (0, 0, 142)),
-        condition = ~condition
-        condition = condition.type(torch.int)
-        # condition[:4, :] = 1
-        # condition[-2:, :] = 1
-        condition = condition.type(torch.float32)
+        # packed by stuff_mask.py when available, otherwise an exact colour -> class lookup
+        condition = torch.from_numpy(self.stuff_masks.get(seg_path))
         h, w = condition.shape[0], condition.shape[1]
         condition = torch.reshape(condition, (1, h, w))
         return condition
@@ -403,7 +369,7 @@ def read_box(box_path):
     return box_list
 
 
-def scale(image, model_name=None, pretrain=None):
+def scale(image, model_name=None, pretrain=None, draft=0):
 
     if pretrain == 'oats':
         (width, height) = (224, 224)
@@ -411,7 +377,8 @@ def scale(image, model_name=None, pretrain=None):
         (width, height) = (768, 256)
     # else:
     #     (width, height) = (int(image.width // scale), int(image.height // scale))
-    im_resized = image.resize((width, height), Image.Resampling.LANCZOS)
+    # draft > 0: DCT-scaled JPEG decode down to draft x the output size first
+    im_resized = resize(image, (width, height), draft)
 
     return im_resized
 
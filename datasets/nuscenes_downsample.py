@@ -0,0 +1,91 @@
+import os
+import argparse
+import multiprocessing as mp
+from PIL import Image
+
+# same sizes as nuscenes.scale(), same folder names as TACO
+FOLDER_SIZES = {'downsampled': (768, 256), 'downsampled_224': (224, 224)}
+
+
+def frame_folder(pretrain):
+    return 'downsampled_224' if pretrain == 'oats' else 'downsampled'
+
+
+def _list_jpgs(path):
+    if not os.path.isdir(path):
+        return set()
+    with os.scandir(path) as it:
+        return set(entry.name for entry in it if entry.name.endswith('.jpg'))
+
+
+def cached_folder(root, pretrain, names):
+    """
+        names: CAM_FRONT frame names (without .jpg)
+        return: the pre-resized folder if it holds every frame, otherwise None
+    """
+    folder = frame_folder(pretrain)
+    cached = _list_jpgs(os.path.join(root, folder))
+    if len(cached) == 0:
+        return None
+    missing = sum(1 for n in names if n + '.jpg' not in cached)
+    if missing:
+        print('%s: %d frames missing, resizing CAM_FRONT on the fly (run datasets/nuscenes_downsample.py)'
+              % (folder, missing))
+        return None
+    return folder
+
+
+def thread(root, names, folders, quality, overwrite):
+    """
+        decode each CAM_FRONT frame once and write it at every target size
+    """
+    done = 0
+    for name in names:
+        todo = [f for f in folders
+                if overwrite or not os.path.isfile(os.path.join(root, f, name))]
+        if len(todo) == 0:
+            continue
+        try:
+            img = Image.open(os.path.join(root, 'CAM_FRONT', name)).convert('RGB')
+            for folder in todo:
+                out_path = os.path.join(root, folder, name)
+                tmp_path = out_path + '.tmp%d' % os.getpid()
+                img.resize(FOLDER_SIZES[folder], Image.Resampling.LANCZOS).save(tmp_path, format='JPEG', quality=quality)
+                os.replace(tmp_path, out_path)
+        except Exception as e:
+            print('failed %s: %s' % (name, e))
+            continue
+        done += 1
+    return done
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--root', type=str, help='nuScenes samples path (holding CAM_FRONT)')
+    parser.add_argument('--folders', type=str, nargs='+', default=list(FOLDER_SIZES.keys()),
+                        choices=list(FOLDER_SIZES.keys()))
+    parser.add_argument('--quality', type=int, default=95, help='jpeg quality of the resized frames')
+    parser.add_argument('--chunk', type=int, default=256, help='frames per task')
+    parser.add_argument('--num_workers', type=int, default=12)
+    parser.add_argument('--overwrite', help="resize frames that already exist", action="store_true")
+    args = parser.parse_args()
+
+    for folder in args.folders:
+        if not os.path.isdir(os.path.join(args.root, folder)):
+            os.makedirs(os.path.join(args.root, folder))
+    names = sorted(_list_jpgs(os.path.join(args.root, 'CAM_FRONT')))
+    print('%d CAM_FRONT frames' % len(names))
+
+    pool = mp.Pool(processes=args.num_workers)
+    results = []
+    for i in range(0, len(names), args.chunk):
+        results.append(pool.apply_async(thread, (args.root, names[i:i+args.chunk], args.folders,
+                                                 args.quality, args.overwrite)))
+    pool.close()
+    pool.join()
+    print('%d frames resized' % sum(r.get() for r in results))
+    print("finish")
+
+
+if __name__ == "__main__":
+    main()
@@ -13,6 +13,12 @@ import json
 import random
 from tool import get_rot
 import torchvision.transforms as transforms
+from sample_index import SampleIndex, LabelMatrix
+from frame_pack import FramePacks
+from frame_cache import make_frame_cache, frame_keys, DEFAULT_SLOT_SHAPE
+from clip_transport import to_uint8_clip
+from stuff_mask import StuffMasks
+from tracklet_store import TrackletStore
 
 
 def parse_file_name(file_name):
@@ -77,14 +83,18 @@ class OATS(Dataset):
         self.scenarios = []
         self.args =args
 
-        self.videos_list = []
-        self.seg_list = []
-        self.obj_seg_list = []
-
-        self.idx = []
-        self.gt_ego = []
-        self.gt_actor = []
-        self.slot_eval_gt = []
+        # windows and labels live in flat numpy arrays (see sample_index.py)
+        self.samples = SampleIndex({'video': '%03d.jpg', 'seg': '%03d.png', 'idx': None})
+        self.labels = LabelMatrix()
+        self.stuff_masks = StuffMasks(top_rows=4, bottom_rows=2)
+        # 'packed' reads windows out of the per-folder .npy written by frame_pack.py
+        self.frame_packs = FramePacks() if args.frame_store == 'packed' else None
+        # decoded frames shared by the windows of a scenario (--windows_per_scenario),
+        # or by every worker with --frame_cache_mb (see frame_cache.py)
+        slot_shape = DEFAULT_SLOT_SHAPE if args.pretrain == 'taco' else (224, 224, 3)
+        # a single window per scenario reuses no frame, nothing is kept then
+        max_frames = args.windows_per_scenario * self.seq_len if args.windows_per_scenario > 1 else 0
+        self.frame_cache = make_frame_cache(args, slot_shape, max_frames)
         self.confusion_label_list = []
 
 
@@ -163,6 +173,8 @@ class OATS(Dataset):
         else:
             downsample_folder = 'downsampled_224'
             segmentation_folder = '_segmentation_28x28'
+        self.splits = splits
+        self.downsample_folder = downsample_folder
             
         for scenario in tqdm(scenarios, file=sys.stdout):
             scenario_path = os.path.join(root, downsample_folder, 'scenario_' + scenario)
@@ -173,7 +185,6 @@ class OATS(Dataset):
             check_data.sort()
             videos = []
             segs = []
-            obj_f = []
             idx = []
 
             start_frame = int(check_data[0].split('/')[-1].split('.')[0])
@@ -195,10 +206,10 @@ class OATS(Dataset):
                     imgname = f"{str(i).zfill(3)}.jpg"
                     segname = f"{str(i).zfill(3)}.png"
                     if os.path.isfile(os.path.join(scenario_path, imgname)):
-                        videos_temp.append(os.path.join(scenario_path, imgname))
+                        videos_temp.append(i)
                         idx_temp.append(i-start_frame)
                     if os.path.isfile(os.path.join(seg_video_path, segname)):
-                        seg_temp.append(os.path.join(seg_video_path, segname))
+                        seg_temp.append(i)
                     # if os.path.isfile(v+"/seg_mask/"+objname):
                     #     obj_temp.append(v+"/seg_mask/"+objname)
                     if len(videos_temp) == self.seq_len:
@@ -229,16 +240,13 @@ class OATS(Dataset):
                 continue
 
             self.scenarios.append(scenario)
-            self.videos_list.append(videos)
-            self.idx.append(idx)
-            self.seg_list.append(segs)
-            self.obj_seg_list.append(obj_f)
+            self.samples.append({'video': videos, 'seg': segs, 'idx': idx},
+                                {'video': scenario_path, 'seg': seg_video_path})
             
             if ('slot' in args.model_name and not args.allocated_slot) or args.box:
-                self.gt_actor.append(proposal_train_label)
-                self.slot_eval_gt.append(gt_actor)
+                self.labels.append(actor=proposal_train_label, slot_eval_gt=gt_actor)
             else:
-                self.gt_actor.append(gt_actor)
+                self.labels.append(actor=gt_actor)
 
 
             # -----------statstics--------------
@@ -248,6 +256,9 @@ class OATS(Dataset):
                 min_frame_a_video = num_frame
             total_frame += num_frame
             total_videos += 1
+        self.samples.finalize()
+        self.labels.finalize()
+        self.scenarios = np.array(self.scenarios)
         if self.args.box:
             self.parse_tracklets_detection() 
         print('c_stat:')
@@ -275,107 +286,77 @@ class OATS(Dataset):
 
     def parse_tracklets_detection(self):
         """
-            read {scenario}/tracking_pred_2/tracks/front.txt
+            read {scenario}/pred/{scenario}.txt
             format: frame, id, x, y, w, h
+            into one [num_windows, T, Max_N, 4] store for the split (see tracklet_store.py)
         """
-        
-        def parse_tracklet():
-            # frame_id: {id: [x,y,w,h]}
-            out = {}
-            for line in tracklet:
-                line = line.split(' ')[:6]
-                frame = int(line[0])
-                obj_id = int(line[1])
-                box = [int(line[2]),int(line[3]),int(line[2])+int(line[4]),int(line[3])+int(line[5])]
-                if frame not in out:
-                    out[frame] = {}
-                out[frame][obj_id] = box
-            return out
-            
-        
-        for data,idx in tqdm(zip(self.videos_list,self.idx)):
-            root = data[0][0].split('/')
-            scenario = root[-2]
-            root = root[:-1]
-            root = '/'+os.path.join(*root)
-
-            if not os.path.isdir(os.path.join(root,'tracks_pred')):
-                os.mkdir(os.path.join(root,'tracks_pred'))
-            f = open(os.path.join(root,'pred',scenario+'.txt'))
-            tracklet = f.readlines()
-            # parse_tracklet
-            tracklet = parse_tracklet()
-            f.close()
-            # for every sample]
-            assert len(data) == len(idx)
-            for i,idx_list in enumerate(idx):
-                out = np.zeros((self.seq_len,self.Max_N,4))
-                obj_id_dict = {}
-                # tracklet id
-                count = 0
-                # img frame id
-                for j,index in enumerate(idx_list):
-                    try:
-                        for obj_id in tracklet[int(index)+1]:
-                            if obj_id not in obj_id_dict:
-                                obj_id_dict[obj_id] = count
-                                count += 1
-                            try:
-                                out[j][obj_id_dict[obj_id]] = tracklet[int(index)+1][obj_id]
-                            except:
-                                continue
-                    except:
-                        continue
-                np.save(os.path.join(root,'tracks_pred','%s' % (i)),out)        
+        self.tracklets = TrackletStore(self.args.root, 'oats_' + '_'.join(self.splits), self.seq_len, self.Max_N,
+                                    video_folder=self.downsample_folder,
+                                    index_dir=self.args.index_dir,
+                                    rebuild=self.args.rebuild_index)
+        sources = []
+        for scenario_idx in range(len(self.samples)):
+            root = self.samples.prefix('video', scenario_idx)
+            scenario = os.path.basename(root)
+            sources.append((scenario, os.path.join(root,'pred',scenario+'.txt'), self.samples.windows('idx', scenario_idx)))
+        self.tracklets.build(sources)
 
     def __len__(self):
         """Returns the length of the dataset. """
-        return len(self.videos_list)
+        return len(self.samples)
 
     def __getitem__(self, index):
         """Returns the item at index idx. """
+        # (index, sample_idx) from window_sampler.ScenarioWindowSampler picks the window
+        sample_idx = None
+        if isinstance(index, tuple):
+            index, sample_idx = index
         data = dict()
         data['videos'] = []
         data['bg_seg'] = []
         data['obj_masks'] = []
         # data['box'] = []
         data['raw'] = []
-        data['actor'] = self.gt_actor[index]
-        data['scenario'] = self.scenarios[index]
+        data['actor'] = self.labels.get('actor', index)
+        data['scenario'] = str(self.scenarios[index])
 
         if ('slot' in self.args.model_name and not self.args.allocated_slot) or self.args.box:
-            data['slot_eval_gt'] = self.slot_eval_gt[index]
+            data['slot_eval_gt'] = self.labels.get('slot_eval_gt', index)
 
-        if self.training:
-            sample_idx = random.randint(0, len(self.videos_list[index])-1)
-        else:
-            sample_idx = len(self.videos_list[index])//2
+        num_windows = self.samples.num_windows(index)
+        if sample_idx is None:
+            if self.training:
+                sample_idx = random.randint(0, num_windows-1)
+            else:
+                sample_idx = num_windows//2
 
-        seq_videos = self.videos_list[index][sample_idx]
+        seq_videos = self.samples.paths('video', index, sample_idx)
+        if self.args.frame_feature_cache_mb > 0:
+            # frozen 2D backbone blocks run once per frame, see models/frame_features.py
+            data['frame_keys'] = torch.from_numpy(frame_keys(seq_videos))
         if self.args.bg_mask:
-            seq_seg = self.seg_list[index][sample_idx]
-        if self.args.obj_mask:
-            obj_masks_list = self.obj_seg_list[index][sample_idx]
+            seq_seg = self.samples.paths('seg', index, sample_idx)
         # if self.box:
         #     seq_box = self.box_list[index][sample_idx]
 
         # add tracklets
         if self.args.box:
-            track_path = seq_videos[0].split('/')
-            track_path = track_path[:-1]
-            track_path = '/' + os.path.join(*track_path,'tracks_pred',str(sample_idx)) + '.npy'
-            tracklets = np.load(track_path)
-            data['box'] = tracklets
+            data['box'] = self.tracklets.get(index, sample_idx)
+
+        if self.frame_packs is not None:
+            seq_frames = self.frame_packs.window(self.samples.prefix('video', index),
+                                                self.samples.window('video', index, sample_idx))
 
         for i in range(self.seq_len):
-            x = Image.open(seq_videos[i]).convert('RGB')
+            if self.frame_packs is not None:
+                x = seq_frames[i]
+            else:
+                x = self.frame_cache.open(seq_videos[i])
             data['videos'].append(x)
             if self.args.plot:
                 data['raw'].append(x)
             if self.args.bg_mask and i %self.args.mask_every_frame == 0:
                 data['bg_seg'].append(self.get_stuff_mask(seq_seg[i]))
-            if self.args.obj_mask and i % self.mask_every_frame:
-                data['obj_masks'].append(get_obj_mask(obj_masks_list[i]))
         if self.args.plot:
             data['raw'] = to_np_no_norm(data['raw'], self.args.model_name)
             
@@ -390,36 +371,16 @@ class OATS(Dataset):
         # out.release()
         # raise BaseException
         
-        data['videos'] = to_np(data['videos'], self.args.model_name, self.args.backbone)
+        if self.args.uint8_clip:
+            # normalised on the device, see clip_transport.normalize_clip
+            data['videos'] = to_uint8_clip(data['videos'])
+        else:
+            data['videos'] = to_np(data['videos'], self.args.model_name, self.args.backbone)
         return data
 
     def get_stuff_mask(self, seg_path):
-        img = cv2.imread(os.path.join(seg_path), cv2.IMREAD_COLOR)
-        img = torch.from_numpy(img).type(torch.int).permute(2,0,1)
-        #c, h, w
-        img = torch.sum(img, dim=0)
-        # target = Image.open(os.path.join(seg_path))
-        # target = self.encode_target(target)
-        condition = img == 320
-        condition += img == 511
-        condition += img == 300
-        condition += img == 255
-        condition += img == 142
-        condition += img == 70
-        condition += img == 100
-        condition += img == 90
-        condition += img == 110
-        condition += img == 230
-        condition += img == 162
-        condition += img == 142
-
-        condition = ~condition
-        condition = condition.type(torch.int)
-        condition[:4, :] = 1
-        condition[-2:, :] = 1
-        condition = condition.type(torch.float32)
-
-        return condition
+        # packed by stuff_mask.py when available, otherwise an exact colour -> class lookup
+        return torch.from_numpy(self.stuff_masks.get(seg_path))
 
 def get_obj_mask(obj_path):
     seg_dict = np.load(obj_path)
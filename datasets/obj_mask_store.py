@@ -0,0 +1,140 @@
+import os
+import argparse
+import numpy as np
+from pack_jobs import folder_stamp, is_fresh, run_pool
+
+MASK_H, MASK_W = 32, 96
+MASK_BYTES = MASK_H * MASK_W // 8
+
+
+def store_path(object_dir):
+    """
+        mask/object/*.npy -> mask/object.npz (frames, offsets, stamp) and
+        mask/object_bits.npy, next to the folder so the per-frame listing
+        used by the window scan is left untouched
+    """
+    object_dir = os.path.normpath(object_dir)
+    return object_dir + '.npz', object_dir + '_bits.npy'
+
+
+def _stored_stamp(object_dir):
+    meta_path, bits_path = store_path(object_dir)
+    if not os.path.isfile(meta_path) or not os.path.isfile(bits_path):
+        return None
+    try:
+        with np.load(meta_path) as meta:
+            return str(meta['stamp']) if 'stamp' in meta.files else None
+    except (OSError, ValueError):
+        return None
+
+
+def is_packed(object_dir):
+    # instance_object_mask.py rewrites the masks in place with np.save
+    return is_fresh(_stored_stamp(object_dir), object_dir, '.npy')
+
+
+def pack_object_masks(object_dir, overwrite=False):
+    """
+        Pack the per-frame bool [n, 32, 96] masks of one scenario:
+            frames  int32 [F]        frame number of every entry
+            offsets int64 [F+1]      masks of frame f are bits[offsets[f]:offsets[f+1]]
+            stamp                    folder_stamp() of the packed files
+            bits    uint8 [M, 384]   np.packbits of every flattened mask (_bits.npy)
+    """
+    if not overwrite and is_packed(object_dir):
+        return 0
+    stamp = folder_stamp(object_dir, '.npy')
+    names = [n for n in os.listdir(object_dir) if n.endswith('.npy') and n.split('.')[0].isdigit()]
+    if len(names) == 0:
+        return 0
+    names.sort(key=lambda n: int(n.split('.')[0]))
+    frames = np.array([int(n.split('.')[0]) for n in names], dtype=np.int32)
+    offsets = np.zeros(len(names)+1, dtype=np.int64)
+    bits = []
+    for i, name in enumerate(names):
+        masks = np.load(os.path.join(object_dir, name)).astype(bool).reshape(-1, MASK_H, MASK_W)
+        offsets[i+1] = offsets[i] + masks.shape[0]
+        bits.append(np.packbits(masks.reshape(masks.shape[0], -1), axis=1))
+
+    meta_path, bits_path = store_path(object_dir)
+    tmp_bits = bits_path + '.tmp%d.npy' % os.getpid()
+    np.save(tmp_bits, np.concatenate(bits, 0))
+    tmp_meta = meta_path + '.tmp%d.npz' % os.getpid()
+    np.savez(tmp_meta, frames=frames, offsets=offsets, stamp=np.array(stamp))
+    # the meta (and its stamp) goes last: a valid stamp implies the bits are written
+    os.replace(tmp_bits, bits_path)
+    os.replace(tmp_meta, meta_path)
+    return int(offsets[-1])
+
+
+class ObjMaskStore(object):
+    """
+        Reads the packed masks of a window. Only the packed bits cross the
+        worker -> main process boundary, the loss unpacks them on the device.
+
+        Every scenario is opened once per worker: its frames and offsets are
+        kept, the bits are a read-only memmap, and the stamp is checked
+        against the mask files at that point.
+    """
+
+    def __init__(self):
+        self.stores = {}
+
+    def open(self, object_dir):
+        meta_path, bits_path = store_path(object_dir)
+        stamp = _stored_stamp(object_dir)
+        if stamp is None:
+            raise FileNotFoundError('%s is not packed, run datasets/obj_mask_store.py first' % object_dir)
+        if not is_fresh(stamp, object_dir, '.npy'):
+            raise ValueError('%s: mask store is out of date, rerun datasets/obj_mask_store.py' % object_dir)
+        with np.load(meta_path) as meta:
+            store = (meta['frames'], meta['offsets'], np.load(bits_path, mmap_mode='r'))
+        self.stores[object_dir] = store
+        return store
+
+    def window(self, object_dir, frames):
+        """
+            frames: frame numbers of the supervised frames
+            return: bits uint8 [sum(count), 384], count int64 [len(frames)]
+        """
+        store = self.stores.get(object_dir)
+        if store is None:
+            store = self.open(object_dir)
+        store_frames, offsets, bits = store
+        rows = np.minimum(np.searchsorted(store_frames, frames), len(store_frames)-1)
+        if not np.array_equal(store_frames[rows], frames):
+            raise ValueError('%s: mask store is out of date, rerun datasets/obj_mask_store.py' % object_dir)
+        count = (offsets[rows+1] - offsets[rows]).astype(np.int64)
+        if len(rows) == 0:
+            return np.zeros((0, MASK_BYTES), dtype=np.uint8), count
+        out = np.concatenate([bits[offsets[r]:offsets[r+1]] for r in rows], 0)
+        return out, count
+
+    def __getstate__(self):
+        # never ship open maps to the workers
+        return {'stores': {}}
+
+
+def find_object_dirs(root):
+    out = []
+    for dirpath, subdirs, files in os.walk(root):
+        if os.path.basename(dirpath) == 'mask' and 'object' in subdirs:
+            out.append(os.path.join(dirpath, 'object'))
+            subdirs[:] = []
+    return sorted(out)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--root', type=str, help='dataset path')
+    parser.add_argument('--num_workers', type=int, default=12)
+    parser.add_argument('--overwrite', help="repack up-to-date scenarios", action="store_true")
+    args = parser.parse_args()
+
+    object_dirs = find_object_dirs(args.root)
+    print('%d object mask folders' % len(object_dirs))
+    run_pool(pack_object_masks, object_dirs, (args.overwrite,), args.num_workers, 'masks')
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+import os
+import hashlib
+import multiprocessing as mp
+
+
+def mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def folder_stamp(folder, exts):
+    """
+        hash of (name, size, mtime) of every file of the folder ending in exts.
+        The folder mtime only moves when files are added or removed, rewriting a
+        file in place (np.save, cv2.imwrite, a new DeepLab run) leaves it alone.
+    """
+    h = hashlib.sha1()
+    with os.scandir(folder) as it:
+        entries = sorted((e.name, e.stat()) for e in it if e.name.endswith(exts))
+    for name, st in entries:
+        h.update(('%s %d %d\n' % (name, st.st_size, st.st_mtime_ns)).encode('utf-8'))
+    return h.hexdigest()
+
+
+def is_fresh(stamp, folder, exts):
+    """
+        stamp: the folder_stamp() stored with a pack, None if there is no pack
+    """
+    return stamp is not None and os.path.isdir(folder) and stamp == folder_stamp(folder, exts)
+
+
+def _run(fn, item, args, unit):
+    try:
+        n = fn(item, *args)
+    except Exception as e:
+        print('failed %s: %s' % (item, e))
+        return
+    if n:
+        print('%s: %d %s' % (item, n, unit))
+
+
+def run_pool(fn, items, args=(), num_workers=12, unit='items'):
+    """
+        fn(item, *args) for every item on a process pool, fn returns the number
+        of entries it packed (0: up to date)
+    """
+    pool = mp.Pool(processes=num_workers)
+    for item in items:
+        pool.apply_async(_run, (fn, item, args, unit))
+    pool.close()
+    pool.join()
+    print("finish")
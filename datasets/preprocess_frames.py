@@ -0,0 +1,219 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import multiprocessing as mp
+from PIL import Image
+
+SOURCE_EXTS = ('.jpg', '.png')
+
+# folder:size:format, size is full, half (the old scale=2.0) or WxH
+PRESETS = {
+    'taco': ['downsampled:half:jpg', 'downsampled_224:224x224:jpg'],
+    'oats': ['downsampled_256x768:768x256:jpg', 'downsampled_224:224x224:jpg'],
+}
+
+
+def parse_target(spec):
+    folder, size, fmt = spec.split(':')
+    if size not in ('full', 'half'):
+        w, h = size.lower().split('x')
+        size = (int(w), int(h))
+    if fmt not in ('jpg', 'png'):
+        raise ValueError('%s: format must be jpg or png' % spec)
+    return folder, size, fmt
+
+
+def taco_sources(root):
+    """
+        {scenario}/rgb/front -> {scenario}/rgb/{folder}
+    """
+    out = []
+    for dirpath, subdirs, files in os.walk(root):
+        if os.path.basename(dirpath) == 'rgb':
+            if 'front' in subdirs:
+                out.append((os.path.join(dirpath, 'front'), dirpath))
+            subdirs[:] = []
+    return sorted(out)
+
+
+def oats_sources(root):
+    """
+        {root}/images/{scenario} -> {root}/{folder}/{scenario}
+    """
+    out = []
+    images = os.path.join(root, 'images')
+    for scenario in os.listdir(images):
+        # the segmentation folders of DeepLab live next to the frames
+        if 'segmentation' in scenario or not os.path.isdir(os.path.join(images, scenario)):
+            continue
+        out.append((os.path.join(images, scenario), (root, scenario)))
+    return sorted(out)
+
+
+def out_dir(dataset, dest, folder):
+    if dataset == 'taco':
+        return os.path.join(dest, folder)
+    root, scenario = dest
+    return os.path.join(root, folder, scenario)
+
+
+def list_frames(src_dir):
+    with os.scandir(src_dir) as it:
+        return sorted(entry.name for entry in it if entry.name.endswith(SOURCE_EXTS))
+
+
+def resize(img, size):
+    if size == 'full':
+        return img
+    if size == 'half':
+        size = (int(img.width // 2.0), int(img.height // 2.0))
+    return img.resize(size, Image.Resampling.LANCZOS)
+
+
+def thread(dataset, src_dir, dest, names, targets, quality, remove_png):
+    """
+        decode every frame of the chunk once and write it to every target
+        return: (frames decoded, files written, failures)
+    """
+    out_dirs = [out_dir(dataset, dest, folder) for folder, _, _ in targets]
+    for d in out_dirs:
+        os.makedirs(d, exist_ok=True)
+    decoded, written, failed = 0, 0, []
+    for name in names:
+        src_path = os.path.join(src_dir, name)
+        try:
+            img = Image.open(src_path).convert('RGB')
+            decoded += 1
+            for d, (folder, size, fmt) in zip(out_dirs, targets):
+                out_path = os.path.join(d, os.path.splitext(name)[0] + '.' + fmt)
+                if out_path == src_path:
+                    continue
+                tmp_path = out_path + '.tmp%d' % os.getpid()
+                if fmt == 'jpg':
+                    # PIL's default quality (75) is what the old scripts wrote
+                    resize(img, size).save(tmp_path, format='JPEG', quality=quality)
+                else:
+                    resize(img, size).save(tmp_path, format='PNG')
+                os.replace(tmp_path, out_path)
+                written += 1
+            if remove_png and name.endswith('.png'):
+                os.remove(src_path)
+        except Exception as e:
+            failed.append('%s: %s' % (src_path, e))
+    return decoded, written, failed
+
+
+class Manifest(object):
+    """
+        Append-only json lines, one per finished chunk. A chunk is keyed on its
+        source folder, its first and last frame, its size and the target specs,
+        so a rerun skips finished chunks without looking at their outputs.
+    """
+
+    def __init__(self, path, targets_key):
+        self.path = path
+        self.targets_key = targets_key
+        self.done = set()
+        if os.path.isfile(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # torn last line of an interrupted run
+                        continue
+                    self.done.add(self.key(entry['src'], entry['first'], entry['last'], entry['n'], entry['targets']))
+        self.f = open(path, 'a')
+
+    def key(self, src, first, last, n, targets_key=None):
+        return (src, first, last, n, targets_key or self.targets_key)
+
+    def is_done(self, src, names):
+        return self.key(src, names[0], names[-1], len(names)) in self.done
+
+    def add(self, src, names):
+        self.f.write(json.dumps({'src': src, 'first': names[0], 'last': names[-1], 'n': len(names),
+                                 'targets': self.targets_key}) + '\n')
+        self.f.flush()
+
+    def close(self):
+        self.f.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--root', type=str, help='dataset path')
+    parser.add_argument('--dataset', type=str, default='taco', choices=list(PRESETS.keys()))
+    parser.add_argument('--targets', type=str, nargs='+', default=None,
+                        help='folder:size:format, size = full | half | WxH, format = jpg | png '
+                             '(default: every folder the loaders read, e.g. downsampled:half:jpg downsampled_224:224x224:jpg for taco). '
+                             'front:full:jpg converts png frames in place (the old process.py)')
+    parser.add_argument('--quality', type=int, default=75, help='jpeg quality')
+    parser.add_argument('--remove_png', help="delete png source frames once converted", action="store_true")
+    parser.add_argument('--chunk', type=int, default=256, help='frames of one scenario per task')
+    parser.add_argument('--num_workers', type=int, default=12)
+    parser.add_argument('--manifest', type=str, default=None, help='default: {root}/preprocess_{dataset}.jsonl')
+    parser.add_argument('--overwrite', help="ignore the manifest and redo every chunk", action="store_true")
+    args = parser.parse_args()
+
+    specs = args.targets or PRESETS[args.dataset]
+    targets = [parse_target(spec) for spec in specs]
+    targets_key = hashlib.sha1(json.dumps([specs, args.quality]).encode('utf-8')).hexdigest()[:16]
+    manifest_path = args.manifest or os.path.join(args.root, 'preprocess_%s.jsonl' % args.dataset)
+    if args.overwrite and os.path.isfile(manifest_path):
+        os.remove(manifest_path)
+    manifest = Manifest(manifest_path, targets_key)
+
+    sources = taco_sources(args.root) if args.dataset == 'taco' else oats_sources(args.root)
+    print('%d source folders -> %s' % (len(sources), ' '.join(specs)))
+
+    stats = {'chunks': 0, 'decoded': 0, 'written': 0, 'failed': 0}
+    start = time.time()
+
+    def done(src, names):
+        def callback(result):
+            decoded, written, failed = result
+            for msg in failed:
+                print('failed ' + msg)
+            if not failed:
+                manifest.add(src, names)
+            stats['chunks'] += 1
+            stats['decoded'] += decoded
+            stats['written'] += written
+            stats['failed'] += len(failed)
+            elapsed = time.time() - start
+            print('%d/%d chunks, %d frames, %.1f frames/s, %.1f files/s' % (
+                stats['chunks'], num_chunks, stats['decoded'], stats['decoded']/elapsed, stats['written']/elapsed))
+            sys.stdout.flush()
+        return callback
+
+    pool = mp.Pool(processes=args.num_workers)
+    num_chunks = 0
+    skipped = 0
+    for src_dir, dest in sources:
+        names = list_frames(src_dir)
+        src = os.path.relpath(src_dir, args.root)
+        for i in range(0, len(names), args.chunk):
+            chunk = names[i:i+args.chunk]
+            if manifest.is_done(src, chunk):
+                skipped += 1
+                continue
+            num_chunks += 1
+            pool.apply_async(thread, (args.dataset, src_dir, dest, chunk, targets, args.quality, args.remove_png),
+                             callback=done(src, chunk))
+    print('%d chunks to do, %d already in %s' % (num_chunks, skipped, manifest_path))
+    pool.close()
+    pool.join()
+    manifest.close()
+
+    elapsed = time.time() - start
+    print('%d frames decoded, %d files written, %d failed in %.1fs (%.1f frames/s)' % (
+        stats['decoded'], stats['written'], stats['failed'], elapsed, stats['decoded']/max(elapsed, 1e-6)))
+    print("finish")
+
+
+if __name__ == "__main__":
+    main()
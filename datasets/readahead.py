@@ -0,0 +1,111 @@
+import os
+import threading
+
+READ_CHUNK = 1 << 20
+
+
+def window_files(dataset):
+    """
+        (index, sample_idx) -> frame and mask files the dataset's __getitem__ will open
+    """
+    args = dataset.args
+    streams = []
+    if args.frame_store != 'packed':
+        streams.append('video')
+    if args.bg_mask and 'seg' in dataset.samples.streams:
+        streams.append('seg')
+    if args.obj_mask and args.obj_mask_store != 'packed' and 'obj' in dataset.samples.streams:
+        streams.append('obj')
+
+    def files(index, sample_idx):
+        # no frames to warm once a feature cache is attached (feature_cache.py)
+        skip = 'video' if getattr(dataset, 'features', None) is not None else None
+        return [p for s in streams if s != skip for p in dataset.samples.paths(s, index, sample_idx)]
+    return files
+
+
+def evict(paths):
+    """
+        drop the clean pages of these files from the page cache (cold-cache runs without root)
+    """
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            continue
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+class Readahead(object):
+    """
+        Background thread that walks the sampler's order of the epoch and warms the
+        page cache for the `depth` samples after the one the sampler just handed out:
+            'fadvise'  posix_fadvise(WILLNEED), the kernel reads asynchronously
+            'read'     reads the files (network filesystems may ignore fadvise)
+
+        The sampler calls start(order) at the beginning of every epoch and advance()
+        for every sample it yields, so the thread never runs more than depth
+        samples ahead and forgets the previous epoch's order.
+    """
+
+    def __init__(self, files, depth=64, mode='fadvise'):
+        self.files = files
+        self.depth = depth
+        self.mode = mode
+        self.cond = threading.Condition()
+        self.order = []
+        self.pos = 0
+        self.consumed = 0
+        self.thread = None
+        self.num_files = 0
+        self.num_bytes = 0
+
+    def start(self, order):
+        with self.cond:
+            self.order = list(order)
+            self.pos = 0
+            self.consumed = 0
+            self.cond.notify()
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def advance(self):
+        with self.cond:
+            self.consumed += 1
+            self.cond.notify()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.pos >= len(self.order) or self.pos >= self.consumed + self.depth:
+                    self.cond.wait()
+                item = self.order[self.pos]
+                self.pos += 1
+            for path in self.files(*item):
+                self._prefetch(path)
+
+    def _prefetch(self, path):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except OSError:
+            return
+        try:
+            if self.mode == 'fadvise':
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+                self.num_bytes += os.fstat(fd).st_size
+            else:
+                while True:
+                    n = len(os.read(fd, READ_CHUNK))
+                    self.num_bytes += n
+                    if n < READ_CHUNK:
+                        break
+            self.num_files += 1
+        finally:
+            os.close(fd)
+
+    def report(self):
+        return '%d files, %.1f MB read ahead (%s)' % (self.num_files, self.num_bytes / 1e6, self.mode)
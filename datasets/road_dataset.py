@@ -15,6 +15,11 @@ from tool import get_rot
 import torchvision.transforms as transforms
 # from torchvideotransforms import video_transforms, volume_transforms
 from collections import namedtuple
+from sample_index import SampleIndex, LabelMatrix
+from stuff_mask import StuffMasks
+from frame_cache import make_frame_cache
+from road_video import RoadVideos
+from jpeg_draft import resize, draft_tag
 
 def parse_file_name(file_name):
     name = file_name.split('/')
@@ -48,13 +53,15 @@ class ROAD(Dataset):
         self.variants = []
         self.args =args
 
-        self.front_list = []
-        self.seg_front_list = []
-
-        self.idx = []
-        self.ego_list = []
-        self.actor_list = []
-        self.slot_eval_gt = []
+        # windows and labels live in flat numpy arrays (see sample_index.py)
+        self.samples = SampleIndex({'front': '%05d.jpg', 'seg_front': '%05d.png', 'idx': None})
+        self.labels = LabelMatrix()
+        self.stuff_masks = StuffMasks(top_rows=4, bottom_rows=2)
+        # --frame_cache_mb shares the resized frames across workers (see frame_cache.py)
+        self.frame_cache = make_frame_cache(args)
+        # --road_videos decodes the windows straight from the source videos (see road_video.py)
+        self.videos = RoadVideos(args.road_videos, args.index_dir) if args.road_videos else None
+        self.video_ids = []
 
 
         self.step = []
@@ -98,6 +105,8 @@ class ROAD(Dataset):
             print(v_id)
             video_path = os.path.join(root, v_id)
             seg_video_path = os.path.join(root, v_id+'_segmentation')
+            if self.videos is not None:
+                num_video_frames = self.videos.num_frames(v_id)
             with open('../datasets/road/'+v_id+'.txt') as f:
                 for line in f:
                     line = line.replace('\n', '')
@@ -130,11 +139,15 @@ class ROAD(Dataset):
                         for i in range(start, end_frame+1, step):
                             imgname = f"{str(i).zfill(5)}.jpg"
                             segname = f"{str(i).zfill(5)}.png"
-                            if os.path.isfile(video_path+"/"+imgname):
-                                front_temp.append(video_path+"/"+imgname)
+                            if self.videos is not None:
+                                frame_exists = 1 <= i <= num_video_frames
+                            else:
+                                frame_exists = os.path.isfile(video_path+"/"+imgname)
+                            if frame_exists:
+                                front_temp.append(i)
                                 idx_temp.append(i-start)
                             if os.path.isfile(seg_video_path+"/"+segname):
-                                seg_f_temp.append(seg_video_path+"/"+segname)
+                                seg_f_temp.append(i)
 
                             if len(front_temp) == seq_len:
                                 break
@@ -145,12 +158,10 @@ class ROAD(Dataset):
                             idx.append(idx_temp)
 
 
-                    self.front_list.append(fronts)
-                    self.seg_front_list.append(segs_f)
-                    self.idx.append(idx)
-                    self.ego_list.append(ego_gt)
-                    
-                    self.actor_list.append(actor_gt)
+                    self.samples.append({'front': fronts, 'seg_front': segs_f, 'idx': idx},
+                                        {'front': video_path, 'seg_front': seg_video_path})
+                    self.labels.append(ego=ego_gt, actor=actor_gt)
+                    self.video_ids.append(v_id)
 
                     # -----------statstics--------------
                     if num_frame > max_frame_a_video:
@@ -160,6 +171,10 @@ class ROAD(Dataset):
                     total_frame += num_frame
                     total_videos += 1
 
+        self.samples.finalize()
+        self.labels.finalize()
+        self.video_ids = np.array(self.video_ids)
+
         print('actor_stat:')
         print(actor_stat_table)
         print('ped_stat')
@@ -180,33 +195,45 @@ class ROAD(Dataset):
 
     def __len__(self):
         """Returns the length of the dataset. """
-        return len(self.front_list)
+        return len(self.samples)
 
     def __getitem__(self, index):
         """Returns the item at index idx. """
         data = dict()
         data['fronts'] = []
         data['seg_front'] = []
-        data['ego'] = self.ego_list[index]
-        data['actor'] = self.actor_list[index]
+        data['ego'] = self.labels.get('ego', index)
+        data['actor'] = self.labels.get('actor', index)
 
 
         # if ('slot' in self.model_name and not self.args.fix_slot) or self.args.box:
         #     data['slot_eval_gt'] = self.slot_eval_gt[index]
 
+        num_windows = self.samples.num_windows(index)
         if self.training:
-            sample_idx = random.randint(0, len(self.front_list[index])-1)
+            if self.videos is not None:
+                # windows close behind a keyframe, see road_video.py
+                sample_idx = self.videos.pick_window(str(self.video_ids[index]), self.samples.windows('front', index))
+            else:
+                sample_idx = random.randint(0, num_windows-1)
         else:
-            sample_idx = len(self.front_list[index])//2
+            sample_idx = num_windows//2
 
-        seq_fronts = self.front_list[index][sample_idx]
+        seq_fronts = self.samples.paths('front', index, sample_idx)
         if self.seg:
-            seq_seg_front = self.seg_front_list[index][sample_idx]
+            seq_seg_front = self.samples.paths('seg_front', index, sample_idx)
 
 
+        if self.videos is not None:
+            # decoded at 768x256, as scale() leaves the jpg frames
+            seq_frames = self.videos.read(str(self.video_ids[index]), self.samples.window('front', index, sample_idx))
+
         for i in range(self.seq_len):
-            x = Image.open(seq_fronts[i]).convert('RGB')
-            x = scale(x)
+            if self.videos is not None:
+                x = seq_frames[i]
+            else:
+                x = self.frame_cache.open(seq_fronts[i], lambda img: scale(img, self.args.jpeg_draft),
+                                        tag='768x256' + draft_tag(self.args.jpeg_draft))
             data['fronts'].append(x)
             if self.seg:
                 data['seg_front'].append(self.get_stuff_mask(seq_seg_front[i]))
@@ -219,73 +246,15 @@ class ROAD(Dataset):
     #     return cls.id_to_train_id[np.array(target)]
 
     def get_stuff_mask(self, seg_path):
-        img = cv2.imread(os.path.join(seg_path), cv2.IMREAD_COLOR)
-        img = torch.from_numpy(img).type(torch.int).permute(2,0,1)
-        #c, h, w
-        img = torch.sum(img, dim=0)
-        # target = Image.open(os.path.join(seg_path))
-        # target = self.encode_target(target)
-        condition = img == 320
-        condition += img == 511
-        condition += img == 300
-        condition += img == 255
-        condition += img == 142
-        condition += img == 70
-        condition += img == 100
-        condition += img == 90
-        condition += img == 110
-        condition += img == 230
-        condition += img == 162
-        condition += img == 142
-
-        #     CityscapesClass('unlabeled',            0, 255, 'void', 0, False, True, (0, 0, 0)),
-        #     CityscapesClass('ego vehicle',          1, 255, 'void', 0, False, True, (0, 0, 0)),
-        #     CityscapesClass('rectification border', 2, 255, 'void', 0, False, True, (0, 0, 0)),
-        #     CityscapesClass('out of roi',           3, 255, 'void', 0, False, True, (0, 0, 0)),
-        #     CityscapesClass('static',               4, 255, 'void', 0, False, True, (0, 0, 0)),
-        #     CityscapesClass('dynamic',              5, 255, 'void', 0, False, True, (111, 74, 0)), #185
-        #     CityscapesClass('ground',               6, 255, 'void', 0, False, True, (81, 0, 81)),
-          # CityscapesClass('road',                 7, 0, 'flat', 1, False, False, (128, 64, 128)), #256+64=320
-        # # CityscapesClass('sidewalk',             8, 1, 'flat', 1, False, False, (244, 35, 232)),279+232=511
-        #     CityscapesClass('parking',              9, 255, 'flat', 1, False, True, (250, 170, 160)), #420+160=580
-        #     CityscapesClass('rail track',           10, 255, 'flat', 1, False, True, (230, 150, 140)),
-        #     CityscapesClass('building',             11, 2, 'construction', 2, False, False, (70, 70, 70)),
-        #     CityscapesClass('wall',                 12, 3, 'construction', 2, False, False, (102, 102, 156)),
-        #     CityscapesClass('fence',                13, 4, 'construction', 2, False, False, (190, 153, 153)),
-        #     CityscapesClass('guard rail',           14, 255, 'construction', 2, False, True, (180, 165, 180)),
-        #     CityscapesClass('bridge',               15, 255, 'construction', 2, False, True, (150, 100, 100)),
-        #     CityscapesClass('tunnel',               16, 255, 'construction', 2, False, True, (150, 120, 90)),
-        #     CityscapesClass('pole',                 17, 5, 'object', 3, False, False, (153, 153, 153)),
-        #     CityscapesClass('polegroup',            18, 255, 'object', 3, False, True, (153, 153, 153)),
-        #     CityscapesClass('traffic light',        19, 6, 'object', 3, False, False, (250, 170, 30)),
-        #     CityscapesClass('traffic sign',         20, 7, 'object', 3, False, False, (220, 220, 0)),
-        #     CityscapesClass('vegetation',           21, 8, 'nature', 4, False, False, (107, 142, 35)),
-        #     CityscapesClass('terrain',              22, 9, 'nature', 4, False, False, (152, 251, 152)),
-        #     CityscapesClass('sky',                  23, 10, 'sky', 5, False, False, (70, 130, 180)),
-        # # CityscapesClass('person',               24, 11, 'human', 6, True, False, (220, 20, 60)),
-        # # CityscapesClass('rider',                25, 12, 'human', 6, True, False, (255, 0, 0)),
-        # # CityscapesClass('car',                  26, 13, 'vehicle', 7, True, False, (0, 0, 142)),
-        # # CityscapesClass('truck',                27, 14, 'vehicle', 7, True, False, (0, 0, 70)),
-        # # CityscapesClass('bus',                  28, 15, 'vehicle', 7, True, False, (0, 60, 100)),
-        # # CityscapesClass('caravan',              29, 255, 'vehicle', 7, True, True, (0, 0, 90)),
-        # # CityscapesClass('trailer',              30, 255, 'vehicle', 7, True, True, (0, 0, 110)),
-        # # CityscapesClass('train',                31, 16, 'vehicle', 7, True, False, (0, 80, 100)),
-        # # CityscapesClass('motorcycle',           32, 17, 'vehicle', 7, True, False, (0, 0, 230)),
-        # # CityscapesClass('bicycle',              33, 18, 'vehicle', 7, True, False, (119, 11, 32)),
-        # # CityscapesClass('license plate',        -1, 255, 'vehicle', 7, False, True, (0, 0, 142)),
-        condition = ~condition
-        condition = condition.type(torch.int)
-        condition[:4, :] = 1
-        condition[-2:, :] = 1
-        condition = condition.type(torch.float32)
-
-        return condition
-
-
-
-def scale(image):
-
-    im_resized = image.resize((768, 256), Image.ANTIALIAS)
+        # packed by stuff_mask.py when available, otherwise an exact colour -> class lookup
+        return torch.from_numpy(self.stuff_masks.get(seg_path))
+
+
+
+def scale(image, draft=0):
+
+    # draft > 0: DCT-scaled JPEG decode down to draft x the output size first
+    im_resized = resize(image, (768, 256), draft)
     return im_resized
 
 
@@ -0,0 +1,181 @@
+import os
+import json
+import random
+import hashlib
+import numpy as np
+from PIL import Image
+
+VIDEO_EXTS = ('.mp4', '.mkv', '.avi', '.mov')
+# training windows may cost up to this many times the decode work of the
+# cheapest window of their scenario (see RoadVideos.pick_window)
+COST_SLACK = 2.0
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+
+def scan_video(path):
+    """
+        Packet timestamps of the video stream, without decoding anything.
+        return: pts int64 [F] in presentation order, key_of int64 [F] position of
+        the last keyframe at or before every frame
+    """
+    import av
+    with av.open(path) as container:
+        stream = container.streams.video[0]
+        pts = []
+        keys = []
+        for packet in container.demux(stream):
+            # the flushing packet at the end carries no frame
+            if packet.pts is None:
+                continue
+            pts.append(packet.pts)
+            keys.append(packet.is_keyframe)
+    pts = np.array(pts, dtype=np.int64)
+    order = np.argsort(pts, kind='stable')
+    pts = pts[order]
+    is_key = np.array(keys, dtype=bool)[order]
+    is_key[0] = True
+    key_of = np.maximum.accumulate(np.where(is_key, np.arange(len(pts)), 0))
+    return pts, key_of
+
+
+def decode_cost(frames, key_of):
+    """
+        frames decoded to read sorted frame positions, seeking to the keyframe of a
+        frame whenever continuing from the last decoded frame would be longer
+    """
+    pos = -1
+    cost = 0
+    for f in frames:
+        k = key_of[f]
+        if f <= pos or k > pos:
+            cost += f - k + 1
+        else:
+            cost += f - pos
+        pos = f
+    return int(cost)
+
+
+class RoadVideos(object):
+    """
+        ROAD frames read straight from the source videos ({video_dir}/{video id}.mp4)
+        instead of the extracted rgb-images/{video id}/%05d.jpg: frame n of the jpg
+        folder is the n-th frame (1-based) of the video.
+
+        Only the frames of the window are decoded: the decoder seeks to the keyframe
+        before a frame and runs forward from there, and every frame is scaled to
+        768x256 while it is converted to RGB (swscale, Lanczos like scale()).
+
+        The packet timestamps of every video are scanned once and cached in
+        index_dir, keyed on the video size and mtime. Containers are opened lazily,
+        so every DataLoader worker gets its own.
+    """
+
+    def __init__(self, video_dir, index_dir='../datasets/index', size=(768, 256)):
+        self.video_dir = video_dir
+        self.index_dir = index_dir
+        self.size = size
+        self.index = {}
+        self.containers = {}
+        self.window_costs = {}
+
+    def path(self, video_id):
+        for ext in VIDEO_EXTS:
+            path = os.path.join(self.video_dir, video_id + ext)
+            if os.path.isfile(path):
+                return path
+        raise FileNotFoundError('no video %s in %s' % (video_id, self.video_dir))
+
+    def _load(self, video_id):
+        if video_id in self.index:
+            return self.index[video_id]
+        path = self.path(video_id)
+        key = json.dumps([os.path.abspath(path)] + _stamp(path))
+        key = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+        cache_path = os.path.join(self.index_dir, 'road_video_%s_%s.npz' % (video_id, key))
+        if os.path.isfile(cache_path):
+            with np.load(cache_path) as cache:
+                pts, key_of = cache['pts'], cache['key_of']
+        else:
+            pts, key_of = scan_video(path)
+            os.makedirs(self.index_dir, exist_ok=True)
+            tmp_path = cache_path + '.tmp%d.npz' % os.getpid()
+            np.savez(tmp_path, pts=pts, key_of=key_of)
+            os.replace(tmp_path, cache_path)
+        entry = {'pts': pts, 'key_of': key_of, 'frame_of': {int(p): i for i, p in enumerate(pts)}}
+        self.index[video_id] = entry
+        return entry
+
+    def num_frames(self, video_id):
+        return len(self._load(video_id)['pts'])
+
+    def pick_window(self, video_id, windows):
+        """
+            windows: frame numbers of every window of a scenario
+            return: a random window among those decoded in at most COST_SLACK
+            times the work of the cheapest one
+        """
+        key = (video_id, int(windows[0][0]), len(windows))
+        candidates = self.window_costs.get(key)
+        if candidates is None:
+            key_of = self._load(video_id)['key_of']
+            costs = np.array([decode_cost(np.sort(np.asarray(w) - 1), key_of) for w in windows])
+            candidates = np.flatnonzero(costs <= costs.min() * COST_SLACK).tolist()
+            self.window_costs[key] = candidates
+        return random.choice(candidates)
+
+    def _container(self, video_id):
+        container = self.containers.get(video_id)
+        if container is None:
+            import av
+            container = av.open(self.path(video_id))
+            container.streams.video[0].thread_type = 'AUTO'
+            self.containers[video_id] = container
+        return container
+
+    def _image(self, frame):
+        frame = frame.reformat(width=self.size[0], height=self.size[1], format='rgb24', interpolation='LANCZOS')
+        return Image.fromarray(frame.to_ndarray())
+
+    def read(self, video_id, frames):
+        """
+            frames: frame numbers (1-based, as the jpg names)
+            return: one 768x256 RGB PIL image per frame, in the order given
+        """
+        entry = self._load(video_id)
+        pts, key_of, frame_of = entry['pts'], entry['key_of'], entry['frame_of']
+        container = self._container(video_id)
+        stream = container.streams.video[0]
+        out = {}
+        pos = -1
+        decoder = None
+        for f in sorted(set(int(n) - 1 for n in frames)):
+            if decoder is None or f <= pos or key_of[f] > pos:
+                container.seek(int(pts[key_of[f]]), stream=stream, backward=True, any_frame=False)
+                decoder = container.decode(stream)
+                pos = -1
+            for frame in decoder:
+                n = frame_of.get(frame.pts)
+                if n is None:
+                    continue
+                pos = n
+                if n >= f:
+                    break
+            if pos != f:
+                raise ValueError('%s: frame %d not found after seeking' % (self.path(video_id), f+1))
+            out[f] = self._image(frame)
+        return [out[int(n) - 1] for n in frames]
+
+    def close(self):
+        for container in self.containers.values():
+            container.close()
+        self.containers = {}
+
+    def __getstate__(self):
+        # open containers stay in the process that opened them
+        state = self.__dict__.copy()
+        state['containers'] = {}
+        return state
@@ -0,0 +1,158 @@
+import os
+import numpy as np
+import torch
+
+
+class SampleIndex(object):
+    """
+        Flat NumPy storage of the per-scenario sliding windows.
+
+        Nested lists of path strings are touched by refcounting whenever a
+        DataLoader worker reads them, which slowly copies the whole index into
+        every forked worker. Here every stream ('video', 'seg', 'obj', 'idx', ...)
+        keeps one int32 array of frame numbers plus int64 window offsets, and
+        paths are rebuilt on demand from a fixed-width byte table of scenario
+        prefixes.
+
+        streams: {name: file name format (e.g. '%08d.jpg') or None for plain integers}
+        names: optional table of frame names; frames then index this table and
+               the format receives the name (e.g. '%s.jpg') instead of the number
+    """
+
+    def __init__(self, streams, names=None):
+        self.streams = dict(streams)
+        self.names = None if names is None else np.array([os.fsencode(n) for n in names], dtype=np.bytes_)
+        self._prefixes = {name: [] for name in self.streams}
+        self._frames = {name: [] for name in self.streams}
+        self._lengths = {name: [] for name in self.streams}
+        self._num_windows = []
+        self.finalized = False
+
+    def append(self, windows, prefixes=None):
+        """
+            windows: {stream: [[frame, ...], ...]}, one inner list per window
+            prefixes: {stream: folder} for the streams that map to files
+        """
+        assert not self.finalized
+        prefixes = prefixes or {}
+        num_windows = None
+        for name in self.streams:
+            stream_windows = windows.get(name, [])
+            if num_windows is None:
+                num_windows = len(stream_windows)
+            # streams that were not probed are stored as empty windows
+            if len(stream_windows) == 0:
+                stream_windows = [[] for _ in range(num_windows)]
+            assert len(stream_windows) == num_windows
+            self._prefixes[name].append(os.fsencode(prefixes.get(name, '')))
+            for w in stream_windows:
+                self._frames[name].extend(w)
+                self._lengths[name].append(len(w))
+        self._num_windows.append(num_windows)
+
+    def finalize(self):
+        self.scenario_offsets = np.zeros(len(self._num_windows)+1, dtype=np.int64)
+        np.cumsum(self._num_windows, out=self.scenario_offsets[1:])
+        self.prefixes = {}
+        self.frames = {}
+        self.window_offsets = {}
+        for name in self.streams:
+            self.prefixes[name] = np.array(self._prefixes[name], dtype=np.bytes_)
+            self.frames[name] = np.array(self._frames[name], dtype=np.int32)
+            offsets = np.zeros(len(self._lengths[name])+1, dtype=np.int64)
+            np.cumsum(self._lengths[name], out=offsets[1:])
+            self.window_offsets[name] = offsets
+        del self._prefixes, self._frames, self._lengths, self._num_windows
+        self.finalized = True
+        return self
+
+    def __len__(self):
+        return len(self.scenario_offsets) - 1
+
+    def num_windows(self, index):
+        return int(self.scenario_offsets[index+1] - self.scenario_offsets[index])
+
+    def window(self, name, index, sample_idx):
+        """
+            frame numbers of one window as an int32 array
+        """
+        w = self.scenario_offsets[index] + sample_idx
+        offsets = self.window_offsets[name]
+        return self.frames[name][offsets[w]:offsets[w+1]]
+
+    def prefix(self, name, index):
+        return os.fsdecode(self.prefixes[name][index])
+
+    def paths(self, name, index, sample_idx):
+        prefix = self.prefix(name, index)
+        fmt = self.streams[name]
+        frames = self.window(name, index, sample_idx)
+        if self.names is not None:
+            return [os.path.join(prefix, fmt % os.fsdecode(self.names[i])) for i in frames]
+        return [os.path.join(prefix, fmt % i) for i in frames]
+
+    def windows(self, name, index):
+        return [self.window(name, index, i) for i in range(self.num_windows(index))]
+
+    def nbytes(self):
+        total = self.scenario_offsets.nbytes
+        if self.names is not None:
+            total += self.names.nbytes
+        for name in self.streams:
+            total += self.prefixes[name].nbytes + self.frames[name].nbytes + self.window_offsets[name].nbytes
+        return total
+
+
+class LabelMatrix(object):
+    """
+        All per-sample labels packed column-wise into one contiguous uint8 matrix.
+        Every field remembers its columns and the torch dtype it is returned as,
+        so __getitem__ yields exactly the tensors the loaders used to keep around.
+    """
+
+    def __init__(self):
+        self.fields = {}
+        self._rows = []
+        self.finalized = False
+
+    def append(self, **fields):
+        assert not self.finalized
+        row = []
+        col = 0
+        for name, value in fields.items():
+            dtype = value.dtype if isinstance(value, torch.Tensor) else torch.int64
+            value = np.asarray(value).reshape(-1)
+            assert value.min(initial=0) >= 0 and value.max(initial=0) < 256
+            if name not in self.fields:
+                scalar = np.ndim(fields[name]) == 0
+                self.fields[name] = (col, col+value.size, dtype, scalar)
+            assert self.fields[name][:2] == (col, col+value.size)
+            row.append(value)
+            col += value.size
+        self._rows.append(np.concatenate(row) if row else np.zeros(0))
+
+    def finalize(self):
+        width = max([stop for _, stop, _, _ in self.fields.values()] + [0])
+        self.matrix = np.zeros((len(self._rows), width), dtype=np.uint8)
+        for i, row in enumerate(self._rows):
+            self.matrix[i, :len(row)] = row
+        del self._rows
+        self.finalized = True
+        return self
+
+    def __len__(self):
+        return self.matrix.shape[0]
+
+    def __contains__(self, name):
+        return name in self.fields
+
+    def get(self, name, index):
+        start, stop, dtype, scalar = self.fields[name]
+        value = torch.from_numpy(self.matrix[index, start:stop].astype(np.int64)).to(dtype)
+        if scalar:
+            value = value[0]
+        return value
+
+    def column(self, name):
+        start, stop, _, _ = self.fields[name]
+        return self.matrix[:, start:stop]
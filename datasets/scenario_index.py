@@ -0,0 +1,152 @@
+import os
+import json
+import hashlib
+from pack_jobs import mtime
+
+INDEX_VERSION = 1
+
+
+def get_video_folder(model_name):
+    if model_name == 'mvit' or model_name == 'videoMAE':
+        return 'downsampled_224/'
+    return 'downsampled/'
+
+
+def _list_files(path):
+    """
+        one readdir instead of an isfile() per candidate frame
+    """
+    if not os.path.isdir(path):
+        return set()
+    with os.scandir(path) as it:
+        return set(entry.name for entry in it if entry.is_file())
+
+
+def scan_scenario(scenario_path, video_folder, seq_len, bg_mask=True, obj_mask=True, max_num=50, min_frames=50):
+    """
+        Resolve the sliding windows of one scenario.
+        return:
+            None if the scenario has no usable video, otherwise
+            {'videos': [[frame]], 'idx': [[offset]], 'segs': [[frame]], 'objs': [[frame]]}
+            with one inner list per window (same semantics as the original TACO scan).
+    """
+    video_folder_path = os.path.join(scenario_path, 'rgb', video_folder)
+    if not os.path.isdir(video_folder_path):
+        return None
+    imgs = _list_files(video_folder_path)
+    if len(imgs) < min_frames:
+        return None
+    segs_avail = _list_files(os.path.join(scenario_path, 'mask', 'background')) if bg_mask else set()
+    objs_avail = _list_files(os.path.join(scenario_path, 'mask', 'object')) if obj_mask else set()
+
+    check_data = sorted(imgs)
+    start_frame = int(check_data[0].split('.')[0])
+    end_frame = int(check_data[-1].split('.')[0])
+    num_frame = end_frame - start_frame + 1
+    step = num_frame // seq_len
+
+    entry = {'videos': [], 'idx': [], 'segs': [], 'objs': []}
+    for m in range(max_num):
+        start = start_frame + m
+        if start_frame + (seq_len-1)*step > end_frame:
+            break
+        videos_temp = []
+        seg_temp = []
+        idx_temp = []
+        obj_temp = []
+        for i in range(start, end_frame+1, step):
+            name = str(i).zfill(8)
+            if name + '.jpg' in imgs:
+                videos_temp.append(i)
+                idx_temp.append(i-start_frame)
+            if name + '.png' in segs_avail:
+                seg_temp.append(i)
+            if name + '.npy' in objs_avail:
+                obj_temp.append(i)
+            if len(videos_temp) == seq_len:
+                break
+        if len(videos_temp) == seq_len:
+            entry['videos'].append(videos_temp)
+            entry['idx'].append(idx_temp)
+            entry['segs'].append(seg_temp)
+            entry['objs'].append(obj_temp)
+    return entry
+
+
+class ScenarioIndex(object):
+    """
+        Persistent index of the resolved windows of every scenario of a split.
+
+        The file is keyed on (root, split file, seq_len, frame folder, mask options)
+        and every scenario entry is revalidated against the mtimes of its frame and
+        mask directories, so only scenarios whose folders changed are rescanned.
+    """
+
+    def __init__(self, root, split_name, seq_len, video_folder, bg_mask=True, obj_mask=True,
+                 index_dir='../datasets/index', rebuild=False):
+        self.root = root
+        self.seq_len = seq_len
+        self.video_folder = video_folder
+        self.bg_mask = bg_mask
+        self.obj_mask = obj_mask
+        self.dirty = False
+        self.hits = 0
+        self.misses = 0
+
+        key = json.dumps([INDEX_VERSION, os.path.abspath(root), split_name, seq_len,
+                          video_folder, bool(bg_mask), bool(obj_mask)])
+        key = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+        self.path = os.path.join(index_dir, '%s_%s.json' % (os.path.basename(split_name).split('.')[0], key))
+
+        self.entries = {}
+        if not rebuild and os.path.isfile(self.path):
+            try:
+                with open(self.path) as f:
+                    self.entries = json.load(f)['scenarios']
+            except (ValueError, KeyError):
+                self.entries = {}
+
+    def scenario_path(self, scenario):
+        parent_folder, basic, variant = scenario.split('/')
+        return os.path.join(self.root, parent_folder, basic, 'variant_scenario', variant)
+
+    def _stamp(self, scenario_path):
+        # the index holds folder listings, which only change with the folder mtime
+        stamp = [mtime(os.path.join(scenario_path, 'rgb', self.video_folder))]
+        if self.bg_mask:
+            stamp.append(mtime(os.path.join(scenario_path, 'mask', 'background')))
+        if self.obj_mask:
+            stamp.append(mtime(os.path.join(scenario_path, 'mask', 'object')))
+        return stamp
+
+    def get(self, scenario, scenario_path=None):
+        """
+            return the scan_scenario() entry of a scenario ('a/b/c' or any key with an explicit path)
+        """
+        if scenario_path is None:
+            scenario_path = self.scenario_path(scenario)
+        stamp = self._stamp(scenario_path)
+        cached = self.entries.get(scenario)
+        if cached is not None and cached['stamp'] == stamp:
+            self.hits += 1
+            return cached['entry']
+
+        self.misses += 1
+        entry = scan_scenario(scenario_path, self.video_folder, self.seq_len,
+                              bg_mask=self.bg_mask, obj_mask=self.obj_mask)
+        self.entries[scenario] = {'stamp': stamp, 'entry': entry}
+        self.dirty = True
+        return entry
+
+    def save(self):
+        if not self.dirty:
+            return
+        index_dir = os.path.dirname(self.path)
+        if index_dir and not os.path.isdir(index_dir):
+            os.makedirs(index_dir)
+        tmp_path = self.path + '.tmp%d' % os.getpid()
+        with open(tmp_path, 'w') as f:
+            json.dump({'version': INDEX_VERSION, 'scenarios': self.entries}, f)
+        os.replace(tmp_path, self.path)
+        self.dirty = False
+        print('scenario index: %d cached, %d rescanned -> %s' % (self.hits, self.misses, self.path))
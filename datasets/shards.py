@@ -0,0 +1,347 @@
+import os
+import io
+import sys
+import json
+import time
+import random
+import tarfile
+import numpy as np
+import cv2
+import torch
+import torch.distributed as dist
+from torch.utils.data import IterableDataset, get_worker_info
+from PIL import Image
+from tqdm import tqdm
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from clip_transport import to_uint8_clip
+from stuff_mask import STUFF_LUT, colour_to_train_id
+
+# a new shard is started once this many bytes are written
+SHARD_BYTES = 1 << 30
+# shards are read sequentially through a buffer this large
+READ_BUFFER = 8 << 20
+
+
+def index_path(shard_dir, split):
+    return os.path.join(shard_dir, split + '.json')
+
+
+def _add(tar, name, payload):
+    info = tarfile.TarInfo(name)
+    info.size = len(payload)
+    info.mtime = int(time.time())
+    info.mode = 0o644
+    tar.addfile(info, io.BytesIO(payload))
+    return info.size
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+def _npy(x):
+    buf = io.BytesIO()
+    np.save(buf, np.asarray(x))
+    return buf.getvalue()
+
+
+def scenario_members(dataset, index, dataset_name):
+    """
+        (name, payload) of one scenario, meta.json first:
+            meta.json               labels, string fields and the windows of every stream
+            {stream}/{file}         raw bytes of every frame of the union of the windows
+                                    (jpg not re-encoded, seg png, object npy)
+            box/{window}.npy        tracklets of every window (--box)
+    """
+    args = dataset.args
+    samples = dataset.samples
+    streams = ['video']
+    if args.bg_mask:
+        streams.append('seg')
+    if dataset_name == 'taco' and args.obj_mask:
+        streams.append('obj')
+
+    meta = {'labels': {}, 'windows': {}}
+    for name in dataset.labels.fields:
+        value = dataset.labels.get(name, index)
+        meta['labels'][name] = {'value': value.tolist(), 'dtype': str(value.dtype).split('.')[-1]}
+    if dataset_name == 'taco':
+        meta['fields'] = {'id': str(dataset.id[index]), 'variants': str(dataset.variants[index]),
+                          'map': str(dataset.maps[index])}
+    else:
+        meta['fields'] = {'scenario': str(dataset.scenarios[index])}
+    for stream in streams + ['idx']:
+        meta['windows'][stream] = [[int(n) for n in w] for w in samples.windows(stream, index)]
+
+    members = [('meta.json', json.dumps(meta).encode('utf-8'))]
+    for stream in streams:
+        prefix = samples.prefix(stream, index)
+        fmt = samples.streams[stream]
+        frames = sorted(set(n for w in meta['windows'][stream] for n in w))
+        for n in frames:
+            members.append(('%s/%s' % (stream, fmt % n), _read(os.path.join(prefix, fmt % n))))
+    if args.box:
+        for w in range(samples.num_windows(index)):
+            if dataset_name == 'taco' and args.gt:
+                box = np.load(os.path.join(str(dataset.scenario_paths[index]), 'tracks', 'gt', str(w)) + '.npy')
+            else:
+                box = dataset.tracklets.get(index, w)
+            members.append(('box/%d.npy' % w, _npy(box)))
+    return members
+
+
+def write_shards(dataset, dataset_name, shard_dir, split='train', shard_bytes=SHARD_BYTES, extra=None):
+    """
+        Write every scenario of a map-style TACO / OATS into {shard_dir}/{split}-%05d.tar,
+        members of a scenario stored back to back under its key ('%06d' % index),
+        and list the shards in {shard_dir}/{split}.json.
+    """
+    os.makedirs(shard_dir, exist_ok=True)
+    shards = []
+    tar = None
+
+    def close():
+        tar.close()
+        os.replace(shards[-1]['tmp'], os.path.join(shard_dir, shards[-1]['name']))
+        del shards[-1]['tmp']
+
+    written = 0
+    for index in tqdm(range(len(dataset)), file=sys.stdout):
+        if tar is None or written >= shard_bytes:
+            if tar is not None:
+                close()
+            name = '%s-%05d.tar' % (split, len(shards))
+            shards.append({'name': name, 'scenarios': 0, 'tmp': os.path.join(shard_dir, name + '.tmp%d' % os.getpid())})
+            tar = tarfile.open(shards[-1]['tmp'], mode='w')
+            written = 0
+        key = '%06d' % index
+        for name, payload in scenario_members(dataset, index, dataset_name):
+            written += _add(tar, key + '/' + name, payload)
+        shards[-1]['scenarios'] += 1
+    if tar is not None:
+        close()
+
+    args = dataset.args
+    index = {'dataset': dataset_name, 'seq_len': dataset.seq_len, 'model_name': args.model_name,
+             'bg_mask': bool(args.bg_mask), 'obj_mask': bool(args.obj_mask), 'box': bool(args.box),
+             'num_scenarios': len(dataset), 'shards': shards}
+    index.update(extra or {})
+    tmp_path = index_path(shard_dir, split) + '.tmp%d' % os.getpid()
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f)
+    os.replace(tmp_path, index_path(shard_dir, split))
+    return shards
+
+
+def read_shard(path):
+    """
+        yield {'key', 'meta', member name: bytes} per scenario of one shard,
+        read front to back in a single pass
+    """
+    record = None
+    with open(path, 'rb', buffering=READ_BUFFER) as f:
+        with tarfile.open(fileobj=f, mode='r|') as tar:
+            for info in tar:
+                if not info.isfile():
+                    continue
+                key, name = info.name.split('/', 1)
+                if record is None or record['key'] != key:
+                    if record is not None:
+                        yield record
+                    record = {'key': key}
+                payload = tar.extractfile(info).read()
+                if name == 'meta.json':
+                    record['meta'] = json.loads(payload.decode('utf-8'))
+                else:
+                    record[name] = payload
+    if record is not None:
+        yield record
+
+
+class ShardStream(IterableDataset):
+    """
+        Streams the shards of write_shards() and yields the same dicts as
+        TACO / OATS __getitem__.
+
+        Every epoch the shards are shuffled with the same seed on every rank
+        (call set_epoch() before iterating) and dealt to the
+        rank * num_workers + worker_id readers. Each reader keeps
+        shuffle_buffer scenarios in memory and emits a random one as the next
+        scenario arrives, then picks its windows on the fly (random windows
+        in training, the middle one otherwise).
+
+        With fewer shards than readers, every reader streams all shards and
+        keeps one scenario out of num_readers instead.
+    """
+
+    def __init__(self, args, split='train', training=True, shuffle_buffer=None):
+        self.args = args
+        self.training = training
+        self.shard_dir = args.shards
+        with open(index_path(self.shard_dir, split)) as f:
+            self.index = json.load(f)
+        self.dataset = self.index['dataset']
+        self.seq_len = args.seq_len
+        if self.dataset != args.dataset:
+            raise ValueError('%s holds %s scenarios, not %s' % (self.shard_dir, self.dataset, args.dataset))
+        # the frames were read from the folder of the model (downsampled_224 for mvit / videoMAE)
+        if self.index['model_name'] != args.model_name:
+            raise ValueError('%s was exported for --model_name %s, not %s' % (self.shard_dir, self.index['model_name'], args.model_name))
+        if self.index['seq_len'] != self.seq_len:
+            raise ValueError('%s holds windows of %d frames, not %d' % (self.shard_dir, self.index['seq_len'], self.seq_len))
+        for flag in ('bg_mask', 'box'):
+            if getattr(args, flag) and not self.index[flag]:
+                raise ValueError('%s was exported without --%s' % (self.shard_dir, flag))
+        if self.dataset == 'taco' and args.obj_mask and not self.index['obj_mask']:
+            raise ValueError('%s was exported without --obj_mask' % self.shard_dir)
+        self.shards = [s['name'] for s in self.index['shards']]
+        self.num_scenarios = self.index['num_scenarios']
+        self.label_stat = self.index.get('label_stat')
+        self.shuffle_buffer = (args.shuffle_buffer if shuffle_buffer is None else shuffle_buffer) if training else 0
+        self.k = max(1, args.windows_per_scenario) if training else 1
+        self.epoch = 0
+        if self.dataset == 'taco':
+            from taco import to_np, to_np_no_norm, get_obj_mask
+            self.to_np_no_norm = to_np_no_norm
+            self.get_obj_mask = get_obj_mask
+        else:
+            from oats import to_np
+        self.to_np = to_np
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def _world(self):
+        if dist.is_available() and dist.is_initialized():
+            return dist.get_rank(), dist.get_world_size()
+        return 0, 1
+
+    def __len__(self):
+        # exact with one reader per shard and balanced shards, an estimate otherwise
+        _, world_size = self._world()
+        return self.num_scenarios * self.k // world_size
+
+    def _records(self):
+        rank, world_size = self._world()
+        worker = get_worker_info()
+        num_workers, worker_id = (1, 0) if worker is None else (worker.num_workers, worker.id)
+        num_readers = world_size * num_workers
+        reader = rank * num_workers + worker_id
+
+        shards = list(self.shards)
+        if self.training:
+            random.Random(self.epoch).shuffle(shards)
+        if len(shards) >= num_readers:
+            for shard in shards[reader::num_readers]:
+                for record in read_shard(os.path.join(self.shard_dir, shard)):
+                    yield record
+        else:
+            n = 0
+            for shard in shards:
+                for record in read_shard(os.path.join(self.shard_dir, shard)):
+                    if n % num_readers == reader:
+                        yield record
+                    n += 1
+
+    def __iter__(self):
+        buffer = []
+        for record in self._records():
+            if len(buffer) < self.shuffle_buffer:
+                buffer.append(record)
+                continue
+            if buffer:
+                i = random.randrange(len(buffer))
+                record, buffer[i] = buffer[i], record
+            for data in self.scenario_samples(record):
+                yield data
+        random.shuffle(buffer)
+        for record in buffer:
+            for data in self.scenario_samples(record):
+                yield data
+
+    def scenario_samples(self, record):
+        num_windows = len(record['meta']['windows']['video'])
+        if not self.training:
+            picks = [num_windows//2]
+        elif num_windows >= self.k:
+            picks = sorted(random.sample(range(num_windows), self.k))
+        else:
+            picks = sorted(random.randint(0, num_windows-1) for _ in range(self.k))
+        # member name of every frame number, per stream
+        members = {stream: {} for stream in record['meta']['windows']}
+        for m in record:
+            stream, _, name = m.partition('/')
+            if stream in members:
+                members[stream][int(os.path.splitext(name)[0])] = m
+        # frames shared by the k windows are decoded once
+        frames = {}
+        for sample_idx in picks:
+            yield self.sample(record, members, sample_idx, frames)
+
+    def decode(self, record, member, frames):
+        x = frames.get(member)
+        if x is None:
+            x = Image.open(io.BytesIO(record[member])).convert('RGB')
+            frames[member] = x
+        return x
+
+    def stuff_mask(self, payload):
+        """
+            OATS background mask of a colour png, rows forced as StuffMasks(top_rows=4, bottom_rows=2)
+        """
+        img = cv2.imdecode(np.frombuffer(payload, dtype=np.uint8), cv2.IMREAD_COLOR)
+        mask = STUFF_LUT[colour_to_train_id(img[..., ::-1])].astype(np.float32)
+        mask[:4, :] = 1
+        mask[-2:, :] = 1
+        return torch.from_numpy(mask)
+
+    def sample(self, record, members, sample_idx, frames):
+        meta = record['meta']
+        windows = meta['windows']
+        data = dict()
+        data['videos'] = []
+        data['bg_seg'] = []
+        data['obj_masks'] = []
+        data['raw'] = []
+        for name, label in meta['labels'].items():
+            data[name] = torch.tensor(label['value'], dtype=getattr(torch, label['dtype']))
+        data.update(meta['fields'])
+        if self.args.box:
+            data['box'] = np.load(io.BytesIO(record['box/%d.npy' % sample_idx]))
+
+        mask_every_frame = self.args.mask_every_frame
+        obj_masks = self.dataset == 'taco' and self.args.obj_mask and self.training
+        if obj_masks and self.args.obj_mask_store == 'packed':
+            obj_frames = windows['obj'][sample_idx][:self.seq_len:mask_every_frame]
+            bits, count = [], []
+            for n in obj_frames:
+                masks = np.load(io.BytesIO(record[members['obj'][n]])).astype(bool)
+                masks = masks.reshape(masks.shape[0], -1)
+                bits.append(np.packbits(masks, axis=1))
+                count.append(masks.shape[0])
+            data['obj_mask_bits'] = torch.from_numpy(np.concatenate(bits, 0))
+            data['obj_mask_count'] = torch.from_numpy(np.array(count, dtype=np.int64))
+            obj_masks = False
+
+        for i in range(self.seq_len):
+            data['videos'].append(self.decode(record, members['video'][windows['video'][sample_idx][i]], frames))
+            if i % mask_every_frame != 0:
+                continue
+            if self.args.bg_mask:
+                seg = record[members['seg'][windows['seg'][sample_idx][i]]]
+                if self.dataset == 'oats':
+                    data['bg_seg'].append(self.stuff_mask(seg))
+                elif self.training:
+                    data['bg_seg'].append(Image.open(io.BytesIO(seg)).convert('L'))
+            if obj_masks:
+                data['obj_masks'].append(self.get_obj_mask(io.BytesIO(record[members['obj'][windows['obj'][sample_idx][i]]])))
+
+        if self.args.uint8_clip:
+            # normalised on the device, see clip_transport.normalize_clip
+            data['videos'] = to_uint8_clip(data['videos'])
+        else:
+            data['videos'] = self.to_np(data['videos'], self.args.model_name, self.args.backbone)
+        if self.dataset == 'taco':
+            data['bg_seg'] = self.to_np_no_norm(data['bg_seg'])
+        return data
@@ -0,0 +1,156 @@
+import os
+import argparse
+import numpy as np
+import cv2
+from pack_jobs import folder_stamp, is_fresh, run_pool
+
+# Cityscapes train_id -> colour, as written by DeepLabV3Plus decode_target (RGB, 19 = void)
+CITYSCAPES_COLORS = np.array([
+    (128, 64, 128), (244, 35, 232), (70, 70, 70), (102, 102, 156), (190, 153, 153),
+    (153, 153, 153), (250, 170, 30), (220, 220, 0), (107, 142, 35), (152, 251, 152),
+    (70, 130, 180), (220, 20, 60), (255, 0, 0), (0, 0, 142), (0, 0, 70),
+    (0, 60, 100), (0, 80, 100), (0, 0, 230), (119, 11, 32), (0, 0, 0)], dtype=np.int64)
+VOID_ID = 19
+
+# road, sidewalk, person, rider, car, truck, motorcycle, bicycle: the classes the
+# old channel-sum test removed from the background (sums 320, 511, 300, 255, 142, 70, 230, 162)
+NOT_STUFF_IDS = (0, 1, 11, 12, 13, 14, 17, 18)
+
+_KEYS = (CITYSCAPES_COLORS[:, 0] << 16) | (CITYSCAPES_COLORS[:, 1] << 8) | CITYSCAPES_COLORS[:, 2]
+_ORDER = np.argsort(_KEYS)
+_SORTED_KEYS = _KEYS[_ORDER]
+STUFF_LUT = np.ones(len(CITYSCAPES_COLORS), dtype=bool)
+STUFF_LUT[list(NOT_STUFF_IDS)] = False
+
+
+def colour_to_train_id(img):
+    """
+        img: uint8 [H, W, 3] RGB colour segmentation
+        return: uint8 [H, W] train ids, colours outside the palette map to void
+    """
+    img = img.astype(np.int64)
+    keys = (img[..., 0] << 16) | (img[..., 1] << 8) | img[..., 2]
+    pos = np.minimum(np.searchsorted(_SORTED_KEYS, keys), len(_SORTED_KEYS)-1)
+    ids = _ORDER[pos]
+    ids[_SORTED_KEYS[pos] != keys] = VOID_ID
+    return ids.astype(np.uint8)
+
+
+def stuff_mask(seg_path):
+    """
+        bool [H, W], True on background ("stuff") pixels
+    """
+    img = cv2.imread(seg_path, cv2.IMREAD_COLOR)
+    return STUFF_LUT[colour_to_train_id(img[..., ::-1])]
+
+
+def store_path(seg_dir):
+    return os.path.normpath(seg_dir) + '.npz'
+
+
+def _stored_stamp(seg_dir):
+    path = store_path(seg_dir)
+    if not os.path.isfile(path):
+        return None
+    try:
+        with np.load(path) as store:
+            return str(store['stamp']) if 'stamp' in store.files else None
+    except (OSError, ValueError):
+        return None
+
+
+def is_packed(seg_dir):
+    # a new DeepLab run overwrites the pngs in place
+    return is_fresh(_stored_stamp(seg_dir), seg_dir, '.png')
+
+
+def pack_stuff_masks(seg_dir, overwrite=False):
+    """
+        <seg_dir>.npz: names [F], shape (H, W), bits uint8 [F, ceil(H*W/8)] (np.packbits),
+        stamp (folder_stamp() of the packed pngs)
+    """
+    out_path = store_path(seg_dir)
+    if not overwrite and is_packed(seg_dir):
+        return 0
+    stamp = folder_stamp(seg_dir, '.png')
+    names = sorted([n for n in os.listdir(seg_dir) if n.endswith('.png')])
+    if len(names) == 0:
+        return 0
+    masks = [stuff_mask(os.path.join(seg_dir, n)) for n in names]
+    shape = masks[0].shape
+    bits = np.stack([np.packbits(m.reshape(-1)) for m in masks], 0)
+    tmp_path = out_path + '.tmp%d.npz' % os.getpid()
+    np.savez(tmp_path, names=np.array([n[:-4] for n in names]), shape=np.array(shape), bits=bits,
+             stamp=np.array(stamp))
+    os.replace(tmp_path, out_path)
+    return len(names)
+
+
+class StuffMasks(object):
+    """
+        Background masks for the loaders: read from the <seg_dir>.npz packs when
+        they exist and are up to date, otherwise computed from the colour png
+        with the lookup table.
+    """
+
+    def __init__(self, top_rows=0, bottom_rows=0):
+        # rows forced to background, as ROAD/OATS did with condition[:4] / condition[-2:]
+        self.top_rows = top_rows
+        self.bottom_rows = bottom_rows
+        self.packs = {}
+
+    def _pack(self, seg_dir):
+        if seg_dir not in self.packs:
+            pack = None
+            # a stale pack is ignored, the masks come from the pngs
+            if is_packed(seg_dir):
+                with np.load(store_path(seg_dir)) as store:
+                    rows = {str(n): i for i, n in enumerate(store['names'])}
+                    pack = (rows, tuple(store['shape']), store['bits'])
+            self.packs[seg_dir] = pack
+        return self.packs[seg_dir]
+
+    def get(self, seg_path):
+        """
+            return: float32 [H, W]
+        """
+        seg_dir, name = os.path.split(seg_path)
+        pack = self._pack(seg_dir)
+        row = None if pack is None else pack[0].get(name[:-4])
+        if row is not None:
+            h, w = pack[1]
+            mask = np.unpackbits(pack[2][row], count=h*w).reshape(h, w)
+        else:
+            mask = stuff_mask(seg_path)
+        mask = mask.astype(np.float32)
+        if self.top_rows:
+            mask[:self.top_rows, :] = 1
+        if self.bottom_rows:
+            mask[-self.bottom_rows:, :] = 1
+        return mask
+
+
+def find_seg_dirs(root):
+    out = []
+    for dirpath, subdirs, files in os.walk(root):
+        for d in subdirs:
+            if 'segmentation' in d and d != 'instance_segmentation':
+                out.append(os.path.join(dirpath, d))
+        subdirs[:] = [d for d in subdirs if 'segmentation' not in d]
+    return sorted(out)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--root', type=str, help='folder holding the *segmentation* folders of DeepLab')
+    parser.add_argument('--num_workers', type=int, default=12)
+    parser.add_argument('--overwrite', help="repack up-to-date folders", action="store_true")
+    args = parser.parse_args()
+
+    seg_dirs = find_seg_dirs(args.root)
+    print('%d segmentation folders' % len(seg_dirs))
+    run_pool(pack_stuff_masks, seg_dirs, (args.overwrite,), args.num_workers, 'masks')
+
+
+if __name__ == "__main__":
+    main()
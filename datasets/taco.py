@@ -12,6 +12,15 @@ import sys
 import json 
 import random
 import torchvision.transforms as transforms
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from scenario_index import ScenarioIndex, get_video_folder
+from sample_index import SampleIndex, LabelMatrix
+from frame_pack import FramePacks
+from frame_cache import make_frame_cache, frame_keys, DEFAULT_SLOT_SHAPE
+from clip_transport import to_uint8_clip
+from obj_mask_store import ObjMaskStore
+from tracklet_store import TrackletStore
+from jpeg_draft import resize
 
 class TACO(Dataset):
 
@@ -29,16 +38,24 @@ class TACO(Dataset):
         self.id = []
         self.variants = []
         self.scenario_name = []
+        self.scenario_paths = []
         self.args =args
 
-        self.videos_list = []
-        self.seg_list = []
-        self.obj_seg_list = []
-
-        self.idx = []
-        self.gt_ego = []
-        self.gt_actor = []
-        self.slot_eval_gt = []
+        # windows and labels live in flat numpy arrays (see sample_index.py)
+        self.samples = SampleIndex({'video': '%08d.jpg', 'seg': '%08d.png', 'obj': '%08d.npy', 'idx': None})
+        self.labels = LabelMatrix()
+        # 'packed' reads windows out of the per-folder .npy written by frame_pack.py
+        self.frame_packs = FramePacks() if args.frame_store == 'packed' else None
+        # decoded frames shared by the windows of a scenario (--windows_per_scenario),
+        # or by every worker with --frame_cache_mb (see frame_cache.py)
+        slot_shape = (224, 224, 3) if get_video_folder(args.model_name) == 'downsampled_224/' else DEFAULT_SLOT_SHAPE
+        # a single window per scenario reuses no frame, nothing is kept then
+        max_frames = args.windows_per_scenario * self.seq_len if args.windows_per_scenario > 1 else 0
+        self.frame_cache = make_frame_cache(args, slot_shape, max_frames)
+        # 'packed' ships bit-packed, variable-length object masks (see obj_mask_store.py)
+        self.obj_mask_store = ObjMaskStore() if args.obj_mask_store == 'packed' else None
+        # --feature_cache: activations of the frozen backbone prefix replace the frames (see feature_cache.py)
+        self.features = None
 
 
         self.step = []
@@ -63,6 +80,13 @@ class TACO(Dataset):
         scenario_list = json.load(f)
         f_label = open('../datasets/taco_'+split+'_label.json')
         label_list = json.load(f_label)
+
+        video_folder = get_video_folder(args.model_name)
+        index = ScenarioIndex(root, 'taco_'+split+'_data.json', self.seq_len, video_folder,
+                            bg_mask=args.bg_mask,
+                            obj_mask=args.obj_mask or (args.plot and args.plot_mode==''),
+                            index_dir=args.index_dir,
+                            rebuild=args.rebuild_index)
         for scenario in tqdm(scenario_list):
             if not scenario in label_list:
                 continue
@@ -86,78 +110,37 @@ class TACO(Dataset):
                 max_num_label_a_video = torch.count_nonzero(gt_actor)
             total_label += torch.count_nonzero(gt_actor)
                              
-            video_folder = ['downsampled/', 'downsampled_224/']
-            if args.model_name == 'mvit' or args.model_name == 'videoMAE':
-                video_folder = video_folder[1]
-            else:
-                video_folder = video_folder[0]
-
             parent_folder, basic, variant = scenario.split('/')
-            scenario_path = os.path.join(root,parent_folder,basic,'variant_scenario',variant)
+            scenario_path = index.scenario_path(scenario)
             video_folder_path = os.path.join(scenario_path,'rgb',video_folder)
-            if os.path.isdir(video_folder_path):
-                check_data = [os.path.join(video_folder_path,img) for img in os.listdir(video_folder_path) if os.path.isfile(os.path.join(video_folder_path,img))]
-                check_data.sort()
-            else:
+            entry = index.get(scenario, scenario_path)
+            if entry is None:
                 continue
 
-            if len(check_data) < 50:
-                continue
-
-            videos = []
-            segs = []
-            obj_f = []
-            idx = []
-
-            start_frame = int(check_data[0].split('/')[-1].split('.')[0])
-            end_frame = int(check_data[-1].split('/')[-1].split('.')[0])
-            num_frame = end_frame - start_frame + 1
-            step = num_frame // self.seq_len
-
-            max_num = 50
-            for m in range(max_num):
-                start = start_frame + m
-                if start_frame + (self.seq_len-1)*step > end_frame:
-                    break
-                videos_temp = []
-                seg_temp = []
-                idx_temp = []
-                obj_temp = []
-                for i in range(start, end_frame+1, step):
-                    imgname = f"{str(i).zfill(8)}.jpg"
-                    segname = f"{str(i).zfill(8)}.png"
-                    boxname = f"{str(i).zfill(8)}.json"
-                    objname = f"{str(i).zfill(8)}.npy"
-                    if os.path.isfile(os.path.join(video_folder_path,imgname)):
-                        videos_temp.append(os.path.join(video_folder_path,imgname))
-                        idx_temp.append(i-start_frame)
-                    if os.path.isfile(os.path.join(scenario_path,'mask','background',segname)):
-                        seg_temp.append(os.path.join(scenario_path,'mask','background',segname))
-                    if os.path.isfile(os.path.join(scenario_path,'mask','object',objname)):
-                        obj_temp.append(os.path.join(scenario_path,'mask','object',objname))
-                    if len(videos_temp) == self.seq_len:
-                        break
-                if len(videos_temp) == self.seq_len:
-                    videos.append(videos_temp)
-                    idx.append(idx_temp)
-                    segs.append(seg_temp)
-                    obj_f.append(obj_temp)
+            self.samples.append(
+                {'video': entry['videos'], 'seg': entry['segs'], 'obj': entry['objs'], 'idx': entry['idx']},
+                {'video': video_folder_path,
+                'seg': os.path.join(scenario_path,'mask','background'),
+                'obj': os.path.join(scenario_path,'mask','object')})
 
             self.maps.append(parent_folder)
             self.id.append(basic)
             self.variants.append(variant)
             self.scenario_name.append(os.path.join(parent_folder, basic, variant))
-            self.videos_list.append(videos)
-            self.idx.append(idx)
-            self.seg_list.append(segs)
-            self.obj_seg_list.append(obj_f)
-            self.gt_ego.append(gt_ego)
+            self.scenario_paths.append(scenario_path)
             
             if ('slot' in args.model_name and not args.allocated_slot) or args.box:
-                self.gt_actor.append(proposal_train_label)
-                self.slot_eval_gt.append(gt_actor)
+                self.labels.append(ego=gt_ego, actor=proposal_train_label, slot_eval_gt=gt_actor)
             else:
-                self.gt_actor.append(gt_actor)
+                self.labels.append(ego=gt_ego, actor=gt_actor)
+        index.save()
+        self.samples.finalize()
+        self.labels.finalize()
+        self.maps = np.array(self.maps)
+        self.id = np.array(self.id)
+        self.variants = np.array(self.variants)
+        self.scenario_name = np.array(self.scenario_name)
+        self.scenario_paths = np.array(self.scenario_paths)
 
         if args.box:
             if args.gt:
@@ -170,173 +153,105 @@ class TACO(Dataset):
 
     def parse_tracklets_detection(self):
         """
-            read {scenario}/tracking_pred_2/tracks/front.txt
+            read {scenario}/tracks/pred/downsampled.txt
             format: frame, id, x, y, w, h
+            into one [num_windows, T, Max_N, 4] store for the split (see tracklet_store.py)
         """
-        
-        def parse_tracklet():
-            # frame_id: {id: [x,y,w,h]}
-            out = {}
-            for line in tracklet:
-                line = line.split(' ')[:6]
-                frame = int(line[0])
-                obj_id = int(line[1])
-                box = [int(line[2]),int(line[3]),int(line[2])+int(line[4]),int(line[3])+int(line[5])]
-                if frame not in out:
-                    out[frame] = {}
-                out[frame][obj_id] = box
-            return out
-            
-        
-        for data,idx in tqdm(zip(self.videos_list,self.idx)):
-            root = data[0][0].split('/')
-            root = root[:-3]
-            root = '/'+os.path.join(*root)
-            f = open(os.path.join(root,'tracks','pred','downsampled.txt'))
-            tracklet = f.readlines()
-            # parse_tracklet
-            tracklet = parse_tracklet()
-            f.close()
-            # for every sample]
-            assert len(data) == len(idx)
-            for i,idx_list in enumerate(idx):
-                out = np.zeros((self.seq_len,self.Max_N,4))
-                obj_id_dict = {}
-                # tracklet id
-                count = 0
-                # img frame id
-                for j,index in enumerate(idx_list):
-                    try:
-                        for obj_id in tracklet[int(index)+1]:
-                            if obj_id not in obj_id_dict:
-                                obj_id_dict[obj_id] = count
-                                count += 1
-                            try:
-                                out[j][obj_id_dict[obj_id]] = tracklet[int(index)+1][obj_id]
-                            except:
-                                continue
-                    except:
-                        continue
-                np.save(os.path.join(root,'tracks','pred','%s' % (i)),out)
-                        
-    def tracklet_counter(self):
-        """
-            tracklet (List[List[Dict]]):
-                T , boxes per_frame , key: obj_id
-            return:
-                T x N x 4
-        """
-
-        for idx, data in enumerate(self.videos_list):
-            num_samples = len(data)
-            root = data[num_samples//2][0].split('/')
-            root = root[:-3]
-            root = '/'+os.path.join(*root)
-            if not os.path.isdir(os.path.join(root,'tracks')):
-                os.mkdir(os.path.join(root,'tracks'))
-            if not os.path.isdir(os.path.join(root,'tracks','gt')):
-                os.mkdir(os.path.join(root,'tracks','gt'))
-            if not os.path.isdir(os.path.join(root,'tracks','pred')):
-                os.mkdir(os.path.join(root,'tracks','pred'))
-            # read bbox.json
-            f = open(os.path.join(root,'bbox.json'))
-            bboxs = json.load(f)
-            f.close()
-            obj_id_dict = {}
-            count = 0
-            remove_data_list = []
-            sample = data[num_samples//2]
-            for j,frame_idx in enumerate(sample):
-                frame_idx = frame_idx.split('/')[-1][:-4]
-                for obj_id, box in bboxs[frame_idx].items():
-                    if obj_id not in obj_id_dict:
-                        obj_id_dict[obj_id] = count
-                        count += 1
-
-                if self.args.num_objects == 10 and count > 10:
-                    remove_data_list.append(data)
-                    break
-                if self.args.num_objects == 20 and count < 10 and count > 20:
-                    # self.videos_list.remove(data)
-                    # del self.videos_list[idx]
-                    remove_data_list.append(data)
-                    break
-                if self.args.num_objects == 21 and count < 20:
-                    # self.videos_list.remove(data)
-                    # del self.videos_list[idx]
-                    remove_data_list.append(data)
-                    break
-        for video in self.videos_list:
-            remove = False
-            for remove_data in remove_data_list:
-                print(video)
-                print(remove_data)
-                if remove_data == video:
-                    remove = True
-                    break
-            if remove:
-                self.videos_list.remove(video)
-
+        self.tracklets = TrackletStore(self.args.root, 'taco_'+self.split+'_data.json', self.seq_len, self.Max_N,
+                                    video_folder=get_video_folder(self.args.model_name),
+                                    index_dir=self.args.index_dir,
+                                    rebuild=self.args.rebuild_index)
+        self.tracklets.build([(str(self.scenario_name[i]),
+                            os.path.join(str(self.scenario_paths[i]),'tracks','pred','downsampled.txt'),
+                            self.samples.windows('idx', i)) for i in range(len(self.samples))])
 
     def __len__(self):
         """Returns the length of the dataset. """
-        return len(self.videos_list)
+        return len(self.samples)
 
     def __getitem__(self, index):
         """Returns the item at index idx. """
+        # (index, sample_idx) from window_sampler.ScenarioWindowSampler picks the window
+        sample_idx = None
+        if isinstance(index, tuple):
+            index, sample_idx = index
         data = dict()
         data['videos'] = []
         data['bg_seg'] = []
         data['obj_masks'] = []
         data['raw'] = []
-        data['ego'] = self.gt_ego[index]
-        data['actor'] = self.gt_actor[index]
-        data['id'] = self.id[index]
-        data['variants'] = self.variants[index]
+        data['ego'] = self.labels.get('ego', index)
+        data['actor'] = self.labels.get('actor', index)
+        data['id'] = str(self.id[index])
+        data['variants'] = str(self.variants[index])
 
-        data['map'] = self.maps[index]
+        data['map'] = str(self.maps[index])
         if ('slot' in self.args.model_name and not self.args.allocated_slot) or self.args.box:
-            data['slot_eval_gt'] = self.slot_eval_gt[index]
+            data['slot_eval_gt'] = self.labels.get('slot_eval_gt', index)
 
-        if self.split =='train':
-            sample_idx = random.randint(0, len(self.videos_list[index])-1)
-        else:
-            sample_idx = len(self.videos_list[index])//2
+        num_windows = self.samples.num_windows(index)
+        if sample_idx is None:
+            if self.split =='train':
+                sample_idx = random.randint(0, num_windows-1)
+            else:
+                sample_idx = num_windows//2
 
-        seq_videos = self.videos_list[index][sample_idx]
+        seq_videos = self.samples.paths('video', index, sample_idx)
+        if self.args.frame_feature_cache_mb > 0:
+            # frozen 2D backbone blocks run once per frame, see models/frame_features.py
+            data['frame_keys'] = torch.from_numpy(frame_keys(seq_videos))
         if self.args.bg_mask:
-            seq_seg = self.seg_list[index][sample_idx]
+            seq_seg = self.samples.paths('seg', index, sample_idx)
         if self.args.obj_mask or (self.args.plot and self.args.plot_mode==''):
-            obj_masks_list = self.obj_seg_list[index][sample_idx]
+            obj_masks_list = self.samples.paths('obj', index, sample_idx)
 
         # add tracklets
         if self.args.box:
-            track_path = seq_videos[0].split('/')
-            track_path = track_path[:-3]
             if self.args.gt:
-                track_path = '/' + os.path.join(*track_path,'tracks','gt',str(sample_idx)) + '.npy'
+                track_path = os.path.join(str(self.scenario_paths[index]),'tracks','gt',str(sample_idx)) + '.npy'
+                data['box'] = np.load(track_path)
             else:
-                track_path = '/' + os.path.join(*track_path,'tracks','pred',str(sample_idx)) + '.npy'
-            tracklets = np.load(track_path)
-            data['box'] = tracklets
+                data['box'] = self.tracklets.get(index, sample_idx)
+
+        load_videos = self.features is None
+        if self.frame_packs is not None and load_videos:
+            seq_frames = self.frame_packs.window(self.samples.prefix('video', index),
+                                                self.samples.window('video', index, sample_idx))
+
+        if self.obj_mask_store is not None and self.args.obj_mask and (self.split =='train' or self.split == 'val'):
+            obj_frames = self.samples.window('obj', index, sample_idx)[:self.seq_len:self.args.mask_every_frame]
+            obj_bits, obj_count = self.obj_mask_store.window(self.samples.prefix('obj', index), obj_frames)
+            data['obj_mask_bits'] = torch.from_numpy(obj_bits)
+            data['obj_mask_count'] = torch.from_numpy(obj_count)
 
         for i in range(self.seq_len):
-            x = Image.open(seq_videos[i]).convert('RGB')
-            # x = scale(x, 2, self.args.model_name)
-            data['videos'].append(x)
-            if self.args.plot:
-                data['raw'].append(x)
+            if load_videos:
+                if self.frame_packs is not None:
+                    x = seq_frames[i]
+                else:
+                    x = self.frame_cache.open(seq_videos[i])
+                # x = scale(x, 2, self.args.model_name)
+                data['videos'].append(x)
+                if self.args.plot:
+                    data['raw'].append(x)
             if self.split =='train' or self.split == 'val':
                 if self.args.bg_mask:
                     if self.args.bg_mask and i %self.args.mask_every_frame == 0:
                         data['bg_seg'].append(Image.open(seq_seg[i]).convert('L'))
-                if self.args.obj_mask:
+                if self.args.obj_mask and self.obj_mask_store is None:
                     if self.args.obj_mask and i %self.args.mask_every_frame == 0 or (self.args.plot and self.args.plot_mode==''):
                         data['obj_masks'].append(get_obj_mask(obj_masks_list[i]))
         if self.args.plot:
             data['raw'] = to_np_no_norm(data['raw'])
     
-        data['videos'] = to_np(data['videos'], self.args.model_name, self.args.backbone)
+        if not load_videos:
+            del data['videos']
+            data['features'] = self.features.get(index, sample_idx)
+        elif self.args.uint8_clip:
+            # normalised on the device, see clip_transport.normalize_clip
+            data['videos'] = to_uint8_clip(data['videos'])
+        else:
+            data['videos'] = to_np(data['videos'], self.args.model_name, self.args.backbone)
         data['bg_seg'] = to_np_no_norm(data['bg_seg'])
         return data
 
@@ -357,14 +272,14 @@ def get_obj_mask(obj_path):
     return obj_masks
 
 
-def scale(image, scale=2.0, model_name=None):
+def scale(image, scale=2.0, model_name=None, draft=0):
 
     if scale == -1.0:
         (width, height) = (224, 224)
     else:
-        (width, height) = (int(image.width // scale), int(image.heighft // scale))
-    # (width, height) = (int(image.width // scale), int(image.height // scale))
-    im_resized = image.resize((width, height), Image.ANTIALIAS)
+        (width, height) = (int(image.width // scale), int(image.height // scale))
+    # draft > 0: DCT-scaled JPEG decode down to draft x the output size first
+    im_resized = resize(image, (width, height), draft)
 
     return im_resized
 
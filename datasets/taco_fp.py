@@ -13,6 +13,8 @@ import json
 import random
 # from tool import get_rot
 import torchvision.transforms as transforms
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from scenario_index import ScenarioIndex, get_video_folder
 
 
 
@@ -89,6 +91,11 @@ class TACO_FP(Dataset):
 
 
         # ----------------------
+        video_folder = get_video_folder(args.model_name)
+        index = ScenarioIndex(root, 'fp_' + '_'.join(type_list), self.seq_len, video_folder,
+                            bg_mask=False, obj_mask=False,
+                            index_dir=args.index_dir,
+                            rebuild=args.rebuild_index)
         for t, type in enumerate(type_list):
             basic_scenarios = [os.path.join(root, type, s) for s in os.listdir(os.path.join(root, type))]
             # iterate scenarios
@@ -114,54 +121,11 @@ class TACO_FP(Dataset):
                         gt_actor = [0]*64
                         gt_actor = torch.FloatTensor(gt_actor)
 
-                        video_folder = ['downsampled/', 'downsampled_224/']
-                        if args.model_name == 'mvit' or args.model_name == 'videoMAE':
-                            video_folder = video_folder[1]
-                        else:
-                            video_folder = video_folder[0]
-                        if os.path.isdir(v+"/rgb/" + video_folder):
-                            check_data = [v+"/rgb/"+video_folder+img for img in os.listdir(v+"/rgb/"+video_folder) if os.path.isfile(v+"/rgb/"+video_folder+ img)]
-                            check_data.sort()
-                        else:
+                        entry = index.get(os.path.join(type, scenario_id, v_id), v)
+                        if entry is None:
                             continue
-                        if len(check_data) < 50:
-                            continue
-
-                        videos = []
-                        segs = []
-                        obj_f = []
-                        idx = []
-
-                        start_frame = int(check_data[0].split('/')[-1].split('.')[0])
-                        end_frame = int(check_data[-1].split('/')[-1].split('.')[0])
-                        num_frame = end_frame - start_frame + 1
-                        step = num_frame // self.seq_len
-
-                        max_num = 50
-                        # step = ((end_frame-start + 1) // (seq_len+1)) -1
-                        for m in range(max_num):
-                            start = start_frame + m
-                            # step = ((end_frame-start + 1) // (seq_len+1)) -1
-                            if start_frame + (self.seq_len-1)*step > end_frame:
-                                break
-                            videos_temp = []
-                            idx_temp = []
-
-                            for i in range(start, end_frame+1, step):
-                                imgname = f"{str(i).zfill(8)}.jpg"
-                                segname = f"{str(i).zfill(8)}.png"
-                                boxname = f"{str(i).zfill(8)}.json"
-                                objname = f"{str(i).zfill(8)}.npy"
-                                if os.path.isfile(v+"/rgb/"+video_folder+imgname):
-                                    videos_temp.append(v+"/rgb/"+video_folder +imgname)
-                                    idx_temp.append(i-start_frame)
-
-                                if len(videos_temp) == self.seq_len:
-                                    break
-
-                            if len(videos_temp) == self.seq_len:
-                                videos.append(videos_temp)
-                                idx.append(idx_temp)
+                        videos = [[v+"/rgb/"+video_folder+f"{str(i).zfill(8)}.jpg" for i in w] for w in entry['videos']]
+                        idx = entry['idx']
                         if len(videos) == 0:
                             continue
 
@@ -172,6 +136,7 @@ class TACO_FP(Dataset):
                         self.idx.append(idx)
                         self.gt_ego.append(gt_ego)
                         self.gt_actor.append(gt_actor)
+        index.save()
 
  
     def __len__(self):
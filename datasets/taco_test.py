@@ -12,6 +12,9 @@ import sys
 import json 
 import random
 import torchvision.transforms as transforms
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from scenario_index import ScenarioIndex, get_video_folder
+from tracklet_store import TrackletStore
 
 class TACO_TEST(Dataset):
 
@@ -29,6 +32,7 @@ class TACO_TEST(Dataset):
         self.id = []
         self.variants = []
         self.scenario_name = []
+        self.scenario_paths = []
         self.args =args
 
         self.videos_list = []
@@ -61,74 +65,34 @@ class TACO_TEST(Dataset):
 
         f = open('../datasets/taco_'+split+'_data.json')
         scenario_list = json.load(f)
+        video_folder = get_video_folder(args.model_name)
+        index = ScenarioIndex(root, 'taco_'+split+'_data.json', self.seq_len, video_folder,
+                            bg_mask=False, obj_mask=False,
+                            index_dir=args.index_dir,
+                            rebuild=args.rebuild_index)
         for scenario in tqdm(scenario_list):
-                              
-            video_folder = ['downsampled/', 'downsampled_224/']
-            if args.model_name == 'mvit' or args.model_name == 'videoMAE':
-                video_folder = video_folder[1]
-            else:
-                video_folder = video_folder[0]
-
             parent_folder, basic, variant = scenario.split('/')
-            scenario_path = os.path.join(root,parent_folder,basic,'variant_scenario',variant)
+            scenario_path = index.scenario_path(scenario)
             video_folder_path = os.path.join(scenario_path,'rgb',video_folder)
-            if os.path.isdir(video_folder_path):
-                check_data = [os.path.join(video_folder_path,img) for img in os.listdir(video_folder_path) if os.path.isfile(os.path.join(video_folder_path,img))]
-                check_data.sort()
-            else:
+            entry = index.get(scenario, scenario_path)
+            if entry is None:
                 continue
 
-            if len(check_data) < 50:
-                continue
-
-            videos = []
-            segs = []
-            obj_f = []
-            idx = []
-
-            start_frame = int(check_data[0].split('/')[-1].split('.')[0])
-            end_frame = int(check_data[-1].split('/')[-1].split('.')[0])
-            num_frame = end_frame - start_frame + 1
-            step = num_frame // self.seq_len
-
-            max_num = 50
-            for m in range(max_num):
-                start = start_frame + m
-                if start_frame + (self.seq_len-1)*step > end_frame:
-                    break
-                videos_temp = []
-                seg_temp = []
-                idx_temp = []
-                obj_temp = []
-                for i in range(start, end_frame+1, step):
-                    imgname = f"{str(i).zfill(8)}.jpg"
-                    segname = f"{str(i).zfill(8)}.png"
-                    boxname = f"{str(i).zfill(8)}.json"
-                    objname = f"{str(i).zfill(8)}.npy"
-                    if os.path.isfile(os.path.join(video_folder_path,imgname)):
-                        videos_temp.append(os.path.join(video_folder_path,imgname))
-                        idx_temp.append(i-start_frame)
-                    if os.path.isfile(os.path.join(scenario_path,'mask','background',segname)):
-                        seg_temp.append(os.path.join(scenario_path,'mask','background',segname))
-                    if os.path.isfile(os.path.join(scenario_path,'mask','object',objname)):
-                        obj_temp.append(os.path.join(scenario_path,'mask','object',objname))
-                    if len(videos_temp) == self.seq_len:
-                        break
-                if len(videos_temp) == self.seq_len:
-                    videos.append(videos_temp)
-                    idx.append(idx_temp)
-                    segs.append(seg_temp)
-                    obj_f.append(obj_temp)
+            videos = [[os.path.join(video_folder_path, f"{str(i).zfill(8)}.jpg") for i in w] for w in entry['videos']]
+            idx = entry['idx']
+            segs = entry['segs']
+            obj_f = entry['objs']
 
             self.maps.append(parent_folder)
             self.id.append(basic)
             self.variants.append(variant)
             self.scenario_name.append(os.path.join(parent_folder, basic, variant))
+            self.scenario_paths.append(scenario_path)
             self.videos_list.append(videos)
             self.idx.append(idx)
             self.seg_list.append(segs)
             self.obj_seg_list.append(obj_f)
-            
+        index.save()
 
         if args.box:
             if args.gt:
@@ -141,55 +105,18 @@ class TACO_TEST(Dataset):
 
     def parse_tracklets_detection(self):
         """
-            read {scenario}/tracking_pred_2/tracks/front.txt
+            read {scenario}/tracks/pred/downsampled.txt
             format: frame, id, x, y, w, h
+            into one [num_windows, T, Max_N, 4] store for the split (see tracklet_store.py)
         """
-        
-        def parse_tracklet():
-            # frame_id: {id: [x,y,w,h]}
-            out = {}
-            for line in tracklet:
-                line = line.split(' ')[:6]
-                frame = int(line[0])
-                obj_id = int(line[1])
-                box = [int(line[2]),int(line[3]),int(line[2])+int(line[4]),int(line[3])+int(line[5])]
-                if frame not in out:
-                    out[frame] = {}
-                out[frame][obj_id] = box
-            return out
-            
-        
-        for data,idx in tqdm(zip(self.videos_list,self.idx)):
-            root = data[0][0].split('/')
-            root = root[:-3]
-            root = '/'+os.path.join(*root)
-            f = open(os.path.join(root,'tracks','pred','downsampled.txt'))
-            tracklet = f.readlines()
-            # parse_tracklet
-            tracklet = parse_tracklet()
-            f.close()
-            # for every sample]
-            assert len(data) == len(idx)
-            for i,idx_list in enumerate(idx):
-                out = np.zeros((self.seq_len,self.Max_N,4))
-                obj_id_dict = {}
-                # tracklet id
-                count = 0
-                # img frame id
-                for j,index in enumerate(idx_list):
-                    try:
-                        for obj_id in tracklet[int(index)+1]:
-                            if obj_id not in obj_id_dict:
-                                obj_id_dict[obj_id] = count
-                                count += 1
-                            try:
-                                out[j][obj_id_dict[obj_id]] = tracklet[int(index)+1][obj_id]
-                            except:
-                                continue
-                    except:
-                        continue
-                np.save(os.path.join(root,'tracks','pred','%s' % (i)),out)
-                        
+        self.tracklets = TrackletStore(self.args.root, 'taco_'+self.split+'_data.json', self.seq_len, self.Max_N,
+                                    video_folder=get_video_folder(self.args.model_name),
+                                    index_dir=self.args.index_dir,
+                                    rebuild=self.args.rebuild_index)
+        self.tracklets.build([(self.scenario_name[i],
+                            os.path.join(self.scenario_paths[i],'tracks','pred','downsampled.txt'),
+                            self.idx[i]) for i in range(len(self.videos_list))])
+
     def tracklet_counter(self):
         """
             tracklet (List[List[Dict]]):
@@ -268,11 +195,7 @@ class TACO_TEST(Dataset):
 
         # add tracklets
         if self.args.box:
-            track_path = seq_videos[0].split('/')
-            track_path = track_path[:-3]
-            track_path = '/' + os.path.join(*track_path,'tracks','pred',str(sample_idx)) + '.npy'
-            tracklets = np.load(track_path)
-            data['box'] = tracklets
+            data['box'] = self.tracklets.get(index, sample_idx)
 
         for i in range(self.seq_len):
             x = Image.open(seq_videos[i]).convert('RGB')
@@ -0,0 +1,162 @@
+import os
+import json
+import zlib
+import hashlib
+import warnings
+import numpy as np
+
+STORE_VERSION = 1
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return [st.st_mtime_ns, st.st_size]
+
+
+def read_tracklets(txt_path):
+    """
+        format: frame, id, x, y, w, h (one box per line, extra columns ignored)
+        return: int64 [N, 6] rows of frame, id, x1, y1, x2, y2 in file order
+    """
+    with warnings.catch_warnings():
+        # empty files are valid (no detections)
+        warnings.simplefilter('ignore')
+        rows = np.loadtxt(txt_path, dtype=np.int64, usecols=range(6), ndmin=2)
+    if rows.size == 0:
+        return np.zeros((0, 6), dtype=np.int64)
+    rows[:, 4] += rows[:, 2]
+    rows[:, 5] += rows[:, 3]
+    return rows
+
+
+def window_tracklets(rows, idx_list, max_n):
+    """
+        Boxes of one window, same layout as the old per-window .npy:
+        frame idx+1 of the txt fills position j, track ids take slots in order
+        of first appearance inside the window, ids past max_n are dropped.
+        return: boxes int64 [T, max_n, 4], ids int64 [max_n] (-1 = empty slot)
+    """
+    frames = np.asarray(idx_list, dtype=np.int64) + 1
+    boxes = np.zeros((len(frames), max_n, 4), dtype=np.int64)
+    ids = np.full(max_n, -1, dtype=np.int64)
+
+    sel = rows[np.isin(rows[:, 0], frames)]
+    if len(sel) == 0:
+        return boxes, ids
+    order = np.argsort(frames, kind='stable')
+    pos = order[np.searchsorted(frames[order], sel[:, 0])]
+    # window position first, file order inside a frame
+    sel = sel[np.argsort(pos, kind='stable')]
+    pos = np.sort(pos, kind='stable')
+
+    uniq, first, inverse = np.unique(sel[:, 1], return_index=True, return_inverse=True)
+    rank = np.empty(len(uniq), dtype=np.int64)
+    rank[np.argsort(first, kind='stable')] = np.arange(len(uniq))
+    slot = rank[inverse.reshape(-1)]
+    keep = slot < max_n
+    sel, pos, slot = sel[keep], pos[keep], slot[keep]
+    # the last line of a (frame, id) wins, like the old dict
+    cell = pos * max_n + slot
+    last = len(cell) - 1 - np.unique(cell[::-1], return_index=True)[1]
+    boxes[pos[last], slot[last]] = sel[last, 2:6]
+    ids[rank[rank < max_n]] = uniq[rank < max_n]
+    return boxes, ids
+
+
+class TrackletStore(object):
+    """
+        Detected tracklets of a whole split in one file.
+
+        boxes: int16 [num_windows, T, Max_N, 4] (x1, y1, x2, y2), memmapped read-only,
+        so __getitem__ slices a window without touching the tracking folders.
+        The meta file keeps the track id of every slot and, per scenario, the
+        (mtime, size) of its txt plus a checksum of its windows: a rebuild only
+        reparses scenarios whose tracking output or windows changed.
+    """
+
+    def __init__(self, root, split_name, seq_len, max_n, video_folder='',
+                 index_dir='../datasets/index', rebuild=False):
+        self.seq_len = seq_len
+        self.max_n = max_n
+        self.rebuild = rebuild
+        self.hits = 0
+        self.misses = 0
+
+        key = json.dumps([STORE_VERSION, os.path.abspath(root), split_name, seq_len, max_n, video_folder])
+        key = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+        name = os.path.basename(split_name).split('.')[0]
+        self.boxes_path = os.path.join(index_dir, 'tracks_%s_%s.npy' % (name, key))
+        self.meta_path = os.path.join(index_dir, 'tracks_%s_%s_meta.npz' % (name, key))
+        self.boxes = None
+        self.ids = None
+        self.offsets = None
+
+    def _load_old(self):
+        if self.rebuild or not os.path.isfile(self.meta_path) or not os.path.isfile(self.boxes_path):
+            return {}, None, None
+        try:
+            with np.load(self.meta_path) as meta:
+                scenarios = json.loads(str(meta['scenarios']))
+                ids = meta['ids']
+            boxes = np.load(self.boxes_path, mmap_mode='r')
+        except (OSError, ValueError, KeyError):
+            return {}, None, None
+        return scenarios, boxes, ids
+
+    def build(self, sources):
+        """
+            sources: (scenario key, tracking txt path, windows) per scenario, in dataset order,
+            windows being the idx lists of SampleIndex.windows('idx', i)
+        """
+        old, old_boxes, old_ids = self._load_old()
+        counts = [len(windows) for _, _, windows in sources]
+        offsets = np.zeros(len(sources)+1, dtype=np.int64)
+        offsets[1:] = np.cumsum(counts)
+        total = int(offsets[-1])
+
+        index_dir = os.path.dirname(self.boxes_path)
+        if index_dir and not os.path.isdir(index_dir):
+            os.makedirs(index_dir)
+        tmp_path = self.boxes_path + '.tmp%d.npy' % os.getpid()
+        boxes = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=np.int16,
+                                          shape=(total, self.seq_len, self.max_n, 4))
+        ids = np.full((total, self.max_n), -1, dtype=np.int64)
+        scenarios = {}
+        for i, (name, txt_path, windows) in enumerate(sources):
+            windows = np.asarray(windows, dtype=np.int64).reshape(len(windows), self.seq_len)
+            stamp = _stamp(txt_path) + [zlib.crc32(windows.tobytes())]
+            start, end = int(offsets[i]), int(offsets[i+1])
+            cached = old.get(name)
+            if cached is not None and cached['stamp'] == stamp:
+                self.hits += 1
+                boxes[start:end] = old_boxes[cached['start']:cached['start']+end-start]
+                ids[start:end] = old_ids[cached['start']:cached['start']+end-start]
+            else:
+                self.misses += 1
+                rows = read_tracklets(txt_path)
+                if len(rows) and (rows[:, 2:].min() < -32768 or rows[:, 2:].max() > 32767):
+                    raise ValueError('%s: box coordinates do not fit int16' % txt_path)
+                for w, idx_list in enumerate(windows):
+                    boxes[start+w], ids[start+w] = window_tracklets(rows, idx_list, self.max_n)
+            scenarios[name] = {'stamp': stamp, 'start': start}
+        boxes.flush()
+        del boxes, old_boxes
+
+        tmp_meta = self.meta_path + '.tmp%d.npz' % os.getpid()
+        np.savez(tmp_meta, scenarios=np.array(json.dumps(scenarios)), ids=ids, offsets=offsets)
+        os.replace(tmp_path, self.boxes_path)
+        os.replace(tmp_meta, self.meta_path)
+        print('tracklet store: %d cached, %d parsed -> %s' % (self.hits, self.misses, self.boxes_path))
+
+        self.boxes = np.load(self.boxes_path, mmap_mode='r')
+        self.ids = ids
+        self.offsets = offsets
+
+    def get(self, index, sample_idx):
+        """
+            return: float64 [T, Max_N, 4], same values as the old tracks/pred/<sample_idx>.npy
+        """
+        return self.boxes[self.offsets[index] + sample_idx].astype(np.float64)
+
+    def track_ids(self, index, sample_idx):
+        return self.ids[self.offsets[index] + sample_idx]
@@ -0,0 +1,130 @@
+import os
+import sys
+import random
+from torch.utils.data import Sampler
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from readahead import Readahead, window_files
+
+
+def _pick_windows(samples, index, k):
+    num_windows = samples.num_windows(index)
+    if num_windows >= k:
+        return sorted(random.sample(range(num_windows), k))
+    return sorted(random.randint(0, num_windows-1) for _ in range(k))
+
+
+class ScenarioWindowSampler(Sampler):
+    """
+        Yields (scenario index, window index) pairs, k windows of the same
+        scenario back to back (distinct windows while the scenario has enough).
+
+        The DataLoader hands a whole batch to one worker, so with batch_size a
+        multiple of k the k windows are decoded by the same worker and share
+        its frame cache (frame_cache.py): the overlapping frames are decoded once.
+    """
+
+    def __init__(self, samples, k, shuffle=True):
+        self.samples = samples
+        self.k = k
+        self.shuffle = shuffle
+
+    def __iter__(self):
+        order = list(range(len(self.samples)))
+        if self.shuffle:
+            random.shuffle(order)
+        for index in order:
+            for sample_idx in _pick_windows(self.samples, index, self.k):
+                yield (index, sample_idx)
+
+    def __len__(self):
+        return len(self.samples) * self.k
+
+
+class GroupShuffleSampler(Sampler):
+    """
+        Storage-local shuffling: every epoch the groups (TACO: map/basic scenario,
+        one directory tree) come in a random order and their scenarios in a random
+        order within the group, then the order is cut into blocks of `block`
+        samples that are shuffled internally. A batch mixes the few groups of its
+        block while the reads of a block stay inside a few neighbouring trees.
+
+        The window of every sample is drawn here (k per scenario as
+        ScenarioWindowSampler), so the whole order of the epoch is known up
+        front and can be handed to a Readahead.
+    """
+
+    def __init__(self, samples, groups, block, k=1, readahead=None):
+        self.samples = samples
+        self.k = max(1, k)
+        self.block = max(1, block)
+        self.readahead = readahead
+        self.groups = {}
+        for index, group in enumerate(groups):
+            self.groups.setdefault(group, []).append(index)
+        self.groups = list(self.groups.values())
+
+    def epoch_order(self):
+        groups = [list(g) for g in self.groups]
+        random.shuffle(groups)
+        order = []
+        for g in groups:
+            random.shuffle(g)
+            for index in g:
+                order.extend((index, sample_idx) for sample_idx in _pick_windows(self.samples, index, self.k))
+        # runs of the k windows of a scenario are shuffled as a unit, so they stay
+        # adjacent (shared frame cache) while the block still mixes its groups
+        runs = [order[i:i+self.k] for i in range(0, len(order), self.k)]
+        run_block = max(1, self.block // self.k)
+        blocks = [runs[i:i+run_block] for i in range(0, len(runs), run_block)]
+        for b in blocks:
+            random.shuffle(b)
+        return [item for b in blocks for run in b for item in run]
+
+    def __iter__(self):
+        order = self.epoch_order()
+        if self.readahead is not None:
+            self.readahead.start(order)
+        for item in order:
+            if self.readahead is not None:
+                self.readahead.advance()
+            yield item
+
+    def __len__(self):
+        return len(self.samples) * self.k
+
+
+def scenario_window_sampler(dataset, k, batch_size):
+    """
+        None (plain shuffling) for k <= 1, the dataloader's `shuffle` must then stay on
+    """
+    if k <= 1:
+        return None
+    if batch_size % k != 0:
+        print('windows_per_scenario %d does not divide batch_size %d, some scenarios will be split across workers'
+              % (k, batch_size))
+    return ScenarioWindowSampler(dataset.samples, k)
+
+
+def locality_groups(dataset):
+    """
+        TACO: map/basic scenario of every scenario, otherwise its frame folder
+    """
+    if hasattr(dataset, 'maps') and hasattr(dataset, 'id'):
+        return ['%s/%s' % (m, b) for m, b in zip(dataset.maps, dataset.id)]
+    return [dataset.samples.prefix('video', i) for i in range(len(dataset))]
+
+
+def make_train_sampler(dataset, args):
+    """
+        --group_shuffle / --readahead: GroupShuffleSampler (with a Readahead),
+        otherwise scenario_window_sampler(); None means plain shuffling
+    """
+    if args.group_shuffle <= 0 and args.readahead <= 0:
+        return scenario_window_sampler(dataset, args.windows_per_scenario, args.batch_size)
+    readahead = None
+    if args.readahead > 0:
+        readahead = Readahead(window_files(dataset), depth=args.readahead, mode=args.readahead_mode)
+    # --readahead alone keeps the randomness of a plain shuffle: one group per scenario
+    groups = locality_groups(dataset) if args.group_shuffle > 0 else range(len(dataset))
+    return GroupShuffleSampler(dataset.samples, groups, max(1, args.group_shuffle),
+                               k=args.windows_per_scenario, readahead=readahead)
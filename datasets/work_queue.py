@@ -0,0 +1,290 @@
+import os
+import sys
+import time
+import json
+import socket
+import argparse
+import threading
+import traceback
+import multiprocessing as mp
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(HERE)
+sys.path.append(os.path.join(HERE, '..', 'scripts'))
+
+TOWN_LIST = ['interactive', 'non-interactive', 'ap_Town01',
+        'ap_Town02','ap_Town03', 'ap_Town04', 'ap_Town05', 'ap_Town06', 'ap_Town07', 'ap_Town10HD',
+        'runner_Town03','runner_Town05', 'runner_Town10HD']
+
+
+# ------------ jobs: one call per scenario ({map}/{basic}/variant_scenario/{variant}) ------------
+
+def job_downsample(path):
+    from preprocess_frames import PRESETS, parse_target, list_frames, thread
+    src_dir = os.path.join(path, 'rgb', 'front')
+    decoded, written, failed = thread('taco', src_dir, os.path.join(path, 'rgb'), list_frames(src_dir),
+                                      [parse_target(t) for t in PRESETS['taco']], 75, False)
+    if failed:
+        raise RuntimeError('\n'.join(failed))
+    return decoded
+
+
+def job_object_mask(path):
+    from instance_object_mask import process_variant
+    return process_variant(path)
+
+
+def job_mask2box(path):
+    from mask2box import scenario_boxes
+    return scenario_boxes(path, save_bbox=True)
+
+
+def job_box(path):
+    from mask_to_box import scenario_boxes
+    return scenario_boxes(path)
+
+
+def job_frame_pack(path):
+    from frame_pack import pack_folder
+    return sum(pack_folder(os.path.join(path, 'rgb', f)) for f in ('downsampled', 'downsampled_224')
+               if os.path.isdir(os.path.join(path, 'rgb', f)))
+
+
+def job_obj_mask_store(path):
+    from obj_mask_store import pack_object_masks
+    return pack_object_masks(os.path.join(path, 'mask', 'object'))
+
+
+JOBS = {
+    'downsample': job_downsample,
+    'object_mask': job_object_mask,
+    'mask2box': job_mask2box,
+    'box': job_box,
+    'frame_pack': job_frame_pack,
+    'obj_mask_store': job_obj_mask_store,
+}
+
+
+def list_scenarios(root, maps):
+    out = []
+    for m in maps:
+        map_path = os.path.join(root, m)
+        if not os.path.isdir(map_path):
+            continue
+        for basic in sorted(os.listdir(map_path)):
+            variant_root = os.path.join(map_path, basic, 'variant_scenario')
+            if not os.path.isdir(variant_root):
+                continue
+            for variant in sorted(os.listdir(variant_root)):
+                if os.path.isdir(os.path.join(variant_root, variant)):
+                    out.append(os.path.join(m, basic, 'variant_scenario', variant))
+    return out
+
+
+class WorkQueue(object):
+    """
+        Scenario queue in a directory shared by every worker, on any host:
+            queue.json      job name, root and the scenario list (job id = position)
+            lease/{id}      held by one worker, created with O_CREAT | O_EXCL,
+                            its mtime is refreshed while the job runs
+            done/{id}       finished
+            failed/{id}     one line per failed attempt
+
+        A lease whose mtime is older than ttl belongs to a dead worker: it is
+        renamed away (only one worker can win the rename) and the job is leased
+        again. Expiry compares the file mtime with the local clock, so hosts
+        need roughly synchronised clocks (well under ttl).
+    """
+
+    def __init__(self, workdir):
+        self.workdir = workdir
+        with open(os.path.join(workdir, 'queue.json')) as f:
+            queue = json.load(f)
+        self.job = queue['job']
+        self.root = queue['root']
+        self.scenarios = queue['scenarios']
+        self.owner = '%s:%d' % (socket.gethostname(), os.getpid())
+
+    @staticmethod
+    def create(workdir, job, root, scenarios):
+        for d in ('lease', 'done', 'failed'):
+            os.makedirs(os.path.join(workdir, d), exist_ok=True)
+        path = os.path.join(workdir, 'queue.json')
+        if os.path.isfile(path):
+            raise FileExistsError('%s already holds a queue' % workdir)
+        tmp_path = path + '.tmp%d' % os.getpid()
+        with open(tmp_path, 'w') as f:
+            json.dump({'job': job, 'root': root, 'scenarios': scenarios}, f)
+        os.replace(tmp_path, path)
+
+    def _path(self, kind, job_id):
+        return os.path.join(self.workdir, kind, '%07d' % job_id)
+
+    def _ids(self, kind):
+        return set(int(n) for n in os.listdir(os.path.join(self.workdir, kind)) if n.isdigit())
+
+    def attempts(self, job_id):
+        try:
+            with open(self._path('failed', job_id)) as f:
+                return sum(1 for _ in f)
+        except OSError:
+            return 0
+
+    def lease(self, job_id, ttl):
+        """
+            return True when this worker now holds the job
+        """
+        path = self._path('lease', job_id)
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            try:
+                age = time.time() - os.stat(path).st_mtime
+            except FileNotFoundError:
+                return False
+            if age < ttl:
+                return False
+            # stale: the first worker to rename it retries the lease, the others lose
+            stale = path + '.stale.' + self.owner.replace(':', '.')
+            try:
+                os.rename(path, stale)
+            except FileNotFoundError:
+                return False
+            if time.time() - os.stat(stale).st_mtime < ttl:
+                # another worker re-leased it since our stat: give it back
+                try:
+                    os.link(stale, path)
+                except FileExistsError:
+                    pass
+                os.remove(stale)
+                return False
+            os.remove(stale)
+            try:
+                fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                return False
+        os.write(fd, self.owner.encode('utf-8'))
+        os.close(fd)
+        # done between our listing and the lease
+        if os.path.exists(self._path('done', job_id)):
+            self.release(job_id)
+            return False
+        return True
+
+    def release(self, job_id):
+        try:
+            os.remove(self._path('lease', job_id))
+        except FileNotFoundError:
+            pass
+
+    def finish(self, job_id, result):
+        with open(self._path('done', job_id), 'w') as f:
+            f.write('%s %s\n' % (self.owner, result))
+        self.release(job_id)
+
+    def fail(self, job_id, error):
+        with open(self._path('failed', job_id), 'a') as f:
+            f.write(json.dumps({'owner': self.owner, 'time': time.time(), 'error': error}) + '\n')
+        self.release(job_id)
+
+    def status(self):
+        done = self._ids('done')
+        leased = self._ids('lease') - done
+        failed = self._ids('failed') - done
+        return {'total': len(self.scenarios), 'done': len(done), 'leased': len(leased),
+                'failed': len(failed), 'pending': len(self.scenarios) - len(done) - len(leased)}
+
+
+def _heartbeat(path, interval, stop):
+    while not stop.wait(interval):
+        try:
+            os.utime(path)
+        except OSError:
+            return
+
+
+def worker(workdir, worker_idx, ttl, max_attempts):
+    queue = WorkQueue(workdir)
+    run = JOBS[queue.job]
+    n = len(queue.scenarios)
+    # spread the workers over the list so they rarely race for the same lease
+    offset = (hash(queue.owner) + worker_idx * 7919) % max(n, 1)
+    processed = 0
+    start = time.time()
+    while True:
+        done = queue._ids('done')
+        if len(done) >= n:
+            break
+        leased_any = False
+        for k in range(n):
+            job_id = (offset + k) % n
+            if job_id in done or queue.attempts(job_id) >= max_attempts:
+                continue
+            if not queue.lease(job_id, ttl):
+                continue
+            leased_any = True
+            stop = threading.Event()
+            beat = threading.Thread(target=_heartbeat, args=(queue._path('lease', job_id), ttl/3.0, stop), daemon=True)
+            beat.start()
+            try:
+                result = run(os.path.join(queue.root, queue.scenarios[job_id]))
+                queue.finish(job_id, result)
+                processed += 1
+            except Exception:
+                queue.fail(job_id, traceback.format_exc())
+                print('%s failed %s' % (queue.owner, queue.scenarios[job_id]))
+            finally:
+                stop.set()
+                beat.join()
+            if processed and processed % 10 == 0:
+                print('%s: %d scenarios, %.2f scenarios/s' % (queue.owner, processed, processed/(time.time()-start)))
+                sys.stdout.flush()
+        if not leased_any:
+            status = queue.status()
+            # only live leases left (or jobs out of attempts): wait for them to finish or expire
+            if status['leased'] == 0:
+                break
+            time.sleep(min(ttl/3.0, 30))
+    print('%s: finished, %d scenarios in %.1fs' % (queue.owner, processed, time.time()-start))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest='command')
+    init = sub.add_parser('init', help='enumerate the scenarios into a new work directory')
+    init.add_argument('--workdir', type=str, required=True)
+    init.add_argument('--job', type=str, required=True, choices=list(JOBS.keys()))
+    init.add_argument('--root', type=str, required=True, help='TACO data_collection path')
+    init.add_argument('--maps', type=str, nargs='+', default=TOWN_LIST)
+    run = sub.add_parser('run', help='lease and process scenarios until the queue is empty')
+    run.add_argument('--workdir', type=str, required=True)
+    run.add_argument('--num_workers', type=int, default=12)
+    run.add_argument('--ttl', type=float, default=600, help='seconds without heartbeat before a lease is taken over')
+    run.add_argument('--max_attempts', type=int, default=3)
+    status = sub.add_parser('status')
+    status.add_argument('--workdir', type=str, required=True)
+    args = parser.parse_args()
+
+    if args.command == 'init':
+        scenarios = list_scenarios(args.root, args.maps)
+        WorkQueue.create(args.workdir, args.job, os.path.abspath(args.root), scenarios)
+        print('%d scenarios -> %s' % (len(scenarios), args.workdir))
+    elif args.command == 'run':
+        start = time.time()
+        total = WorkQueue(args.workdir).status()['done']
+        procs = [mp.Process(target=worker, args=(args.workdir, i, args.ttl, args.max_attempts))
+                 for i in range(args.num_workers)]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+        status = WorkQueue(args.workdir).status()
+        elapsed = time.time() - start
+        print('%s' % status)
+        print('%d scenarios done by %d workers on this host in %.1fs' % (status['done'] - total, args.num_workers, elapsed))
+    else:
+        print(WorkQueue(args.workdir).status())
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,7 @@ import sys
 sys.path.append('/media/hcis-s19/DATA/Action-Slot/scripts')
 from utils import *
 from base_model import Object_based
+from video_input import clip_dims
 from classifier import Head
 
 def calc_pairwise_distance_3d(X, Y):
@@ -140,8 +141,7 @@ class ARG(Object_based):
             box = box.reshape(-1,self.max_N,4)
             box = list(box)
             
-        T = len(x)
-        B = x[0].shape[0]
+        T, B, _, _ = clip_dims(x)
         assert len(box) == B*T
         
         features = self.extract_features(x) # b,d,t,H,W
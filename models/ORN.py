@@ -5,6 +5,7 @@ import torch.nn.functional as F
 import numpy as np
 from utils import *
 from base_model import Object_based
+from video_input import clip_dims
 from classifier import Head
 import random
 
@@ -173,8 +174,7 @@ class ORN(Object_based):
             # zeros_object = zeros_object.unsqueeze(-1).repeat(1,1,self.NFB).float()
             box = list(box)
             
-        T = len(x)
-        B = x[0].shape[0]
+        T, B, _, _ = clip_dims(x)
         assert len(box) == B*T
         
         features = self.extract_features(x) # b,d,t,H,W
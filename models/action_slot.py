@@ -7,14 +7,19 @@ from pytorchvideo.models.hub import i3d_r50
 from pytorchvideo.models.hub import csn_r101
 from pytorchvideo.models.hub import mvit_base_16x4
 import r50
+from video_input import clip_dims, to_clip, to_frames
+from chunked_attention import slot_attention
+from frame_features import backbone_frames
 import numpy as np
 from math import ceil 
 from ptflops import get_model_complexity_info
 
 class SlotAttention(nn.Module):
-    def __init__(self, num_slots, dim, num_actor_class=64, eps=1e-8, input_dim=64, resolution=[16, 8, 24], allocated_slot=True):
+    def __init__(self, num_slots, dim, num_actor_class=64, eps=1e-8, input_dim=64, resolution=[16, 8, 24], allocated_slot=True, chunk=0):
         super().__init__()
         self.dim = dim
+        # > 0: attention over the tokens `chunk` at a time (see chunked_attention.py)
+        self.chunk = chunk
         self.num_slots = num_slots
         self.num_actor_class = num_actor_class
         self.allocated_slot = allocated_slot
@@ -50,6 +55,20 @@ class SlotAttention(nn.Module):
 
         slots = slots.contiguous()
         self.register_buffer("slots", slots)
+        # to_q(norm_slots(slots)), set by freeze()
+        self.register_buffer("slots_q", None, persistent=False)
+
+    def freeze(self):
+        """
+            precompute the slot queries, self.slots is a fixed buffer
+        """
+        self.slots_q = self.to_q(self.norm_slots(self.slots)).detach()
+        self.pe.freeze()
+
+    def unfreeze(self):
+        self.slots_q = None
+        self.pe.unfreeze()
+
     def extend_slots(self):
         mu = self.slots_mu.expand(1, 29, -1)
         sigma = self.slots_sigma.expand(1, 29, -1)
@@ -93,12 +112,12 @@ class SlotAttention(nn.Module):
         b, n, d = inputs.shape
         inputs = self.norm_input(inputs)
         k, v = self.to_k(inputs), self.to_v(inputs)
-        slots = self.norm_slots(slots)
-        q = self.to_q(slots)
-        dots = torch.einsum('bid,bjd->bij', q, k) * self.scale
-        attn_ori = dots.softmax(dim=1) + self.eps
-        attn = attn_ori / attn_ori.sum(dim=-1, keepdim=True)
-        slots = torch.einsum('bjd,bij->bid', v, attn)
+        if self.slots_q is not None:
+            q = self.slots_q.expand(b, -1, -1)
+        else:
+            slots = self.norm_slots(slots)
+            q = self.to_q(slots)
+        slots, attn_ori = slot_attention(q, k, v, self.scale, self.eps, self.chunk, slot_softmax=True)
 
         slots = slots.reshape(b, -1, d)
         if self.allocated_slot:
@@ -135,7 +154,18 @@ class SoftPositionEmbed3D(nn.Module):
         super().__init__()
         self.embedding = nn.Linear(6, hidden_size, bias=True)
         self.register_buffer("grid", build_3d_grid(resolution))
+        # embedding(grid), set by freeze()
+        self.register_buffer("grid_embed", None, persistent=False)
+
+    def freeze(self):
+        self.grid_embed = self.embedding(self.grid).detach()
+
+    def unfreeze(self):
+        self.grid_embed = None
+
     def forward(self, inputs):
+        if self.grid_embed is not None:
+            return inputs + self.grid_embed
         grid = self.embedding(self.grid)
         return inputs + grid
 
@@ -190,6 +220,8 @@ class ACTION_SLOT(nn.Module):
         #     self.num_slots = 93
         self.resnet = i3d_r50(True)
         self.args = args
+        # r50: per-frame cache of the frozen blocks (see frame_features.py)
+        self.frame_features = None
 
 
         if args.backbone == 'r50':
@@ -276,7 +308,8 @@ class ACTION_SLOT(nn.Module):
                 eps = 1e-8,
                 input_dim=self.hidden_dim2,
                 resolution=self.resolution3d,
-                num_actor_class = num_actor_class
+                num_actor_class = num_actor_class,
+                chunk = args.slot_chunk
                 ) 
         else:
             self.slot_attention = SlotAttention(
@@ -285,7 +318,8 @@ class ACTION_SLOT(nn.Module):
                 eps = 1e-8,
                 input_dim=self.hidden_dim2,
                 resolution=self.resolution3d,
-                num_actor_class = num_actor_class
+                num_actor_class = num_actor_class,
+                chunk = args.slot_chunk
                 ) 
 
         self.drop = nn.Dropout(p=0.5)         
@@ -370,45 +404,71 @@ class ACTION_SLOT(nn.Module):
         #self.ego_fc = DynamicLinear(self.ego_c).to(self.args.device)
         #self.combined_fc = DynamicLinear(self.slot_dim*2).to(self.args.device)
         self.SA = SelfAttention(self.slot_dim).to(self.args.device)
+        # embedding_fc(action_embedding_tensor), set by freeze_for_inference()
+        self.register_buffer("action_embed", None, persistent=False)
+
+    def freeze_for_inference(self):
+        """
+            eval() plus the tensors forward() derives from the weights alone
+            precomputed into buffers: the projected action embedding, the slot
+            queries and the 3D position embedding.
+            Call it again after loading other weights, train() drops them.
+        """
+        self.eval()
+        with torch.no_grad():
+            self.action_embed = self.embedding_fc(self.action_embedding_tensor, self.slot_dim).unsqueeze(0)
+            self.slot_attention.freeze()
+        return self
+
+    def train(self, mode=True):
+        if mode:
+            self.action_embed = None
+            self.slot_attention.unfreeze()
+        return super(ACTION_SLOT, self).train(mode)
 
 
 
-    def forward(self, x, box=False):
-        seq_len = len(x)
-        batch_size = x[0].shape[0]
-        height, width = x[0].shape[2], x[0].shape[3]
+    def backbone_prefix(self, x, num_blocks):
+        """
+            x3d/i3d: the clip through the first num_blocks backbone blocks [b, c, t, h, w]
+        """
+        x = to_clip(x)
+        for i in range(num_blocks):
+            x = self.resnet[i](x)
+        return x
+
+    def forward(self, x, box=False, prefix=0, frame_keys=None):
+        # x: list of T frames [b, C, h, w] or a stacked clip [b, C, T, h, w]
+        # prefix > 0: x already went through resnet[:prefix] (cached, see datasets/feature_cache.py)
+        if prefix > 0:
+            seq_len, batch_size = self.args.seq_len, x.shape[0]
+        else:
+            seq_len, batch_size, height, width = clip_dims(x)
 
-        if self.args.backbone == 'r50':
-            if isinstance(x, list):
-                x = torch.stack(x, dim=0) #[T, b, C, h, w]
-                x = torch.reshape(x, (seq_len*batch_size, 3, height, width))
-                x = self.resnet(x)
-                _, c, h, w  = x.shape
-                x = torch.reshape(x, (self.args.seq_len, batch_size, c, h, w))
-                x = x.permute(1, 2, 0, 3, 4)
+        if prefix > 0:
+            for i in range(prefix, len(self.resnet)):
+                x = self.resnet[i](x)
+
+        elif self.args.backbone == 'r50':
+            x = to_frames(x) #[T, b, C, h, w]
+            x = torch.reshape(x, (seq_len*batch_size, 3, height, width))
+            x = backbone_frames(self.resnet, x, frame_keys, self.frame_features)
+            _, c, h, w  = x.shape
+            x = torch.reshape(x, (self.args.seq_len, batch_size, c, h, w))
+            x = x.permute(1, 2, 0, 3, 4)
 
         elif self.args.backbone == 'slowfast':
-            slow_x = []
-            for i in range(0, seq_len, 4):
-                slow_x.append(x[i])
-            if isinstance(x, list):
-                x = torch.stack(x, dim=0) #[v, b, 2048, h, w]
-                slow_x = torch.stack(slow_x, dim=0)
-                # l, b, c, h, w
-                x = x.permute((1,2,0,3,4)) #[b, v, 2048, h, w]
-                slow_x = slow_x.permute((1,2,0,3,4))
-                x = [slow_x, x]
-
-                for i in range(len(self.resnet)):
-                    x = self.resnet[i](x)
-                x[1] = self.path_pool(x[1])
-                x = torch.cat((x[0], x[1]), dim=1)
+            x = to_clip(x) #[b, C, T, h, w]
+            slow_x = x[:, :, ::4]
+            x = [slow_x, x]
+
+            for i in range(len(self.resnet)):
+                x = self.resnet[i](x)
+            x[1] = self.path_pool(x[1])
+            x = torch.cat((x[0], x[1]), dim=1)
 
         else:
-            if isinstance(x, list):
-                x = torch.stack(x, dim=0) #[T, b, C, h, w]
-                # l, b, c, h, w
-                x = x.permute((1,2,0,3,4)) #[b, C, T, h, w]
+            x = to_clip(x) #[b, C, T, h, w]
             for i in range(len(self.resnet)):
                 x = self.resnet[i](x)
 
@@ -452,8 +512,11 @@ class ACTION_SLOT(nn.Module):
         attn_masks = attn_masks.permute((0, 2, 1, 3, 4))
 
         #initializing embedding
-        action_embed = self.embedding_fc(self.action_embedding_tensor, x.size(-1))
-        action_embed = action_embed.unsqueeze(0).repeat(x.size(0), 1, 1)  # [x(0), 64, 256]
+        if self.action_embed is not None:
+            action_embed = self.action_embed # [1, 64, 256], broadcast over the batch
+        else:
+            action_embed = self.embedding_fc(self.action_embedding_tensor, x.size(-1))
+            action_embed = action_embed.unsqueeze(0).repeat(x.size(0), 1, 1)  # [x(0), 64, 256]
 
         #x = torch.cat((x, action_embed),dim=-1)
         x = x + action_embed
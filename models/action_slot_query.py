@@ -8,14 +8,18 @@ from pytorchvideo.models.hub import csn_r101
 from pytorchvideo.models.hub import mvit_base_16x4
 import inception
 import r50
+from video_input import clip_dims, to_clip, to_frames
+from chunked_attention import slot_attention
 import numpy as np
 from math import ceil 
 from ptflops import get_model_complexity_info
 
 class SlotAttention(nn.Module):
-    def __init__(self, num_slots, dim, num_actor_class=64, eps=1e-8, input_dim=64, resolution=[16, 8, 24], allocated_slot=True):
+    def __init__(self, num_slots, dim, num_actor_class=64, eps=1e-8, input_dim=64, resolution=[16, 8, 24], allocated_slot=True, chunk=0):
         super().__init__()
         self.dim = dim
+        # > 0: attention over the tokens `chunk` at a time (see chunked_attention.py)
+        self.chunk = chunk
         self.num_slots = num_slots
         self.num_actor_class = num_actor_class
         self.allocated_slot = allocated_slot
@@ -95,12 +99,8 @@ class SlotAttention(nn.Module):
         slots = self.norm_slots(slots)
         q = self.to_q(slots)
 
-        dots = torch.einsum('bid,bjd->bij', q, k) * self.scale
-        attn_ori = dots.softmax(dim=-1) + self.eps
-        attn = attn_ori / attn_ori.sum(dim=-1, keepdim=True)
-
         # updates = torch.einsum('bjd,bij->bid', v, attn)
-        slots = torch.einsum('bjd,bij->bid', v, attn)
+        slots, attn_ori = slot_attention(q, k, v, self.scale, self.eps, self.chunk, slot_softmax=False)
         # slots = self.gru(
         #     updates.reshape(-1, d),
         #     slots_prev.reshape(-1, d)
@@ -293,7 +293,8 @@ class ACTION_SLOT_QUERY(nn.Module):
                 eps = 1e-8,
                 input_dim=self.hidden_dim2,
                 resolution=self.resolution3d,
-                num_actor_class = num_actor_class
+                num_actor_class = num_actor_class,
+                chunk = args.slot_chunk
                 ) 
         else:
             self.slot_attention = SlotAttention(
@@ -302,7 +303,8 @@ class ACTION_SLOT_QUERY(nn.Module):
                 eps = 1e-8,
                 input_dim=self.hidden_dim2,
                 resolution=self.resolution3d,
-                num_actor_class = num_actor_class
+                num_actor_class = num_actor_class,
+                chunk = args.slot_chunk
                 ) 
 
         self.drop = nn.Dropout(p=0.5)         
@@ -310,15 +312,12 @@ class ACTION_SLOT_QUERY(nn.Module):
 
 
     def forward(self, x, box=False):
-        seq_len = len(x)
-        batch_size = x[0].shape[0]
-        height, width = x[0].shape[2], x[0].shape[3]
+        seq_len, batch_size, height, width = clip_dims(x)
 
         
         if self.args.backbone == 'inception' or self.args.backbone == 'r50':
-            if isinstance(x, list):
-                x = torch.stack(x, dim=0) #[T, b, C, h, w]
-                x = torch.reshape(x, (seq_len*batch_size, 3, height, width))
+            x = to_frames(x) #[T, b, C, h, w]
+            x = torch.reshape(x, (seq_len*batch_size, 3, height, width))
 
         elif self.args.backbone != 'slowfast':
             if isinstance(x, list):
@@ -328,21 +327,14 @@ class ACTION_SLOT_QUERY(nn.Module):
         
         # ---- backbone forward ----
         if self.args.backbone == 'slowfast':
-            slow_x = []
-            for i in range(0, seq_len, 4):
-                slow_x.append(x[i])
-            if isinstance(x, list):
-                x = torch.stack(x, dim=0) #[v, b, 2048, h, w]
-                slow_x = torch.stack(slow_x, dim=0)
-                # l, b, c, h, w
-                x = torch.permute(x, (1,2,0,3,4)) #[b, v, 2048, h, w]
-                slow_x = torch.permute(slow_x, (1,2,0,3,4))
-                x = [slow_x, x]
-
-                for i in range(len(self.resnet)):
-                    x = self.resnet[i](x)
-                x[1] = self.path_pool(x[1])
-                x = torch.cat((x[0], x[1]), dim=1)
+            x = to_clip(x) #[b, C, T, h, w]
+            slow_x = x[:, :, ::4]
+            x = [slow_x, x]
+
+            for i in range(len(self.resnet)):
+                x = self.resnet[i](x)
+            x[1] = self.path_pool(x[1])
+            x = torch.cat((x[0], x[1]), dim=1)
 
         elif self.args.backbone == 'mvit':
             x = self.model.patch_embed(x) # torch.Size([8, 25088, 96])
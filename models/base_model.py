@@ -2,6 +2,7 @@ import torch
 import torch.nn as nn
 from pytorchvideo.models.hub import i3d_r50
 from torchvision.ops import roi_align
+from video_input import to_clip
 
 class ROI_ALIGN(nn.Module):
     def __init__(self,kernel_size,scale=1.0):
@@ -99,23 +100,15 @@ class Base(nn.Module):
             self.resolution3d = (8, 8, 24)
             
     def extract_features(self,x):
-        seq_len = len(x)
         if self.args.backbone == 'slowfast':
-            slow_x = []
-            for i in range(0, seq_len, 4):
-                slow_x.append(x[i])
-            if isinstance(x, list):
-                x = torch.stack(x, dim=0) #[v, b, 2048, h, w]
-                slow_x = torch.stack(slow_x, dim=0)
-                # l, b, c, h, w
-                x = torch.permute(x, (1,2,0,3,4)) #[b, v, 2048, h, w]
-                slow_x = torch.permute(slow_x, (1,2,0,3,4))
-                x = [slow_x, x]
+            x = to_clip(x) #[b, C, T, h, w]
+            slow_x = x[:, :, ::4]
+            x = [slow_x, x]
 
-                for i in range(len(self.resnet)):
-                    x = self.resnet[i](x)
-                x[1] = self.path_pool(x[1])
-                x = torch.cat((x[0], x[1]), dim=1)
+            for i in range(len(self.resnet)):
+                x = self.resnet[i](x)
+            x[1] = self.path_pool(x[1])
+            x = torch.cat((x[0], x[1]), dim=1)
         else:
             if isinstance(x, list):
                 x = torch.stack(x, dim=0) #[v, b, 2048, h, w]
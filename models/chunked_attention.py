@@ -0,0 +1,108 @@
+import torch
+
+
+def slot_attention_exact(q, k, v, scale, eps, slot_softmax=True):
+    """
+        the unchunked slot attention step of get_3d_slot()
+        q: [b, K, d] slot queries, k, v: [b, N, d] tokens
+        slot_softmax: softmax over the slots (action_slot) or over the tokens (action_slot_query)
+        return: updates [b, K, d], attn_ori [b, K, N]
+    """
+    dots = torch.einsum('bid,bjd->bij', q, k) * scale
+    attn_ori = dots.softmax(dim=1 if slot_softmax else -1) + eps
+    attn = attn_ori / attn_ori.sum(dim=-1, keepdim=True)
+    updates = torch.einsum('bjd,bij->bid', v, attn)
+    return updates, attn_ori
+
+
+class ChunkedSlotAttention(torch.autograd.Function):
+    """
+        Same result as slot_attention_exact(), the N tokens taken `chunk` at a time.
+
+        The renormalisation over the tokens only needs the per-slot sums S of
+        attn_ori, so forward accumulates S and U = attn_ori @ v chunk by chunk and
+        updates = U / S; dots, the softmax and the renormalised attn never exist
+        for all tokens at once. Only attn_ori (an output) is [b, K, N].
+        Backward keeps q, k, v and recomputes every chunk instead of saving
+        the intermediates. A token-axis softmax first takes the per-slot
+        logsumexp over all chunks.
+    """
+
+    @staticmethod
+    def _probs(q, k, scale, slot_softmax, lse):
+        dots = torch.einsum('bid,bjd->bij', q, k) * scale
+        if slot_softmax:
+            return dots.softmax(dim=1)
+        return torch.exp(dots - lse.unsqueeze(-1))
+
+    @staticmethod
+    def forward(ctx, q, k, v, scale, eps, chunk, slot_softmax):
+        b, num_slots, d = q.shape
+        n = k.shape[1]
+        chunks = [(s, min(s+chunk, n)) for s in range(0, n, chunk)]
+        lse = None
+        if not slot_softmax:
+            lse = torch.full((b, num_slots), float('-inf'), dtype=q.dtype, device=q.device)
+            for s, e in chunks:
+                dots = torch.einsum('bid,bjd->bij', q, k[:, s:e]) * scale
+                lse = torch.logaddexp(lse, torch.logsumexp(dots, dim=-1))
+        attn_ori = q.new_empty((b, num_slots, n))
+        sums = q.new_zeros((b, num_slots))
+        updates = q.new_zeros((b, num_slots, v.shape[-1]))
+        for s, e in chunks:
+            a = ChunkedSlotAttention._probs(q, k[:, s:e], scale, slot_softmax, lse) + eps
+            attn_ori[:, :, s:e] = a
+            sums += a.sum(dim=-1)
+            updates += torch.einsum('bij,bjd->bid', a, v[:, s:e])
+        updates = updates / sums.unsqueeze(-1)
+        ctx.save_for_backward(q, k, v, sums, updates, lse)
+        ctx.scale, ctx.eps, ctx.chunks, ctx.slot_softmax = scale, eps, chunks, slot_softmax
+        ctx.set_materialize_grads(False)
+        return updates, attn_ori
+
+    @staticmethod
+    def backward(ctx, grad_updates, grad_attn):
+        q, k, v, sums, updates, lse = ctx.saved_tensors
+        scale, eps, chunks, slot_softmax = ctx.scale, ctx.eps, ctx.chunks, ctx.slot_softmax
+        if grad_updates is None:
+            grad_updates = torch.zeros_like(updates)
+        # updates = U / S
+        grad_u = grad_updates / sums.unsqueeze(-1)
+        grad_s = -(grad_updates * updates).sum(dim=-1) / sums
+
+        def chunk_grads(s, e):
+            p = ChunkedSlotAttention._probs(q, k[:, s:e], scale, slot_softmax, lse)
+            grad_a = torch.einsum('bid,bjd->bij', grad_u, v[:, s:e]) + grad_s.unsqueeze(-1)
+            if grad_attn is not None:
+                grad_a = grad_a + grad_attn[:, :, s:e]
+            return p, grad_a
+
+        # softmax backward needs sum(p * grad) along its axis, over all chunks for the tokens
+        if not slot_softmax:
+            row = torch.zeros_like(sums)
+            for s, e in chunks:
+                p, grad_a = chunk_grads(s, e)
+                row += (p * grad_a).sum(dim=-1)
+        grad_q = torch.zeros_like(q)
+        grad_k = torch.empty_like(k)
+        grad_v = torch.empty_like(v)
+        for s, e in chunks:
+            p, grad_a = chunk_grads(s, e)
+            grad_v[:, s:e] = torch.einsum('bij,bid->bjd', p + eps, grad_u)
+            if slot_softmax:
+                grad_dots = p * (grad_a - (p * grad_a).sum(dim=1, keepdim=True))
+            else:
+                grad_dots = p * (grad_a - row.unsqueeze(-1))
+            grad_q += torch.einsum('bij,bjd->bid', grad_dots, k[:, s:e]) * scale
+            grad_k[:, s:e] = torch.einsum('bij,bid->bjd', grad_dots, q) * scale
+        return grad_q, grad_k, grad_v, None, None, None, None
+
+
+def slot_attention(q, k, v, scale, eps, chunk=0, slot_softmax=True):
+    """
+        chunk <= 0 or at most `chunk` tokens: the exact current math,
+        otherwise ChunkedSlotAttention
+    """
+    if chunk <= 0 or k.shape[1] <= chunk:
+        return slot_attention_exact(q, k, v, scale, eps, slot_softmax)
+    return ChunkedSlotAttention.apply(q, k, v, scale, eps, chunk, slot_softmax)
@@ -1,5 +1,7 @@
+import math
 import torch
 import torch.nn as nn
+import torch.nn.functional as F
 
 class Head(nn.Module):
 	def __init__(self, in_channel, num_ego_classes, num_actor_classes, ego_channel=0):
@@ -48,23 +50,33 @@ class Allocated_Head(nn.Module):
 		                nn.Linear(ego_channel, num_ego_classes),
 		                )
 				
-		self.fc_actor = nn.ModuleList()
-		for i in range(num_actor_classes):
-			self.fc_actor.append(nn.Sequential(
-	                nn.ReLU(inplace=False),
-	                nn.Linear(in_channel, 1),
-	                )
-				)
+		# one Linear(in_channel, 1) per class, stacked: row i scores slot i
+		self.fc_actor_weight = nn.Parameter(torch.empty(num_actor_classes, in_channel))
+		self.fc_actor_bias = nn.Parameter(torch.empty(num_actor_classes))
+		# same init as nn.Linear(in_channel, 1)
+		bound = 1 / math.sqrt(in_channel)
+		nn.init.uniform_(self.fc_actor_weight, -bound, bound)
+		nn.init.uniform_(self.fc_actor_bias, -bound, bound)
+		self._register_load_state_dict_pre_hook(self._stack_fc_actor)
+
+	def _stack_fc_actor(self, state_dict, prefix, *args):
+		# checkpoints of the per-class ModuleList: fc_actor.{i}.1.weight [1, C], fc_actor.{i}.1.bias [1]
+		weights, biases = [], []
+		while prefix + 'fc_actor.%d.1.weight' % len(weights) in state_dict:
+			i = len(weights)
+			weights.append(state_dict.pop(prefix + 'fc_actor.%d.1.weight' % i))
+			biases.append(state_dict.pop(prefix + 'fc_actor.%d.1.bias' % i))
+		if len(weights) > 0:
+			state_dict[prefix + 'fc_actor_weight'] = torch.cat(weights, 0)
+			state_dict[prefix + 'fc_actor_bias'] = torch.cat(biases, 0)
 
 	def forward(self, x, ego_x=None):
 
 		b, n, _ = x.shape
-		y_actor = []
 		y_ego = None
-		for i in range(self.num_actor_classes):
-			y_actor.append(self.fc_actor[i](x[:, i, :]))
-		y_actor = torch.stack(y_actor, dim=0)
-		y_actor = y_actor.permute((1, 0, 2))
+		# all the per-class ReLU + Linear(in_channel, 1) in one einsum
+		x = F.relu(x[:, :self.num_actor_classes, :])
+		y_actor = torch.einsum('bkc,kc->bk', x, self.fc_actor_weight) + self.fc_actor_bias
 		y_actor = torch.reshape(y_actor, (b, n))
 		# x = torch.reshape(x, (b, n))
 		if self.num_ego_classes != 0:
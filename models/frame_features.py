@@ -0,0 +1,160 @@
+import os
+import hashlib
+from collections import OrderedDict
+import numpy as np
+import torch
+
+# per-frame backbones, run on [T*b, 3, H, W]
+FRAME_BACKBONES = ('r50', 'inception')
+
+
+def frozen_split(blocks):
+    """
+        number of leading blocks without a trainable parameter
+    """
+    n = 0
+    for block in blocks:
+        if any(p.requires_grad for p in block.parameters()):
+            break
+        n += 1
+    return n
+
+
+class FrameFeatureCache(object):
+    """
+        Output of the frozen leading blocks of a 2D backbone (r50.R50,
+        inception.INCEPTION) per frame. These backbones run every frame of
+        every window on its own and the sliding windows of a scenario share
+        most of their frames.
+
+        __call__(frames, keys) runs the frozen blocks only on the frames whose
+        key is neither in the in-memory LRU (fp16 on the host, budget_mb) nor in
+        disk_dir, then the trainable blocks on the assembled batch. The frozen
+        blocks run in eval mode (BatchNorm on its running stats), so the
+        features of a frame do not depend on the rest of its batch.
+
+        Entries are tagged by the split point, the frame size and a hash of the
+        frozen weights: a new tag empties the LRU and uses another disk folder.
+    """
+
+    def __init__(self, blocks, budget_mb=1024, disk_dir=None):
+        self.blocks = blocks
+        self.budget = int(budget_mb * 2**20)
+        self.disk_dir = disk_dir
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.num_frozen = None
+        self.shape = None
+        self.tag = None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def _check(self, frames):
+        num_frozen = frozen_split(self.blocks)
+        shape = tuple(frames.shape[1:])
+        if num_frozen == self.num_frozen and shape == self.shape:
+            return
+        h = hashlib.sha1(('%d %s' % (num_frozen, shape)).encode('utf-8'))
+        for block in self.blocks[:num_frozen]:
+            for name, t in block.state_dict().items():
+                h.update(name.encode('utf-8'))
+                h.update(t.detach().cpu().contiguous().numpy().tobytes())
+        self.num_frozen, self.shape, self.tag = num_frozen, shape, h.hexdigest()[:16]
+        self.entries.clear()
+        self.nbytes = 0
+        if self.disk_dir is not None:
+            os.makedirs(os.path.join(self.disk_dir, self.tag), exist_ok=True)
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, self.tag, '%016x.npy' % (key & 0xffffffffffffffff))
+
+    def _lookup(self, key):
+        x = self.entries.get(key)
+        if x is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return x
+        if self.disk_dir is not None:
+            try:
+                x = torch.from_numpy(np.load(self._disk_path(key)))
+            except (OSError, ValueError):
+                return None
+            self.disk_hits += 1
+            self._insert(key, x, write=False)
+            return x
+        return None
+
+    def _insert(self, key, x, write=True):
+        self.entries[key] = x
+        self.nbytes += x.numel() * x.element_size()
+        while self.nbytes > self.budget and len(self.entries) > 1:
+            _, old = self.entries.popitem(last=False)
+            self.nbytes -= old.numel() * old.element_size()
+        if write and self.disk_dir is not None:
+            path = self._disk_path(key)
+            tmp_path = path + '.tmp%d.npy' % os.getpid()
+            np.save(tmp_path, x.numpy())
+            os.replace(tmp_path, path)
+
+    def __call__(self, frames, keys):
+        """
+            frames: [N, 3, H, W] on the device, keys: N int64 frame keys
+            return: output of the whole backbone [N, c, h, w]
+        """
+        self._check(frames)
+        keys = [int(k) for k in keys]
+        out = [None] * len(keys)
+        missing = OrderedDict()
+        for i, key in enumerate(keys):
+            x = self._lookup(key)
+            if x is not None:
+                out[i] = x
+            else:
+                # a frame shared by several windows of the batch runs once
+                missing.setdefault(key, []).append(i)
+        if len(missing) > 0:
+            self.misses += len(missing)
+            x = frames[[positions[0] for positions in missing.values()]]
+            with torch.no_grad():
+                for block in self.blocks[:self.num_frozen]:
+                    block.eval()
+                    x = block(x)
+            x = x.half().cpu()
+            for (key, positions), f in zip(missing.items(), x):
+                f = f.clone()
+                self._insert(key, f)
+                for i in positions:
+                    out[i] = f
+        x = torch.stack(out, 0)
+        if frames.is_cuda:
+            x = x.pin_memory()
+        x = x.to(frames.device, non_blocking=True).to(frames.dtype)
+        for block in self.blocks[self.num_frozen:]:
+            x = block(x)
+        return x
+
+    def report(self):
+        return '%d hits, %d disk hits, %d computed, %.1f MB in memory' % (
+            self.hits, self.disk_hits, self.misses, self.nbytes / 2**20)
+
+
+def backbone_frames(resnet, x, frame_keys=None, cache=None):
+    """
+        x: [T*b, 3, H, W] frames in to_frames() order, frame_keys: [b, T] from the dataset
+    """
+    if cache is None or frame_keys is None:
+        return resnet(x)
+    return cache(x, frame_keys.t().reshape(-1).tolist())
+
+
+def make_frame_feature_cache(model, args):
+    """
+        --frame_feature_cache_mb / --frame_feature_dir, attached as model.frame_features
+    """
+    if args.backbone not in FRAME_BACKBONES or not hasattr(model, 'frame_features'):
+        raise ValueError('--frame_feature_cache_mb needs a per-frame backbone (%s) on action_slot, slot_savi or slot_vps'
+                         % '/'.join(FRAME_BACKBONES))
+    model.frame_features = FrameFeatureCache(model.resnet.blocks, args.frame_feature_cache_mb,
+                                             args.frame_feature_dir or None)
+    return model.frame_features
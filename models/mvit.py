@@ -3,6 +3,7 @@ import torch
 import torch.nn as nn
 import torch.nn.functional as F
 from classifier import Head
+from video_input import clip_dims
 
 class pos_encode_custom(nn.Module):
     """
@@ -70,9 +71,7 @@ class MViT(nn.Module):
         if scale != -1.0:
             self.custom_posembed = pos_encode_custom(self.model.cls_positional_encoding,scale,mode)
     def forward(self, x):
-        seq_len = len(x)
-        batch_size = x[0].shape[0]
-        height, width = x[0].shape[2], x[0].shape[3]
+        seq_len, batch_size, height, width = clip_dims(x)
         if isinstance(x, list):
             x = torch.stack(x, dim=0) #[v, b, 2048, h, w]
             # l, b, c, h, w
@@ -111,9 +110,7 @@ class VideoMAE_pretrained(nn.Module):
         self.head  = Head(768, num_ego_class, num_actor_class)
     
     def forward(self, x):
-        seq_len = len(x)
-        batch_size = x[0].shape[0]
-        height, width = x[0].shape[2], x[0].shape[3]
+        seq_len, batch_size, height, width = clip_dims(x)
         if isinstance(x, list):
             x = torch.stack(x, dim=0) #[T, b, C, h, w]
             # l, b, c, h, w
@@ -5,6 +5,7 @@ import torch.nn.functional as F
 from classifier import Head, Allocated_Head
 from pytorchvideo.models.hub import i3d_r50
 import inception
+from video_input import clip_dims, to_frames
 
 import numpy as np
 # from models.ConvGRU import *
@@ -242,12 +243,9 @@ class SLOT_MO(nn.Module):
         self.pool = nn.AdaptiveAvgPool3d(output_size=1)
 
     def forward(self, x, box=False):
-        seq_len = len(x)
-        batch_size = x[0].shape[0]
-        height, width = x[0].shape[2], x[0].shape[3]
+        seq_len, batch_size, height, width = clip_dims(x)
         
-        if isinstance(x, list):
-            x = torch.stack(x, dim=0) #[v, b, 2048, h, w]
+        x = to_frames(x) #[T, b, C, h, w]
 
         if self.args.backbone == 'inception':
             x = torch.reshape(x, (seq_len*batch_size, 3, height, width))
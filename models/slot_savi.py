@@ -5,6 +5,8 @@ import torch.nn.functional as F
 from classifier import Head, Allocated_Head
 from pytorchvideo.models.hub import i3d_r50
 import inception
+from video_input import clip_dims, to_frames
+from frame_features import backbone_frames
 
 import numpy as np
 # from models.ConvGRU import *
@@ -119,6 +121,8 @@ class SLOT_SAVI(nn.Module):
         self.ego_c = 128
         self.num_slots = num_slots
         self.resnet = i3d_r50(True)
+        # inception: per-frame cache of the frozen blocks (see frame_features.py)
+        self.frame_features = None
 
         if args.backbone == 'inception':
             self.resnet = inception.INCEPTION()
@@ -192,16 +196,13 @@ class SLOT_SAVI(nn.Module):
         self.pe = SoftPositionEmbed3D(self.hidden_dim2, [self.resolution3d[0], self.resolution3d[1], self.resolution3d[2]])
         self.pool = nn.AdaptiveAvgPool3d(output_size=1)
 
-    def forward(self, x, box=False):
-        seq_len = len(x)
-        batch_size = x[0].shape[0]
-        height, width = x[0].shape[2], x[0].shape[3]
-        if isinstance(x, list):
-            x = torch.stack(x, dim=0) #[T, b, C, h, w]
+    def forward(self, x, box=False, frame_keys=None):
+        seq_len, batch_size, height, width = clip_dims(x)
+        x = to_frames(x) #[T, b, C, h, w]
 
         if self.args.backbone == 'inception':
             x = torch.reshape(x, (seq_len*batch_size, 3, height, width))
-            x = self.resnet(x)
+            x = backbone_frames(self.resnet, x, frame_keys, self.frame_features)
             _, c, h, w  = x.shape
             x = torch.reshape(x, (self.args.seq_len, batch_size, c, h, w))
             x = x.permute(1, 2, 0, 3, 4)
@@ -5,6 +5,8 @@ import torch.nn.functional as F
 from classifier import Head, Allocated_Head
 from pytorchvideo.models.hub import i3d_r50
 import inception
+from video_input import clip_dims, to_frames
+from frame_features import backbone_frames
 import r50
 
 import numpy as np
@@ -186,6 +188,8 @@ class SLOT_VPS(nn.Module):
         self.ego_c = 128
         self.num_slots = num_slots
         self.resnet = i3d_r50(True)
+        # inception: per-frame cache of the frozen blocks (see frame_features.py)
+        self.frame_features = None
 
         if args.dataset == 'nuscenes' and args.pretrain == 'oats':
             self.num_slots = 35
@@ -291,17 +295,14 @@ class SLOT_VPS(nn.Module):
         slots = torch.cat(( torch.reshape(self.slots[:, idx, :], (1, 1, -1)) for idx in oats_slot_idx), 1)
         self.register_buffer("slots", slots)
         
-    def forward(self, x):
-        seq_len = len(x)
-        batch_size = x[0].shape[0]
-        height, width = x[0].shape[2], x[0].shape[3]
+    def forward(self, x, frame_keys=None):
+        seq_len, batch_size, height, width = clip_dims(x)
 
-        if isinstance(x, list):
-            x = torch.stack(x, dim=0) #[v, b, 2048, h, w]
+        x = to_frames(x) #[T, b, C, h, w]
 
         if self.args.backbone == 'inception':
             x = torch.reshape(x, (seq_len*batch_size, 3, height, width))
-            x = self.resnet(x)
+            x = backbone_frames(self.resnet, x, frame_keys, self.frame_features)
             _, c, h, w  = x.shape
             x = torch.reshape(x, (self.args.seq_len, batch_size, c, h, w))
             x = x.permute(1, 2, 0, 3, 4)
@@ -3,6 +3,7 @@ import torch.nn as nn
 import torchvision.models as models
 import torch.nn.functional as F
 from classifier import Head
+from video_input import clip_dims, to_clip
 
 class SlowFast(nn.Module):
     def __init__(self, num_ego_class, num_actor_class):
@@ -20,18 +21,9 @@ class SlowFast(nn.Module):
         self.pool = nn.AdaptiveAvgPool3d(output_size=1)
 
     def forward(self, x):
-        seq_len = len(x)
-        batch_size = x[0].shape[0]
-        height, width = x[0].shape[2], x[0].shape[3]
-        slow_x = []
-        for i in range(0, seq_len, 4):
-        	slow_x.append(x[i])
-        if isinstance(x, list):
-            x = torch.stack(x, dim=0) #[v, b, 2048, h, w]
-            slow_x = torch.stack(slow_x, dim=0)
-            # l, b, c, h, w
-            x = torch.permute(x, (1,2,0,3,4)) #[b, v, 2048, h, w]
-            slow_x = torch.permute(slow_x, (1,2,0,3,4))
+        seq_len, batch_size, height, width = clip_dims(x)
+        x = to_clip(x) #[b, C, T, h, w]
+        slow_x = x[:, :, ::4]
         num_block = len(self.model.blocks)
 
         x = [slow_x, x]
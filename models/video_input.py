@@ -0,0 +1,30 @@
+import torch
+
+
+def clip_dims(x):
+    """
+        x: list of T tensors [b, C, h, w] or one tensor [b, C, T, h, w]
+        return: seq_len, batch_size, height, width
+    """
+    if isinstance(x, (list, tuple)):
+        return len(x), x[0].shape[0], x[0].shape[2], x[0].shape[3]
+    return x.shape[2], x.shape[0], x.shape[3], x.shape[4]
+
+
+def to_clip(x):
+    """
+        stack the legacy list of frames into [b, C, T, h, w], tensors pass through
+    """
+    if isinstance(x, (list, tuple)):
+        x = torch.stack(x, dim=0) #[T, b, C, h, w]
+        x = x.permute((1,2,0,3,4)) #[b, C, T, h, w]
+    return x
+
+
+def to_frames(x):
+    """
+        [T, b, C, h, w] for per-frame (2D) backbones
+    """
+    if isinstance(x, (list, tuple)):
+        return torch.stack(x, dim=0)
+    return x.permute((2,0,1,3,4))
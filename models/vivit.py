@@ -61,6 +61,8 @@ class ViViT(nn.Module):
         if isinstance(x, list):
             x = torch.stack(x, dim=0) #[v, b, 2048, h, w]
             x = torch.permute(x, (1,0,2,3,4)) #[b, v, 2048, h, w]
+        else:
+            x = torch.permute(x, (0,2,1,3,4)) #[b, C, T, h, w] -> [b, T, C, h, w]
             # x = torch.reshape(x, (batch_size, 2048, height, width)) #[b, 2048, h, w]
             # print(x.shape)
         x = self.to_patch_embedding(x)
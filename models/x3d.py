@@ -3,6 +3,7 @@ import torch.nn as nn
 import torchvision.models as models
 import torch.nn.functional as F
 from classifier import Head
+from video_input import clip_dims
 import numpy as np
 
 class X3D(nn.Module):
@@ -29,9 +30,7 @@ class X3D(nn.Module):
         self.pool = nn.AdaptiveAvgPool3d(output_size=1)
 
     def forward(self, x):
-        seq_len = len(x)
-        batch_size = x[0].shape[0]
-        height, width = x[0].shape[2], x[0].shape[3]
+        seq_len, batch_size, height, width = clip_dims(x)
         if isinstance(x, list):
             x = torch.stack(x, dim=0) #[v, b, 2048, h, w]
             # l, b, c, h, w
@@ -0,0 +1,80 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import torch
+
+# bench options are taken off the command line, the rest are the model flags
+bench = argparse.ArgumentParser(add_help=False)
+bench.add_argument('--bench_batch', type=int, default=1, help='clips per forward (validation runs batch 1)')
+bench.add_argument('--bench_iters', type=int, default=50, help='timed forwards per mode')
+bench.add_argument('--warmup', type=int, default=5)
+bench.add_argument('--atol', type=float, default=1e-5, help='max |folded - unfolded| accepted')
+bench_args, rest = bench.parse_known_args()
+sys.argv = sys.argv[:1] + rest
+from parser import get_parser
+from model import generate_model
+
+
+def frame_size(args):
+    if args.dataset == 'oats' or args.model_name in ['mvit', 'videoMAE']:
+        return 224, 224
+    return 256, 768
+
+
+def forward(model, x):
+    with torch.no_grad():
+        out = model(x)
+    return [o for o in out if isinstance(o, torch.Tensor)]
+
+
+def latency(model, x):
+    for _ in range(bench_args.warmup):
+        forward(model, x)
+    times = []
+    for _ in range(bench_args.bench_iters):
+        torch.cuda.synchronize()
+        t0 = time.perf_counter()
+        forward(model, x)
+        torch.cuda.synchronize()
+        times.append(time.perf_counter() - t0)
+    return np.array(times) * 1e3
+
+
+if __name__ == '__main__':
+    args, logdir = get_parser()
+    if args.model_name != 'action_slot':
+        raise ValueError('freeze_for_inference() is implemented by action_slot')
+    num_ego_class = 0 if args.dataset == 'oats' else 4
+    num_actor_class = 35 if args.dataset == 'oats' else 64
+    model = generate_model(args, num_ego_class, num_actor_class).cuda()
+    if os.path.isfile(args.cp):
+        model.load_state_dict(torch.load(args.cp), strict=False)
+    model.eval()
+
+    torch.manual_seed(0)
+    height, width = frame_size(args)
+    x = torch.randn(bench_args.bench_batch, 3, args.seq_len, height, width, device=args.device)
+
+    # parity: the folded forward must give the outputs of the plain one
+    reference = forward(model, x)
+    unfolded = latency(model, x)
+    model.freeze_for_inference()
+    folded_out = forward(model, x)
+    folded = latency(model, x)
+    names = ['ego', 'actor', 'attn'] if num_ego_class != 0 else ['actor', 'attn']
+    worst = 0.0
+    for name, a, b in zip(names, reference, folded_out):
+        diff = (a - b).abs().max().item()
+        worst = max(worst, diff)
+        print('%-6s %s max |d| %.3g' % (name, list(a.shape), diff))
+    print('parity %s (atol %.1g)' % ('ok' if worst <= bench_args.atol else 'FAILED', bench_args.atol))
+
+    print('%s/%s, batch %d, %dx%d x %d frames' % (args.model_name, args.backbone, bench_args.bench_batch, width, height, args.seq_len))
+    print('%-10s %10s %10s %10s' % ('forward', 'mean ms', 'p50 ms', 'p90 ms'))
+    for name, t in [('unfolded', unfolded), ('folded', folded)]:
+        print('%-10s %10.2f %10.2f %10.2f' % (name, t.mean(), np.median(t), np.percentile(t, 90)))
+    print('speedup %.3fx' % (unfolded.mean() / folded.mean()))
+    if worst > bench_args.atol:
+        sys.exit(1)
@@ -0,0 +1,86 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+from PIL import Image
+
+sys.path.append('../datasets')
+from jpeg_draft import resize
+
+
+def list_jpgs(folder, limit):
+    out = []
+    for dirpath, _, files in os.walk(folder):
+        out.extend(os.path.join(dirpath, f) for f in sorted(files) if f.lower().endswith(('.jpg', '.jpeg')))
+        if len(out) >= limit:
+            break
+    return sorted(out)[:limit]
+
+
+def decode(path, size, oversample):
+    img = resize(Image.open(path), size, oversample)
+    img.load()
+    return img
+
+
+def dct_scale(path, size):
+    with Image.open(path) as img:
+        width = img.width
+        img.draft('RGB', size)
+        return width // img.size[0]
+
+
+def psnr(a, b):
+    mse = np.mean((a.astype(np.float64) - b.astype(np.float64)) ** 2)
+    return float('inf') if mse == 0 else 10 * np.log10(255.0 ** 2 / mse)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='per-frame latency and fidelity of the drafted JPEG decode against the full decode')
+    parser.add_argument('--frames', type=str, required=True, help='folder of full-size JPEG frames (e.g. nuScenes CAM_FRONT, ROAD rgb-images/2)')
+    parser.add_argument('--size', type=str, nargs='+', default=['768x256', '224x224'], help='output sizes WxH')
+    parser.add_argument('--oversample', type=int, nargs='+', default=[1, 2])
+    parser.add_argument('--limit', type=int, default=200)
+    parser.add_argument('--repeat', type=int, default=3, help='timed passes, the fastest one per frame counts')
+    args = parser.parse_args()
+
+    paths = list_jpgs(args.frames, args.limit)
+    if len(paths) == 0:
+        raise ValueError('no jpg in %s' % args.frames)
+    with Image.open(paths[0]) as img:
+        print('%d frames of %dx%d' % (len(paths), img.width, img.height))
+
+    for size in args.size:
+        w, h = [int(v) for v in size.lower().split('x')]
+        # warm the page cache so both paths time the decode, not the disk
+        for path in paths:
+            decode(path, (w, h), 0)
+        results = {}
+        for oversample in [0] + args.oversample:
+            times = np.full(len(paths), np.inf)
+            for _ in range(args.repeat):
+                for i, path in enumerate(paths):
+                    t0 = time.perf_counter()
+                    decode(path, (w, h), oversample)
+                    times[i] = min(times[i], time.perf_counter() - t0)
+            results[oversample] = times
+        reference = [np.asarray(decode(path, (w, h), 0)) for path in paths]
+        print('--- %dx%d' % (w, h))
+        print('%-16s %10s %10s %8s %10s %8s' % ('decode', 'mean ms', 'p50 ms', 'speedup', 'psnr dB', 'max |d|'))
+        base = results[0].mean()
+        for oversample, times in results.items():
+            if oversample == 0:
+                name, fidelity = 'full', (float('inf'), 0)
+            else:
+                name = 'draft x%d 1/%d' % (oversample, dct_scale(paths[0], (w * oversample, h * oversample)))
+                outs = [np.asarray(decode(path, (w, h), oversample)) for path in paths]
+                fidelity = (np.mean([psnr(a, b) for a, b in zip(outs, reference)]),
+                            max(int(np.abs(a.astype(np.int16) - b.astype(np.int16)).max()) for a, b in zip(outs, reference)))
+            print('%-16s %10.2f %10.2f %7.2fx %10.2f %8d' % (
+                name, times.mean()*1e3, np.median(times)*1e3, base/times.mean(), fidelity[0], fidelity[1]))
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
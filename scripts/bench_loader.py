@@ -0,0 +1,66 @@
+import sys
+import time
+import argparse
+from tqdm import tqdm
+from torch.utils.data import DataLoader
+
+sys.path.append('../datasets')
+from clip_transport import clip_collate
+from readahead import evict, window_files
+from window_sampler import make_train_sampler
+
+# bench options are taken off the command line, the rest are the training flags
+bench = argparse.ArgumentParser(add_help=False)
+bench.add_argument('--bench_batches', type=int, default=100, help='batches timed per mode')
+bench.add_argument('--modes', type=str, nargs='+', default=['shuffle', 'group', 'readahead', 'group+readahead'])
+bench_args, rest = bench.parse_known_args()
+sys.argv = sys.argv[:1] + rest
+from parser import get_parser
+
+
+def all_files(dataset):
+    files = window_files(dataset)
+    out = set()
+    for index in range(len(dataset)):
+        for sample_idx in range(dataset.samples.num_windows(index)):
+            out.update(files(index, sample_idx))
+    return sorted(out)
+
+
+if __name__ == '__main__':
+    args, logdir = get_parser()
+    if args.dataset == 'taco':
+        from taco import TACO
+        dataset = TACO(args=args, split='train')
+    else:
+        from oats import OATS
+        dataset = OATS(args=args)
+    files = all_files(dataset)
+    print('%d scenarios, %d files' % (len(dataset), len(files)))
+    group_shuffle = args.group_shuffle or 4 * args.batch_size
+    readahead = args.readahead or 4 * args.batch_size * max(1, args.num_workers)
+
+    results = []
+    for mode in bench_args.modes:
+        args.group_shuffle = group_shuffle if 'group' in mode else 0
+        args.readahead = readahead if 'readahead' in mode else 0
+        sampler = make_train_sampler(dataset, args)
+        loader = DataLoader(dataset, batch_size=args.batch_size, shuffle=sampler is None, sampler=sampler,
+                            num_workers=args.num_workers, drop_last=True, collate_fn=clip_collate)
+        # cold cache: drop the split's pages before every mode
+        evict(files)
+        num_samples = 0
+        start = time.time()
+        for i, batch in enumerate(tqdm(loader, total=bench_args.bench_batches, desc=mode)):
+            num_samples += args.batch_size
+            if i + 1 >= bench_args.bench_batches:
+                break
+        elapsed = time.time() - start
+        results.append((mode, num_samples / elapsed))
+        if args.readahead > 0:
+            print('readahead: ' + sampler.readahead.report())
+        del loader
+
+    print('group_shuffle %d, readahead %d, batch %d, %d workers' % (group_shuffle, readahead, args.batch_size, args.num_workers))
+    for mode, rate in results:
+        print('%-16s %8.2f samples/s (cold cache)' % (mode, rate))
@@ -0,0 +1,84 @@
+import sys
+import time
+import argparse
+import torch
+
+sys.path.append('../models')
+from action_slot import SlotAttention
+from chunked_attention import slot_attention
+
+
+def run(module, x):
+    slots, attn = module(x)
+    # the attention masks are supervised too (action/bg attn losses)
+    loss = slots.square().mean() + attn.mean()
+    loss.backward()
+    return slots.detach(), attn.detach(), x.grad.detach()
+
+
+def peak_memory(args, chunk, batch_size):
+    torch.manual_seed(0)
+    module = SlotAttention(args.num_slots, args.dim, num_actor_class=args.num_slots, resolution=args.resolution,
+                           chunk=chunk).to(args.device)
+    x = torch.randn([batch_size] + args.resolution + [args.dim], device=args.device, requires_grad=True)
+    torch.cuda.synchronize()
+    torch.cuda.reset_peak_memory_stats()
+    base = torch.cuda.memory_allocated()
+    t0 = time.perf_counter()
+    try:
+        run(module, x)
+    except RuntimeError as e:
+        if 'out of memory' not in str(e):
+            raise
+        torch.cuda.empty_cache()
+        return None, None
+    torch.cuda.synchronize()
+    return (torch.cuda.max_memory_allocated() - base) / 2**20, (time.perf_counter() - t0) * 1e3
+
+
+def parity(args, chunk, slot_softmax):
+    torch.manual_seed(0)
+    n = args.resolution[0] * args.resolution[1] * args.resolution[2]
+    q = torch.randn(2, args.num_slots, args.dim, device=args.device, dtype=torch.float64, requires_grad=True)
+    k = torch.randn(2, n, args.dim, device=args.device, dtype=torch.float64, requires_grad=True)
+    v = torch.randn(2, n, args.dim, device=args.device, dtype=torch.float64, requires_grad=True)
+    g_upd = torch.randn(2, args.num_slots, args.dim, device=args.device, dtype=torch.float64)
+    g_attn = torch.randn(2, args.num_slots, n, device=args.device, dtype=torch.float64)
+    outs = []
+    for c in [0, chunk]:
+        updates, attn = slot_attention(q, k, v, args.dim ** -0.5, 1e-8, c, slot_softmax)
+        grads = torch.autograd.grad([updates, attn], [q, k, v], [g_upd, g_attn])
+        outs.append([updates, attn] + list(grads))
+    return max((a - b).abs().max().item() for a, b in zip(*outs))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='peak memory of the chunked slot attention (forward + backward) against the exact one')
+    parser.add_argument('--batch_sizes', type=int, nargs='+', default=[8, 16, 32])
+    parser.add_argument('--chunks', type=int, nargs='+', default=[256, 512, 1024], help='token chunks, 0 (exact) is always run')
+    parser.add_argument('--resolution', type=int, nargs=3, default=[16, 8, 24], help='T h w of the tokens (x3d on TACO)')
+    parser.add_argument('--num_slots', type=int, default=65, help='64 actor classes + the background slot')
+    parser.add_argument('--dim', type=int, default=256, help='--channel')
+    parser.add_argument('--device', type=str, default='cuda')
+    args = parser.parse_args()
+    n = args.resolution[0] * args.resolution[1] * args.resolution[2]
+    print('%d slots x %d tokens, dim %d' % (args.num_slots, n, args.dim))
+
+    # float64, so that the only differences left are the summation order
+    for slot_softmax, name in [(True, 'action_slot (slot softmax)'), (False, 'action_slot_query (token softmax)')]:
+        for chunk in args.chunks:
+            print('parity %-34s chunk %5d: max |d| %.3g (outputs and grads)' % (name, chunk, parity(args, chunk, slot_softmax)))
+
+    print('%-8s %6s %12s %10s' % ('chunk', 'batch', 'peak MB', 'fwd+bwd ms'))
+    for chunk in [0] + args.chunks:
+        for batch_size in args.batch_sizes:
+            mb, ms = peak_memory(args, chunk, batch_size)
+            if mb is None:
+                print('%-8s %6d %12s %10s' % (chunk or 'exact', batch_size, 'OOM', '-'))
+            else:
+                print('%-8s %6d %12.1f %10.1f' % (chunk or 'exact', batch_size, mb, ms))
+            sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
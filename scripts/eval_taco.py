@@ -471,7 +471,11 @@ class Engine(object):
         self.args = args
 
     def validate(self, model, dataloader, epoch):
-        model.eval()
+        if hasattr(model, 'freeze_for_inference'):
+            # the weight-only tensors of forward are computed once, see models/action_slot.py
+            model.freeze_for_inference()
+        else:
+            model.eval()
 
         t_confuse_sample, t_confuse_both_sample, t_confuse_pred, t_confuse_both_pred, t_confuse_both_miss, t_confuse_far_both_sample, t_confuse_far_both_miss = 0, 0, 0, 0, 0, 0, 0
 
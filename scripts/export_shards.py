@@ -0,0 +1,24 @@
+import sys
+import time
+sys.path.append('../datasets')
+from parser import get_parser
+from shards import write_shards
+
+
+if __name__ == '__main__':
+    # same flags as the training run: the windows, labels and masks follow them
+    args, logdir = get_parser()
+    if not args.shards:
+        raise ValueError('--shards: output folder of the shards')
+    start = time.time()
+    if args.dataset == 'taco':
+        from taco import TACO
+        dataset = TACO(args=args, split='train')
+        shards = write_shards(dataset, 'taco', args.shards)
+    elif args.dataset == 'oats':
+        from oats import OATS
+        dataset = OATS(args=args)
+        shards = write_shards(dataset, 'oats', args.shards, extra={'label_stat': dataset.label_stat})
+    else:
+        raise ValueError('shards are written for taco and oats only')
+    print('%d scenarios in %d shards -> %s in %.1fs' % (len(dataset), len(shards), args.shards, time.time()-start))
@@ -1,156 +1,161 @@
 import os
-import json
-import torch
-from torchvision.ops.boxes import masks_to_boxes
+import argparse
+import multiprocessing as mp
 import cv2
 from tqdm import tqdm
-import argparse
-import matplotlib.pyplot as plt
 from PIL import Image
 import numpy as np
 
-town_list = ['interactive', 'non-interactive', 'ap_Town01', 
-        'ap_Town02','ap_Town03', 'ap_Town04', 'ap_Town05', 'ap_Town06', 'ap_Town07', 'ap_Town10HD', 
+town_list = ['interactive', 'non-interactive', 'ap_Town01',
+        'ap_Town02','ap_Town03', 'ap_Town04', 'ap_Town05', 'ap_Town06', 'ap_Town07', 'ap_Town10HD',
         'runner_Town03','runner_Town05', 'runner_Town10HD']
 
-def read_json(f):
-    with open(f) as json_data:
-        data = json.load(json_data)
-    json_data.close()
-    return data
-
-def produce_box(root, types ,write_video=False,save_bbox=False):
-    instance_mode = True
-    W,H = 768,256
-    
-    def get_ids(mask, ver, area_threshold=75):
-        """
-            Args:
-                mask: instance image
-        """
-        h,w = mask.shape[1:]
-        mask_2 = torch.zeros((2,h,w), device="cuda:0")
-        mask_2[0] = mask[0]
-        mask_2[1] = mask[1]+mask[2]*256
-        
-        if ver == 0 :
-            condition = mask_2[0]== 4
-            condition += mask_2[0]== 10
-        else:
-            condition = mask_2[0]== 14 # Car
-            condition += mask_2[0]== 15 # Truck
-            condition += mask_2[0]== 16 # Bus
-            condition += mask_2[0]== 12 # Pedestrian
-            condition += mask[0]== 18 # Motorcycle
-            condition += mask[0]== 19 # Bicycle
-        background_mask = condition.clone()
-
-
-        obj_ids = torch.unique(mask_2[1,condition])
-        masks = mask_2[1] == obj_ids[:, None, None]
-        masks = masks*condition
-        area_condition = masks.long().sum((1,2))>=area_threshold
-        
-        
-        # obj_ids = obj_ids[area_condition].type(torch.int).cpu().numpy()
-        # boxes = masks_to_boxes(masks).type(torch.int16).cpu().numpy()
-        masks = masks[area_condition]
-        masks = torch.unsqueeze(masks, 1)
-        masks = torch.nn.functional.interpolate(masks.to(float),size=(32,96))[:,0, :, :]
-        # condition = torch.nn.functional.interpolate(condition[None][None].to(float),size=(32,96))[0,0]
-        # background_mask = torch.nn.functional.interpolate(background_mask[None][None].to(float),size=(32,96))[0,0]
-        # return boxes, obj_ids, condition.to(bool).cpu().numpy(), background_mask.to(bool).cpu().numpy()
-        return masks.to(bool).cpu().numpy()
-
-    def process_static(path, s_type):
-        """
-            return
-                obstacle
-                    dict: id -> box coords
-                map static object
-                ego_id
-        """
-        tmp_obstacles = None
-
-        actor_attribute = read_json(os.path.join(path,"actor_attribute.json"))
-        # obstacles
-        if s_type == "obstacle":
-            tmp_obstacles = []
-            obstacle_infos = actor_attribute["obstacle"]
-            for ob_id in obstacle_infos:
-                tmp_obstacles.append(ob_id)
-
-        return tmp_obstacles, actor_attribute["ego_id"]
-
-    # for scenario types
-    types = ['interactive','non-interactive', 
-            'ap_Town01', 'ap_Town02', 'ap_Town03', 'ap_Town04', 'ap_Town05', 'ap_Town06', 'ap_Town07', 'ap_Town10HD',
-            'runner_Town03', 'runner_Town05', 'runner_Town10HD']
-    for s_type in os.listdir(root):
+W, H = 768, 256
+# instance pngs are read at (H//2, W//2), object masks and background masks are stored at 32x96
+INS_H, INS_W = H//2, W//2
+MASK_H, MASK_W = 32, 96
+AREA_THRESHOLD = 75
+
+# CARLA semantic tags of the two simulator versions (see detect_version)
+OBJECT_TAGS = {0: (4, 10),
+               1: (14, 15, 16, 12, 18, 19)} # car, truck, bus, pedestrian, motorcycle, bicycle
+# tags that are neither objects nor background ("stuff") in mask/background
+NOT_BACKGROUND_TAGS = {0: (6, 7, 8, 14, 12, 18),
+                       1: (24, 25, 1, 2)}
+
+
+def nearest_index(in_size, out_size):
+    """
+        source rows/cols of F.interpolate(mode='nearest'), float32 scale included
+    """
+    out = np.arange(out_size)
+    if out_size == in_size:
+        return out
+    if out_size == 2 * in_size:
+        return out >> 1
+    scale = np.float32(in_size) / np.float32(out_size)
+    return np.minimum(np.floor(out.astype(np.float32) * scale).astype(np.int64), in_size-1)
+
+
+def read_instance(path, size=None):
+    """
+        return: tag uint8 [h, w] (R), actor id int32 [h, w] (G + B*256),
+        nearest-resized to size (h, w) when given
+    """
+    img = cv2.imread(path, cv2.IMREAD_COLOR)
+    if size is not None:
+        img = img[nearest_index(img.shape[0], size[0])][:, nearest_index(img.shape[1], size[1])]
+    tag = img[..., 2]
+    ids = img[..., 1].astype(np.int32) + img[..., 0].astype(np.int32) * 256
+    return tag, ids
+
+
+def detect_version(path):
+    """
+        0 / 1 for the two tag layouts, None when the first frame cannot tell them apart
+    """
+    img = cv2.imread(path, cv2.IMREAD_COLOR)
+    tag = img[:(H//8)*3, :, 2]
+    ver = int((tag == 13).sum()) - int((tag == 11).sum())
+    if ver == 0:
+        ver = int((tag == 1).sum()) - int((tag == 3).sum())
+    if ver == 0:
+        return None
+    return 0 if ver > 0 else 1
+
+
+def instance_labels(tag, ids, ver, area_threshold=AREA_THRESHOLD):
+    """
+        Label every object pixel with its rank among the sorted actor ids.
+        return:
+            labels int64 [h, w] (-1 outside objects), obj_ids [N] sorted,
+            area int64 [N] pixels per object, condition bool [h, w] object pixels
+    """
+    condition = np.isin(tag, OBJECT_TAGS[ver])
+    obj_ids, inverse = np.unique(ids[condition], return_inverse=True)
+    area = np.bincount(inverse.reshape(-1), minlength=len(obj_ids))
+    labels = np.full(tag.shape, -1, dtype=np.int64)
+    labels[condition] = inverse.reshape(-1)
+    return labels, obj_ids, area, condition
+
+
+def object_masks(labels, area, area_threshold=AREA_THRESHOLD, size=(MASK_H, MASK_W)):
+    """
+        bool [N, 32, 96] of the objects of at least area_threshold pixels, in actor id order.
+        The label map is pooled once (nearest, so labels never blend) instead of
+        resizing N full-size masks.
+    """
+    small = labels[nearest_index(labels.shape[0], size[0])][:, nearest_index(labels.shape[1], size[1])]
+    keep = np.flatnonzero(area >= area_threshold)
+    return small[None] == keep[:, None, None]
+
+
+def background_mask(tag, condition, ver, size=(MASK_H, MASK_W)):
+    """
+        bool [32, 96], True on background, as written to mask/background by mask2box.py
+    """
+    background = ~(condition | np.isin(tag, NOT_BACKGROUND_TAGS[ver]))
+    return background[nearest_index(tag.shape[0], size[0])][:, nearest_index(tag.shape[1], size[1])]
+
+
+def list_variants(root, types):
+    out = []
+    for s_type in sorted(os.listdir(root)):
         if s_type not in types:
             continue
-        print(s_type)
-        for s_id in tqdm(os.listdir(os.path.join(root,s_type)), position=0, leave=False):
-            if not os.path.isdir(os.path.join(root,s_type,s_id)):
+        for s_id in sorted(os.listdir(os.path.join(root,s_type))):
+            if not os.path.isdir(os.path.join(root,s_type,s_id,'variant_scenario')):
                 continue
-            for variant in tqdm(os.listdir(os.path.join(root,s_type,s_id,'variant_scenario')), position=1, leave=False):
-                if save_bbox:
-                    out_box = {}
-                if write_video:
-                    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-                    out = cv2.VideoWriter(os.path.join(root,'demo.mp4'), fourcc, 12.0, (W,  H))
-                variant_path = os.path.join(root,s_type,s_id,'variant_scenario',variant)
-                # bbox_path = os.path.join(root,s_type,s_id,'variant_scenario',variant)
-
-
-                try:
-                    if not os.path.exists(os.path.join(variant_path,'mask')):
-                        os.makedirs(os.path.join(variant_path,'mask'))
-                        os.makedirs(os.path.join(variant_path,'mask','background'))
-                        os.makedirs(os.path.join(variant_path,'mask','object'))
-                    rgb_imgs = sorted(os.listdir(os.path.join(variant_path,'rgb','downsampled')))
-                except:
-                    continue
-                flag = False
-                # check version beforer iter
-                for rgb_file in rgb_imgs:
-                    frame_id = rgb_file[:-4]
-                    if not os.path.isfile(os.path.join(variant_path,'instance_segmentation','ins_front',frame_id+".png")):
-                        continue
-                    instance = cv2.imread(os.path.join(variant_path,'instance_segmentation','ins_front',frame_id+".png"))
-                    instance = torch.flip(torch.from_numpy(instance).type(torch.int).permute(2,0,1),[0])
-                    instance = instance.to("cuda:0")[0,:(H//8)*3]
-                    ver = ((instance == 13).sum() - (instance == 11).sum()).cpu().numpy()
-                    if ver == 0:
-                        ver = ((instance == 1).sum() - (instance == 3).sum()).cpu().numpy()
-                    
-                    if ver == 0:
-                        flag = True
-                    elif ver>0:
-                        ver = 0
-                    else:
-                        ver = 1
-                    break
-                if flag: 
-                    print('\n',variant_path)
-                    continue
-                for rgb_file in rgb_imgs:
-                    frame_id = rgb_file[:-4]
-                    if not os.path.isfile(os.path.join(variant_path,'instance_segmentation','ins_front',frame_id+".png")):
-                        continue
-                    instance = cv2.imread(os.path.join(variant_path,'instance_segmentation','ins_front',frame_id+".png"))
-                    instance = torch.flip(torch.from_numpy(instance).type(torch.int).permute(2,0,1),[0])
-                    instance = instance.to("cuda:0")[None].to(float)
-                    instance = torch.nn.functional.interpolate(instance,size=(H//2,W//2)).to(int)[0]
-                    obj_masks = get_ids(instance, ver)
-                    np.save(os.path.join(variant_path,'mask','object',frame_id+'.npy'), obj_masks)
+            for variant in sorted(os.listdir(os.path.join(root,s_type,s_id,'variant_scenario'))):
+                out.append(os.path.join(root,s_type,s_id,'variant_scenario',variant))
+    return out
+
+
+def process_variant(variant_path, outputs=('object', 'background')):
+    """
+        write mask/object/{frame}.npy and mask/background/{frame}.png of one scenario
+        return: number of frames, or None when the scenario is skipped
+    """
+    rgb_path = os.path.join(variant_path,'rgb','downsampled')
+    ins_path = os.path.join(variant_path,'instance_segmentation','ins_front')
+    if not os.path.isdir(rgb_path) or not os.path.isdir(ins_path):
+        return None
+    ins_files = set(os.listdir(ins_path))
+    frame_ids = [f[:-4] for f in sorted(os.listdir(rgb_path)) if f[:-4]+'.png' in ins_files]
+    if len(frame_ids) == 0:
+        return 0
+    ver = detect_version(os.path.join(ins_path, frame_ids[0]+'.png'))
+    if ver is None:
+        print('\n', variant_path)
+        return None
+    for output in outputs:
+        os.makedirs(os.path.join(variant_path,'mask',output), exist_ok=True)
+
+    for frame_id in frame_ids:
+        tag, ids = read_instance(os.path.join(ins_path, frame_id+'.png'), (INS_H, INS_W))
+        labels, obj_ids, area, condition = instance_labels(tag, ids, ver)
+        if 'object' in outputs:
+            np.save(os.path.join(variant_path,'mask','object',frame_id+'.npy'), object_masks(labels, area))
+        if 'background' in outputs:
+            background = Image.fromarray(np.uint8(background_mask(tag, condition, ver)*255))
+            background.save(os.path.join(variant_path,'mask','background',frame_id)+'.png')
+    return len(frame_ids)
+
+
+def thread(variant_path, outputs):
+    try:
+        return process_variant(variant_path, outputs)
+    except Exception as e:
+        print('failed %s: %s' % (variant_path, e))
+        return None
+
 
 if __name__ == '__main__':
 
 
 
     parser = argparse.ArgumentParser()
-    
+
     parser.add_argument("-r",
                         "--root",
                         default="/media/hankung/ssd/carla_13/CARLA_0.9.13/PythonAPI/examples/data_collection",
@@ -158,15 +163,23 @@ if __name__ == '__main__':
                         )
     parser.add_argument("-s",
                         "--scenario",
-                        default="interactive",
+                        default=None,
                         type=str,
+                        help="only this scenario type (default: every type of town_list)"
                         )
+    parser.add_argument("--outputs", type=str, nargs='+', default=['object', 'background'],
+                        choices=['object', 'background'])
+    parser.add_argument("--num_workers", type=int, default=12)
     args = parser.parse_args()
 
 
-    types = [f'{args.scenario}']
-    
-    produce_box(args.root,town_list,save_bbox=True,write_video=False)
-    
-    # old
-        
+    types = [args.scenario] if args.scenario else town_list
+    variants = list_variants(args.root, types)
+    pool = mp.Pool(processes=args.num_workers)
+    results = [pool.apply_async(thread, (v, args.outputs)) for v in variants]
+    pool.close()
+    frames = 0
+    for r in tqdm(results):
+        frames += r.get() or 0
+    pool.join()
+    print('%d scenarios, %d frames' % (len(variants), frames))
@@ -7,6 +7,25 @@ from scipy.optimize import linear_sum_assignment
 
 from utils import inter_and_union
 
+
+def unpack_obj_masks(bits, count, max_num=64, h=32, w=96):
+    """
+        bits: uint8 [M, h*w/8], np.packbits of every object mask of the batch
+        count: [b, l] number of masks of every supervised frame
+        return: float32 [b, l, max_num, h, w], zero padded as get_obj_mask() does
+    """
+    b, l = count.shape
+    shifts = torch.arange(7, -1, -1, dtype=torch.uint8, device=bits.device)
+    masks = ((bits.unsqueeze(-1) >> shifts) & 1).reshape(bits.shape[0], h, w)
+
+    count = count.reshape(-1)
+    frame_idx = torch.repeat_interleave(torch.arange(b*l, device=bits.device), count)
+    start = torch.cumsum(count, 0) - count
+    obj_idx = torch.arange(bits.shape[0], device=bits.device) - start[frame_idx]
+    out = torch.zeros((b*l, max_num, h, w), dtype=torch.float32, device=bits.device)
+    out[frame_idx, obj_idx] = masks.float()
+    return out.reshape(b, l, max_num, h, w)
+
 class ActionSlotLoss(nn.Module):
     def __init__(self, args, num_actor_class, attention_res=None):
         super(ActionSlotLoss, self).__init__()
@@ -97,12 +116,17 @@ class ActionSlotLoss(nn.Module):
             
         # object mask supervision for action slot
         if self.attn_loss_type == 1:
-            obj_mask_list = []
-            obj_mask = label['obj_masks']
-            for i in range(self.args.seq_len//self.args.mask_every_frame):
-                obj_mask_list.append(obj_mask[i].to(self.args.device, dtype=torch.float32))
-            obj_mask_list = torch.stack(obj_mask_list, 0)
-            obj_mask_list = torch.permute(obj_mask_list, (1, 0, 2, 3, 4)) #[batch, len, n, h, w]
+            if 'obj_mask_bits' in label:
+                # --obj_mask_store packed: variable-length bits, unpacked on the device
+                obj_mask_list = unpack_obj_masks(label['obj_mask_bits'].to(self.args.device),
+                                                label['obj_mask_count'].to(self.args.device))
+            else:
+                obj_mask_list = []
+                obj_mask = label['obj_masks']
+                for i in range(self.args.seq_len//self.args.mask_every_frame):
+                    obj_mask_list.append(obj_mask[i].to(self.args.device, dtype=torch.float32))
+                obj_mask_list = torch.stack(obj_mask_list, 0)
+                obj_mask_list = torch.permute(obj_mask_list, (1, 0, 2, 3, 4)) #[batch, len, n, h, w]
             b, l, n, h, w = obj_mask_list.shape
 
             attn_loss = 0.0
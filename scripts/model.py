@@ -135,10 +135,14 @@ def generate_model(args, num_ego_class, num_actor_class):
 
         for t in model.resnet.parameters():
             t.requires_grad=False
-        for t in model.resnet[-1].parameters():
-            t.requires_grad=True
-        for t in model.resnet[-2].parameters():
-            t.requires_grad=True
+        if args.backbone == 'inception':
+            for t in model.resnet.blocks[-1].parameters():
+                t.requires_grad=True
+        else:
+            for t in model.resnet[-1].parameters():
+                t.requires_grad=True
+            for t in model.resnet[-2].parameters():
+                t.requires_grad=True
 
     elif model_name == 'slot_mo':
         model = slot_mo.SLOT_MO(args, num_ego_class, num_actor_class, args.num_slots)
@@ -157,10 +161,14 @@ def generate_model(args, num_ego_class, num_actor_class):
             t.requires_grad=True
         for t in model.resnet.parameters():
             t.requires_grad=False
-        for t in model.resnet[-1].parameters():
-            t.requires_grad=True
-        for t in model.resnet[-2].parameters():
-            t.requires_grad=True
+        if args.backbone == 'inception':
+            for t in model.resnet.blocks[-1].parameters():
+                t.requires_grad=True
+        else:
+            for t in model.resnet[-1].parameters():
+                t.requires_grad=True
+            for t in model.resnet[-2].parameters():
+                t.requires_grad=True
 
     elif model_name == 'ARG' or model_name == 'ORN':
         if model_name == 'ARG':
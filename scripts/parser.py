@@ -8,6 +8,25 @@ def get_parser():
     parser.add_argument('--dataset', type=str, default='taco', choices=['taco', 'oats', 'nuscenes'])
     parser.add_argument('--oats_test_split', type=str, default='0', choices=['s1', 's2', 's3'])
     parser.add_argument('--root', type=str, help='dataset path')
+    parser.add_argument('--index_dir', type=str, default='../datasets/index', help='cache folder of the scenario index')
+    parser.add_argument('--rebuild_index', help="ignore the cached scenario index", action="store_true")
+    parser.add_argument('--frame_store', type=str, default='jpg', choices=['jpg', 'packed'], help='read frames from jpg files or from the .npy packs of datasets/frame_pack.py')
+    parser.add_argument('--uint8_clip', help="return uint8 [3, T, H, W] clips and normalise them on the device", action="store_true")
+    parser.add_argument('--obj_mask_store', type=str, default='npy', choices=['npy', 'packed'], help='read object masks from per-frame npy files or from the packs of datasets/obj_mask_store.py')
+    parser.add_argument('--windows_per_scenario', type=int, default=1, help='train on k windows of each scenario per epoch, decoded once per worker (see datasets/window_sampler.py)')
+    parser.add_argument('--frame_cache_mb', type=int, default=0, help='share decoded frames across DataLoader workers in a shared-memory LRU of this many MB per dataset (0: off)')
+    parser.add_argument('--shards', type=str, default='', help='train from the tar shards of scripts/export_shards.py in this folder instead of the frame files')
+    parser.add_argument('--shuffle_buffer', type=int, default=16, help='scenarios held in memory by each shard reader for shuffling')
+    parser.add_argument('--road_videos', type=str, default='', help='ROAD: read the windows from the source videos {id}.mp4 in this folder instead of rgb-images (see datasets/road_video.py)')
+    parser.add_argument('--jpeg_draft', type=int, default=0, help='decode JPEGs that are resized on the fly at 1/2-1/8 scale, down to this many times the output size (0: full decode, see datasets/jpeg_draft.py)')
+    parser.add_argument('--group_shuffle', type=int, default=0, help='shuffle map/basic-scenario groups and mix them in blocks of this many samples, so reads stay in few directory trees (0: plain shuffle)')
+    parser.add_argument('--readahead', type=int, default=0, help='warm the page cache for the frames of the next N samples of the sampler order (0: off)')
+    parser.add_argument('--readahead_mode', type=str, default='fadvise', choices=['fadvise', 'read'], help='posix_fadvise(WILLNEED) or plain reads (network filesystems)')
+    parser.add_argument('--prefetch_device', help="copy the next batch to the device while the current one computes and report the time spent waiting for data", action="store_true")
+    parser.add_argument('--feature_cache', help="action_slot (x3d/i3d): run the frozen backbone blocks once per train window, cache their fp16 activations in index_dir and train the tail from them", action="store_true")
+    parser.add_argument('--frame_feature_cache_mb', type=int, default=0, help="r50/inception: cache the per-frame output of the frozen backbone blocks, LRU of this many MB (0: off)")
+    parser.add_argument('--frame_feature_dir', type=str, default='', help="also keep the per-frame backbone features on disk here")
+    parser.add_argument('--slot_chunk', type=int, default=0, help="slot attention over the tokens this many at a time, without keeping the full attention intermediates for backward (0: exact unchunked)")
 
     
     # model
@@ -27,6 +27,8 @@ torch.backends.cudnn.benchmark = True
 torch.cuda.empty_cache()
 
 from datasets.nuscenes import NUSCENES
+from datasets.clip_transport import clip_collate, clip_stats, normalize_clip
+from datasets.device_prefetch import DevicePrefetcher
 from model import generate_model
 from loss import ActionSlotLoss
 from utils import AverageMeter
@@ -82,6 +84,7 @@ class Engine(object):
         else:
             attention_res = None
         self.criterion = ActionSlotLoss(args, num_actor_class, attention_res).to(self.args.device)
+        self.clip_stats = clip_stats(args.backbone)
 
         self.cur_epoch = 0
         self.train_loss = []
@@ -120,9 +123,13 @@ class Engine(object):
                 boxes = torch.from_numpy(box_in).to(self.args.device, dtype=torch.float32)
             else:
                 boxes = box_in.to(self.args.device, dtype=torch.float32)
-        inputs = []
-        for i in range(seq_len):
-            inputs.append(video_in[i].to(self.args.device, dtype=torch.float32))
+        if isinstance(video_in, torch.Tensor):
+            # --uint8_clip: [B, 3, T, H, W] moved above in one copy, normalised here
+            inputs = normalize_clip(video_in, *self.clip_stats)
+        else:
+            inputs = []
+            for i in range(seq_len):
+                inputs.append(video_in[i].to(self.args.device, dtype=torch.float32))
 
         # --------------------------------------------
         attn = None
@@ -496,8 +503,12 @@ if __name__ == '__main__':
     print('ego_stat')
     print(label_stat[6])
         
-    dataloader_train = DataLoader(train_set, batch_size=args.batch_size, shuffle=True, num_workers=args.num_workers, pin_memory=True, drop_last=True)
-    dataloader_val = DataLoader(val_set, batch_size=1, shuffle=False, num_workers=args.num_workers, pin_memory=True, drop_last=True)
+    dataloader_train = DataLoader(train_set, batch_size=args.batch_size, shuffle=True, num_workers=args.num_workers, pin_memory=True, drop_last=True, collate_fn=clip_collate)
+    dataloader_val = DataLoader(val_set, batch_size=1, shuffle=False, num_workers=args.num_workers, pin_memory=True, drop_last=True, collate_fn=clip_collate)
+    if args.prefetch_device:
+        # batch N+1 moves to the device while batch N computes, see datasets/device_prefetch.py
+        dataloader_train = DevicePrefetcher(dataloader_train, args.device)
+        dataloader_val = DevicePrefetcher(dataloader_val, args.device)
     # Model
     model = generate_model(args, num_ego_class, num_actor_class).cuda()
 
@@ -535,8 +546,12 @@ if __name__ == '__main__':
         for epoch in range(trainer.cur_epoch, args.epochs): 
             
             trainer.train()
+            if args.prefetch_device:
+                print('train data wait: ' + dataloader_train.report())
             if (epoch % args.val_every == 0 or epoch == args.epochs-1): 
                     is_best, res = trainer.validate(dataloader_val)
+                    if args.frame_cache_mb > 0:
+                        print('val frame cache: ' + val_set.frame_cache.report())
                     # trainer.validate(dataloader_val_train, None)
                     trainer.save(is_best)
                     result_list.append(res)
@@ -21,6 +21,11 @@ sys.path.append('../models')
 
 
 import oats
+from clip_transport import clip_collate, clip_stats, normalize_clip
+from window_sampler import make_train_sampler
+from shards import ShardStream
+from device_prefetch import DevicePrefetcher
+from frame_features import make_frame_feature_cache
 
 from sklearn.metrics import average_precision_score, precision_score, recall_score, accuracy_score
 
@@ -65,6 +70,12 @@ def lambda_lr(epoch):
         lr = math.pow(0.7,int(epoch/3))
     return lr
 
+def frame_kwargs(data):
+	# --frame_feature_cache_mb: keys of the frames, see models/frame_features.py
+	if 'frame_keys' in data:
+		return {'frame_keys': data['frame_keys']}
+	return {}
+
 def set_lr(model):
 	params = list(filter(lambda kv: kv[0].startswith("head"), model.named_parameters()))
 	base_params = list(filter(lambda kv: not kv[0].startswith("head") , model.named_parameters()))
@@ -146,8 +157,11 @@ class Engine(object):
 			inputs = []
 			bg_seg = []
 			obj_mask_list = []
-			for i in range(seq_len):
-				inputs.append(video_in[i].to(args.device, dtype=torch.float32))
+			if isinstance(video_in, torch.Tensor):
+				inputs = normalize_clip(video_in, *oats_clip_stats, device=args.device)
+			else:
+				for i in range(seq_len):
+					inputs.append(video_in[i].to(args.device, dtype=torch.float32))
     
 			if args.box:
 				if isinstance(box_in,np.ndarray):
@@ -162,7 +176,7 @@ class Engine(object):
 					if i%args.mask_every_frame==0 or args.mask_every_frame==1:
 						obj_mask_list.append(obj_mask[i//args.mask_every_frame].to(args.device, dtype=torch.float32))
 
-			batch_size = inputs[0].shape[0]
+			batch_size = data['actor'].shape[0]
 			if ('slot' in args.model_name and not args.allocated_slot) or args.box:
 				actor = data['actor'].to(args.device)
 			else:
@@ -194,7 +208,7 @@ class Engine(object):
 
 			else:
 				if 'slot' in args.model_name or 'mvit' in args.model_name:
-					pred_actor, attn = model(inputs)
+					pred_actor, attn = model(inputs, **frame_kwargs(data))
 				else:
 					pred_actor = model(inputs)
 
@@ -487,8 +501,11 @@ class Engine(object):
 				inputs = []
 				bg_seg = []
 
-				for i in range(seq_len):
-					inputs.append(video_in[i].to(args.device, dtype=torch.float32))
+				if isinstance(video_in, torch.Tensor):
+					inputs = normalize_clip(video_in, *oats_clip_stats, device=args.device)
+				else:
+					for i in range(seq_len):
+						inputs.append(video_in[i].to(args.device, dtype=torch.float32))
      
 				if args.box:
 					if isinstance(box_in,np.ndarray):
@@ -499,7 +516,7 @@ class Engine(object):
 					for i in range(args.seq_len//args.mask_every_frame):
 						bg_seg.append(bg_seg_in[i].to(args.device, dtype=torch.float32))
 
-				batch_size = inputs[0].shape[0]
+				batch_size = data['actor'].shape[0]
 				if ('slot' in args.model_name and not args.allocated_slot) or args.box:
 					actor = data['actor'].to(args.device)
 				else:
@@ -521,7 +538,7 @@ class Engine(object):
 					if args.box:
 						_, pred_actor = model(inputs, boxes)
 					else:
-						pred_actor, attn = model(inputs)
+						pred_actor, attn = model(inputs, **frame_kwargs(data))
 				else:
 					pred_actor = model(inputs)
 
@@ -829,7 +846,11 @@ num_actor_class = 35
 
 
 # Data
-train_set = oats.OATS(args=args)
+if args.shards:
+	# sequential tar shards, see shards.py
+	train_set = ShardStream(args)
+else:
+	train_set = oats.OATS(args=args)
 val_set = oats.OATS(args=args, training=False)
 label_stat = []
 for i in range(6):
@@ -850,8 +871,20 @@ print(label_stat[4])
 print('p+_stat:')
 print(label_stat[5])
 	
-dataloader_train = DataLoader(train_set, batch_size=args.batch_size, shuffle=True, num_workers=args.num_workers, pin_memory=True, drop_last=True)
-dataloader_val = DataLoader(val_set, batch_size=1, shuffle=False, num_workers=args.num_workers, pin_memory=True, drop_last=True)
+# OATS normalises r50 clips with the ImageNet statistics as well (see oats.to_np)
+oats_clip_stats = clip_stats(args.backbone, ('inception', 'r50'))
+# k windows per scenario back to back, see window_sampler.py
+if args.shards:
+	dataloader_train = DataLoader(train_set, batch_size=args.batch_size, num_workers=args.num_workers, pin_memory=True, drop_last=True, collate_fn=clip_collate)
+else:
+	# k windows per scenario back to back, group shuffling and readahead, see window_sampler.py
+	train_sampler = make_train_sampler(train_set, args)
+	dataloader_train = DataLoader(train_set, batch_size=args.batch_size, shuffle=train_sampler is None, sampler=train_sampler, num_workers=args.num_workers, pin_memory=True, drop_last=True, collate_fn=clip_collate)
+dataloader_val = DataLoader(val_set, batch_size=1, shuffle=False, num_workers=args.num_workers, pin_memory=True, drop_last=True, collate_fn=clip_collate)
+if args.prefetch_device:
+	# batch N+1 moves to the device while batch N computes, see device_prefetch.py
+	dataloader_train = DevicePrefetcher(dataloader_train, args.device)
+	dataloader_val = DevicePrefetcher(dataloader_val, args.device)
 # Model
 model = generate_model(args, num_ego_class, num_actor_class).cuda()
 if args.pretrain != '' :
@@ -863,6 +896,12 @@ if args.pretrain != '' :
             if 'slot' in args.model_name:
                 model.slot_attention.extract_slots_for_oats()
 
+if args.frame_feature_cache_mb > 0:
+	if args.shards:
+		raise ValueError('--frame_feature_cache_mb needs the frame keys of the scenario loader, --shards does not ship them')
+	# the frozen 2D backbone blocks run once per frame, see models/frame_features.py
+	make_frame_feature_cache(model, args)
+
 if 'mvit' == args.model_name:
 	params = set_lr(model)#
 else:
@@ -880,9 +919,19 @@ trainer = Engine(args)
 result_list = []
 if not args.test:
 	for epoch in range(trainer.cur_epoch, args.epochs): 
+		if args.shards:
+			train_set.set_epoch(epoch)
 		trainer.train(model, optimizer, epoch, scheduler=scheduler)
+		if args.prefetch_device:
+			print('train data wait: ' + dataloader_train.report())
+		if args.frame_feature_cache_mb > 0:
+			print('frame features: ' + model.frame_features.report())
 		if (epoch % args.val_every == 0 or epoch == args.epochs-1): 
 				is_best, res = trainer.validate(model, dataloader_val, None)
+				if args.frame_cache_mb > 0:
+					print('val frame cache: ' + val_set.frame_cache.report())
+				if args.readahead > 0 and not args.shards:
+					print('readahead: ' + train_sampler.readahead.report())
 				# trainer.validate(dataloader_val_train, None)
 				trainer.save(is_best)
 				result_list.append(res)
@@ -21,6 +21,7 @@ sys.path.append('/media/hankung/ssd/retrieval/models')
 
 
 import road_dataset
+from device_prefetch import DevicePrefetcher
 
 
 from sklearn.metrics import average_precision_score, precision_score, f1_score, recall_score, accuracy_score, hamming_loss
@@ -887,6 +888,10 @@ train_set = road_dataset.ROAD(args=args, seq_len=seq_len, training=True, seg=arg
 val_set = road_dataset.ROAD(args=args, seq_len=seq_len, training=False, seg=args.seg, num_class=num_actor_class, model_name=args.id, num_slots=args.num_slots, box=args.box)	
 dataloader_train = DataLoader(train_set, batch_size=8, shuffle=True, num_workers=args.num_workers, pin_memory=True, drop_last=True)
 dataloader_val = DataLoader(val_set, batch_size=1, shuffle=False, num_workers=args.num_workers, pin_memory=True, drop_last=True)
+if args.prefetch_device:
+	# batch N+1 moves to the device while batch N computes, see device_prefetch.py
+	dataloader_train = DevicePrefetcher(dataloader_train, args.device)
+	dataloader_val = DevicePrefetcher(dataloader_val, args.device)
 # Model
 model = generate_model(args, args.id, num_ego_class, num_actor_class, args.seq_len).cuda()
 
@@ -919,8 +924,12 @@ if not args.test:
 	for epoch in range(100): 
 		
 		trainer.train(model, optimizer, epoch, model_name=args.id, scheduler=scheduler,ce_weight=args.ce_weight)
+		if args.prefetch_device:
+			print('train data wait: ' + dataloader_train.report())
 		if (epoch % args.val_every == 0 or epoch == args.epochs-1): 
 				is_best, res = trainer.validate(model, dataloader_val, None, model_name=args.id, ce_weight=args.ce_weight)
+				if args.frame_cache_mb > 0:
+					print('val frame cache: ' + val_set.frame_cache.report())
 				# trainer.validate(dataloader_val_train, None)
 				trainer.save(is_best)
 				result_list.append(res)
@@ -28,7 +28,13 @@ torch.backends.cudnn.benchmark = True
 torch.cuda.empty_cache()
 
 from datasets.taco import TACO
+from datasets.clip_transport import clip_collate, clip_stats, normalize_clip
+from datasets.window_sampler import make_train_sampler
+from datasets.shards import ShardStream
+from datasets.device_prefetch import DevicePrefetcher
+from datasets.feature_cache import feature_cache
 from model import generate_model
+from frame_features import make_frame_feature_cache
 from loss import ActionSlotLoss
 from utils import AverageMeter
 
@@ -87,6 +93,9 @@ class Engine(object):
         else:
             attention_res = None
         self.criterion = ActionSlotLoss(args, num_actor_class, attention_res).to(self.args.device)
+        self.clip_stats = clip_stats(args.backbone)
+        # --feature_cache: frozen backbone blocks the cached train features went through
+        self.feature_prefix = 0
 
         self.cur_epoch = 0
         self.train_loss = []
@@ -96,6 +105,8 @@ class Engine(object):
         self.reset_log()
         
     def reset_log(self):
+        # batches actually seen, len() of a ShardStream loader is an estimate
+        self.num_batches = 0
         self.loss_epoch = 0.
         self.ego_loss_epoch = 0.
         self.seg_loss_epoch = 0.
@@ -113,21 +124,33 @@ class Engine(object):
         self.bg_union = AverageMeter()
 
     def step(self,batch,mode):
+        self.num_batches += 1
 
         for k in batch:
             if isinstance(batch[k],torch.Tensor):
                 batch[k] = batch[k].to(self.args.device)
         
-        video_in = batch['videos']
+        if 'features' in batch:
+            video_in = batch['features'].float()
+            model_kwargs = {'prefix': self.feature_prefix}
+        else:
+            video_in = batch['videos']
+            model_kwargs = {}
+        if 'frame_keys' in batch:
+            model_kwargs['frame_keys'] = batch['frame_keys']
         if self.args.box:
             box_in = batch['box']
             if isinstance(box_in,np.ndarray):
                 boxes = torch.from_numpy(box_in).to(self.args.device, dtype=torch.float32)
             else:
                 boxes = box_in.to(self.args.device, dtype=torch.float32)
-        inputs = []
-        for i in range(seq_len):
-            inputs.append(video_in[i].to(self.args.device, dtype=torch.float32))
+        if isinstance(video_in, torch.Tensor):
+            # --uint8_clip: [B, 3, T, H, W] moved above in one copy, normalised here
+            inputs = normalize_clip(video_in, *self.clip_stats)
+        else:
+            inputs = []
+            for i in range(seq_len):
+                inputs.append(video_in[i].to(self.args.device, dtype=torch.float32))
 
         # --------------------------------------------
         attn = None
@@ -137,7 +160,7 @@ class Engine(object):
 
         else:
             if 'slot' in self.args.model_name or 'mvit' in self.args.model_name:
-                pred_ego, pred_actor, attn = self.model(inputs)
+                pred_ego, pred_actor, attn = self.model(inputs, **model_kwargs)
             else:
                 pred_ego, pred_actor = self.model(inputs)
 
@@ -239,7 +262,6 @@ class Engine(object):
 
         self.model = self.model.train()
         # Train loop
-        self.num_batches = len(dataloader_train)
         for data in tqdm(dataloader_train):
             self.step(data,'train')
         if scheduler is not None:
@@ -455,12 +477,26 @@ if __name__ == '__main__':
     num_actor_class = 64
 
     print('initialize train set')
-    train_set = TACO(args=args, split='train')
+    if args.shards:
+        # sequential tar shards, see datasets/shards.py
+        train_set = ShardStream(args)
+    else:
+        train_set = TACO(args=args, split='train')
     print('initialize val set')
     val_set = TACO(args=args, split='test')
     
-    dataloader_train = DataLoader(train_set, batch_size=args.batch_size, shuffle=True, num_workers=args.num_workers, pin_memory=True, drop_last=True)    
-    dataloader_val = DataLoader(val_set, batch_size=1, shuffle=False, num_workers=args.num_workers, pin_memory=True, drop_last=True)
+    if args.shards:
+        # shuffled by the stream itself
+        dataloader_train = DataLoader(train_set, batch_size=args.batch_size, num_workers=args.num_workers, pin_memory=True, drop_last=True, collate_fn=clip_collate)
+    else:
+        # k windows per scenario back to back, group shuffling and readahead, see datasets/window_sampler.py
+        train_sampler = make_train_sampler(train_set, args)
+        dataloader_train = DataLoader(train_set, batch_size=args.batch_size, shuffle=train_sampler is None, sampler=train_sampler, num_workers=args.num_workers, pin_memory=True, drop_last=True, collate_fn=clip_collate)    
+    dataloader_val = DataLoader(val_set, batch_size=1, shuffle=False, num_workers=args.num_workers, pin_memory=True, drop_last=True, collate_fn=clip_collate)
+    if args.prefetch_device:
+        # batch N+1 moves to the device while batch N computes, see datasets/device_prefetch.py
+        dataloader_train = DevicePrefetcher(dataloader_train, args.device)
+        dataloader_val = DevicePrefetcher(dataloader_val, args.device)
     # Model
     model = generate_model(args, num_ego_class, num_actor_class).cuda()
 
@@ -488,15 +524,35 @@ if __name__ == '__main__':
     #excluded_keyword = 'head'
     #filtered_weights = {k: v for k, v in filtered_weights.items() if excluded_keyword not in k}
     model.load_state_dict(filtered_weights, strict = False)
+    if args.feature_cache:
+        if args.shards:
+            raise ValueError('--feature_cache reads windows by (scenario, window), not from --shards')
+        # the frozen backbone prefix runs once per train window, see datasets/feature_cache.py
+        trainer.feature_prefix = feature_cache(model, train_set, args, 'train').num_blocks
+    if args.frame_feature_cache_mb > 0:
+        if args.shards:
+            raise ValueError('--frame_feature_cache_mb needs the frame keys of the scenario loader, --shards does not ship them')
+        # the frozen 2D backbone blocks run once per frame, see models/frame_features.py
+        make_frame_feature_cache(model, args)
     # for name, param in model.named_parameters():
     #     if name in filtered_weights:
     #         param.requires_grad = False
 
     result_list = []
     for epoch in range(trainer.cur_epoch, args.epochs): 
+        if args.shards:
+            train_set.set_epoch(epoch)
         trainer.train()
+        if args.prefetch_device:
+            print('train data wait: ' + dataloader_train.report())
+        if args.frame_feature_cache_mb > 0:
+            print('frame features: ' + model.frame_features.report())
         if (epoch % args.val_every == 0 or epoch == args.epochs-1): 
                 is_best, res = trainer.validate(dataloader_val)
+                if args.frame_cache_mb > 0:
+                    print('val frame cache: ' + val_set.frame_cache.report())
+                if args.readahead > 0 and not args.shards:
+                    print('readahead: ' + train_sampler.readahead.report())
                 # trainer.validate(dataloader_val_train, None)
                 trainer.save(is_best)
                 result_list.append(res)